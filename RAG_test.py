@@ -1,11 +1,15 @@
+import os
 from random import choices
+from dotenv import load_dotenv
 
-API_KEY_Qwen3_MAX = "sk-69122c7a6960491685c6edc87c028dfa"
+load_dotenv()
+API_KEY_Qwen3_MAX = os.getenv("DASHSCOPE_API_KEY")
 
 from openai import OpenAI
 import faiss
 import numpy as np
 import json
+from embedding_backend import create_embeddings
 # ===============================
 # 1. 初始化 OpenAI 客户端
 # ===============================
@@ -24,12 +28,16 @@ documents = [
 # ===============================
 # 3. 文本 → 向量（Embedding）
 # ===============================
+# 嵌入后端由 EMBEDDING_BACKEND 选择（dashscope / local），local 无需网络
+embeddings = create_embeddings()
+
+
 def embed(texts):
-    response = client.embeddings.create(
-        model="text-embedding-v4",
-        input=texts
-    )
-    return [np.array(item.embedding, dtype="float32") for item in response.data]
+    return [np.array(vector, dtype="float32") for vector in embeddings.embed_documents(texts)]
+
+
+def embed_query(query):
+    return np.array(embeddings.embed_query(query), dtype="float32")
 
 
 doc_vectors = embed(documents)
@@ -46,7 +54,7 @@ index.add(np.array(doc_vectors))  # 写入向量
 # 5. 检索函数
 # ===============================
 def search(query, top_k=2):
-    query_vec = np.array(embed([query])[0]).reshape(1, -1)
+    query_vec = embed_query(query).reshape(1, -1)
     distances, indices = index.search(query_vec, top_k)
     return [documents[i] for i in indices[0]]
 
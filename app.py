@@ -2,50 +2,37 @@ from flask import Flask, render_template, request, redirect, url_for, jsonify, s
 import os
 from dotenv import load_dotenv
 from deepseek_api import call_deepseek_api, generate_design_stream
-from visualize import generate_visualizations
+from visualize import chart_options, render_charts, layout_layers
+from render_cache import render_cache, is_valid_name
 from utils import extract_json_from_text
+from prompts import build_design_prompt, DESIGN_PROMPT_VERSION
+from design_space import (rank_stacks, suggestion_message, get_table, design_space_version,
+                          DESIGN_SPACE_ENABLED, DESIGN_SPACE_TOP_K)
+from prompt_cache_stats import prompt_cache_stats
+from result_store import create_result_store
+from design_cache import design_cache, make_cache_key
+from event_channel import channels, format_sse
+from design_batch import (expand_batch, group_duplicates, run_batch, batch_bucket,
+                          BatchRequestError, DESIGN_BATCH_CONCURRENCY)
+import static_assets
+from job_engine import JobEngine, JobQueueFullError, JOB_HEARTBEAT_SECONDS, DONE, FAILED, CANCELLED, FINISHED_STATES
 import json
 import time
-import threading
 import uuid
-from datetime import datetime, timedelta
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-secret-key')
 
-# 全局字典存储设计结果（用于解决Generator中无法使用session的问题）
-# 结构: {task_id: {'data': result_data, 'created_at': datetime}}
-design_results = {}
-
-def cleanup_old_results():
-    """定期清理过期的设计结果（保留24小时）"""
-    while True:
-        time.sleep(3600)  # 每小时检查一次
-        now = datetime.now()
-        expired_keys = []
-        for task_id, info in design_results.items():
-            if now - info['created_at'] > timedelta(hours=24):
-                expired_keys.append(task_id)
-        
-        for key in expired_keys:
-            # 清理关联的图片文件
-            try:
-                if key in design_results:
-                    result_data = design_results[key].get('data', {})
-                    images = result_data.get('images', {})
-                    for img_path in images.values():
-                        if img_path and os.path.exists(img_path):
-                            os.remove(img_path)
-            except Exception as e:
-                print(f"Error cleaning up files for task {key}: {e}")
-                
-            del design_results[key]
-
-# 启动清理线程
-cleanup_thread = threading.Thread(target=cleanup_old_results, daemon=True)
-cleanup_thread.start()
+# 静态资源指纹与预压缩：模板通过 asset_url() 引用 /assets/ 下带指纹的文件，
+# HTML / JSON 响应按 Accept-Encoding 即时压缩（SSE 等流式响应不压缩）
+static_assets.init_app(app)
+
+# 设计结果存储（用于解决Generator中无法使用session的问题）
+# 默认使用 SQLite 共享存储，保证多个 gunicorn worker 都能读到同一个任务的结果
+# 过期清理在写入时顺带触发，gunicorn 下的后台清理线程由 post_fork 钩子启动
+result_store = create_result_store()
 
 @app.route('/')
 def index():
@@ -66,186 +53,364 @@ def thinking():
         'thickness_max': request.form.get('thickness_max'),
         'target_application': request.form.get('target_application'),
         'additional_requirements': request.form.get('additional_requirements', ''),
-        'deep_thinking': request.form.get('deep_thinking', 'yes')
+        'deep_thinking': request.form.get('deep_thinking', 'yes'),
+        'rag_mode': request.form.get('rag_mode', '')
     }
     session['task_id'] = task_id
     
-    return render_template('thinking.html', active_tab='thinking', **session['design_params'])
-
-@app.route('/api/design', methods=['POST'])
-def api_design():
-    """异步API端点，执行实际的设计工作"""
+    # 提交后台设计任务，进度页面只负责订阅任务事件
+    # 队列已满时不在这里报错，进度通道会再次提交并把错误推送给页面
     try:
-        # 从session获取参数和task_id
-        params = session.get('design_params', {})
-        task_id = session.get('task_id')
-        
-        material_type = params.get('material_type')
-        bandgap_min = params.get('bandgap_min')
-        bandgap_max = params.get('bandgap_max')
-        thickness_min = params.get('thickness_min')
-        thickness_max = params.get('thickness_max')
-        target_application = params.get('target_application')
-        additional_requirements = params.get('additional_requirements', '')
-        deep_thinking = params.get('deep_thinking', 'yes')
+        job_engine.submit(task_id, session['design_params'])
+    except JobQueueFullError:
+        pass
+    
+    return render_template('thinking.html', active_tab='thinking', task_id=task_id, **session['design_params'])
+
+def _model_for(params):
+    return "deepseek-reasoner" if params.get('deep_thinking', 'yes') == 'yes' else "deepseek-chat"
+
+def design_progress(task_id, params, throttle=None, cancelled=None):
+    """
+    执行一次完整的设计流程，逐条生成进度消息（JSON 行）
+
+    运行在后台线程中，与 HTTP 连接的生命周期无关；完成后结果写入 result_store
+    throttle 在实际调用模型之前执行（命中设计缓存时不执行），批量设计用于限流；
+    cancelled 由任务引擎传入，任务取消后文献检索与模型调用尽快停止
+    """
+    material_type = params.get('material_type')
+    bandgap_min = params.get('bandgap_min')
+    bandgap_max = params.get('bandgap_max')
+    thickness_min = params.get('thickness_min')
+    thickness_max = params.get('thickness_max')
+    target_application = params.get('target_application')
+    additional_requirements = params.get('additional_requirements', '')
+    rag_mode = params.get('rag_mode') or None
+    
+    yield json.dumps({'step': 1, 'message': '接收设计参数', 'progress': 10}) + '\n'
+    
+    yield json.dumps({'step': 2, 'message': '构建提示词', 'progress': 20}) + '\n'
+    
+    # 规则预筛候选结构（毫秒级），先推送给页面，再作为种子写入提示词
+    candidates = rank_stacks(params) if DESIGN_SPACE_ENABLED else None
+    if candidates is not None:
+        yield json.dumps({'step': 2, 'message': suggestion_message(candidates), 'progress': 22, 'log': True,
+                          'candidates': candidates}, ensure_ascii=False) + '\n'
+    
+    # 构建提示词
+    prompt = build_design_prompt(params, candidates)
+    
+    # 确定模型
+    model_type = _model_for(params)
+    
+    def produce():
+        if throttle is not None:
+            throttle()
+        return generate_design_stream(prompt, model_type, rag_mode=rag_mode, cancelled=cancelled)
+    
+    # 调用封装好的流式生成器，相同参数命中缓存时直接回放历史结果
+    # 注意：这里是一个生成器调用另一个生成器，我们需要遍历它
+    if design_cache is not None:
+        cache_key = make_cache_key(params, model_type, DESIGN_PROMPT_VERSION, design_space_version())
+        design_stream = design_cache.stream(cache_key, produce)
+    else:
+        design_stream = produce()
+    
+    for chunk_str in design_stream:
+        chunk_data = json.loads(chunk_str)
         
-        # 返回进度更新
-        def generate_progress():
-            yield json.dumps({'step': 1, 'message': '接收设计参数', 'progress': 10}) + '\n'
-            time.sleep(0.3)
+        # 如果是最终结果类型
+        if chunk_data.get('type') == 'result':
+            design_data = chunk_data['design_data']
             
-            yield json.dumps({'step': 2, 'message': '构建提示词', 'progress': 20}) + '\n'
-            time.sleep(0.5)
+            yield json.dumps({'step': 6, 'message': '生成可视化', 'progress': 90}) + '\n'
             
-            # 构建提示词
-            prompt = f"""请设计一个叠层光电探测器，参数如下：
-材料类型: {material_type}
-禁带宽度范围: {bandgap_min}-{bandgap_max} eV
-厚度范围: {thickness_min}-{thickness_max} nm
-目标应用: {target_application}
-额外要求: {additional_requirements}
-
-请务必包含完整的层叠结构，必须明确包含以下功能层：
-1. 顶电极 (Top Electrode)
-2. 电子传输层 (Electron Transport Layer, ETL)
-3. 光吸收层 (Absorber Layer) - **特别要求**：光吸收层尽量少使用单一均质材料,或者使用层数少于2层的复合结构。
-4. 空穴传输层 (Hole Transport Layer, HTL)
-5. 底电极 (Bottom Electrode)
-以及其他必要的缓冲层或接触层。
-
-**重要提示**：
-- 请只返回实际的功能薄膜层（电极、传输层、吸收层等）。
-- **严禁**在 `layers` 列表中包含衬底（Substrate），如玻璃（Glass）、硅片（Silicon Wafer）、蓝宝石等。衬底应默认为支撑结构，不参与层叠结构的定义。
-
-请严格按照以下JSON格式返回设计结果（注意：thickness和bandgap必须是纯数字，不要带单位）：
-{{
-    "layers": [
-        {{
-            "name": "层名称",
-            "material": "材料名称",
-            "thickness": 100,
-            "bandgap": 1.5,
-            "function": "功能描述",
-            "fabrication_process": "制备工艺",
-            "alternative_materials": [
-                {{"material": "备选材料1", "bandgap": 1.4, "pros": "优点描述", "cons": "缺点描述"}},
-                {{"material": "备选材料2", "bandgap": 1.6, "pros": "优点描述", "cons": "缺点描述"}}
-            ]
-        }}
-    ],
-    "performance": {{
-        "wavelength_range": [400, 1000],
-        "responsivity_data": [[400, 0.5], [600, 0.8]],
-        "quantum_efficiency": 85,
-        "quantum_efficiency_type": "EQE",
-        "dark_current": 1e-9
-    }},
-    "optimization_suggestions": ["建议1", "建议2"],
-    "explanation": "设计说明"
-}}
-
-**关键要求**：
-1. 所有数值字段(thickness, bandgap等)必须是数字，不要加单位或文字说明
-2. alternative_materials数组中每个对象必须包含: material(字符串), bandgap(数字), pros(字符串), cons(字符串)
-3. 每层提供2-3个备选材料
-4. 不要在说明中包含参考文献标记"""
+            # 图表不再渲染为文件：结果页通过 /api/charts/<task_id> 获取 ECharts 配置后在浏览器端绘制
+            # 赋予每一层视觉属性（3D 视图中的高度与 Y 坐标）
+            layout_layers(design_data['layers'])
             
-            # 确定模型
-            model_type = "deepseek-reasoner" if deep_thinking == 'yes' else "deepseek-chat"
+            # 保存结果
+            result_data = {
+                'design_data': design_data,
+                # 本次请求的 token 用量（含上下文缓存命中数），命中设计缓存时为原请求的用量
+                'usage': chunk_data.get('usage'),
+                'user_input': {
+                    'material_type': material_type,
+                    'bandgap_range': f"{bandgap_min}-{bandgap_max} eV",
+                    'thickness_range': f"{thickness_min}-{thickness_max} nm",
+                    'target_application': target_application,
+                    'additional_requirements': additional_requirements
+                }
+            }
             
-            # 调用封装好的流式生成器
-            # 注意：这里是一个生成器调用另一个生成器，我们需要遍历它
-            for chunk_str in generate_design_stream(prompt, model_type):
-                chunk_data = json.loads(chunk_str)
-                
-                # 如果是最终结果类型
-                if chunk_data.get('type') == 'result':
-                    design_data = chunk_data['design_data']
-                    
-                    yield json.dumps({'step': 6, 'message': '生成可视化', 'progress': 90}) + '\n'
-                    
-                    # 生成可视化
-                    image_paths = generate_visualizations(design_data)
-                    
-                    # 赋予每一层视觉属性
-                    # 在3D wrapper中居中
-                    # 添加层间距
-                    GAP = 10
-                    NORMAL_HEIGHT = 40
-                    ABSORBER_HEIGHT = 20
-                    
-                    # 计算总视觉高度
-                    total_visual_height = 0
-                    for layer in design_data['layers']:
-                        is_absorber = '吸收' in layer.get('name', '') or 'Absorber' in layer.get('name', '')
-                        h = ABSORBER_HEIGHT if is_absorber else NORMAL_HEIGHT
-                        layer['visual_height'] = h
-                        total_visual_height += h
-                    
-                    if design_data['layers']:
-                        total_visual_height += (len(design_data['layers']) - 1) * GAP
-                    
-                    start_y = (400 - total_visual_height) / 2
-                    
-                    current_y = start_y
-                    for i, layer in enumerate(design_data['layers']):
-                        # 计算每一层的Y坐标
-                        layer['y_position'] = current_y
-                        current_y += layer['visual_height'] + GAP
-                    
-                    # 保存结果
-                    result_data = {
-                        'design_data': design_data,
-                        'images': image_paths,
-                        'user_input': {
-                            'material_type': material_type,
-                            'bandgap_range': f"{bandgap_min}-{bandgap_max} eV",
-                            'thickness_range': f"{thickness_min}-{thickness_max} nm",
-                            'target_application': target_application,
-                            'additional_requirements': additional_requirements
-                        }
-                    }
-                    
-                    if task_id:
-                        design_results[task_id] = {
-                            'data': result_data,
-                            'created_at': datetime.now()
-                        }
-                    
-                    yield json.dumps({
-                        'step': 7,
-                        'message': '完成',
-                        'progress': 100,
-                        'redirect': '/result'
-                    }) + '\n'
-                    return
-                
-                # 普通进度/日志消息直接透传
-                yield chunk_str
-
-        response = app.response_class(generate_progress(), mimetype='application/json')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        return response
+            if task_id:
+                result_store.put(task_id, result_data)
+            
+            yield json.dumps({
+                'step': 7,
+                'message': '完成',
+                'progress': 100,
+                'redirect': '/result'
+            }) + '\n'
+            return
         
-    except Exception as e:
-        return jsonify({
-            'step': -1,
-            'error': f'系统错误: {str(e)}',
-            'progress': 0
-        })
+        # 普通进度/日志消息直接透传
+        yield chunk_str
+
+# 后台设计任务引擎：有界线程池执行 design_progress，结果写入 result_store
+job_engine = JobEngine(design_progress)
+
+def _final_event(status):
+    """根据任务的最终状态构造结束消息"""
+    if status['state'] == DONE:
+        return json.dumps({'step': 7, 'message': '完成', 'progress': 100, 'redirect': '/result'})
+    if status['state'] == CANCELLED:
+        return json.dumps({'step': -1, 'error': '设计任务已取消', 'progress': 0})
+    return json.dumps({'step': -1, 'error': status.get('error') or '设计失败', 'progress': 0})
+
+def _subscribe_job(task_id, params, last_event_id=0):
+    """
+    订阅设计任务的进度事件
+
+    事件同时写入共享的事件日志，任务由哪个 worker 执行都可以订阅和补发；
+    执行任务的进程退出导致事件流没有正常结束时，按任务状态补发最终消息。
+    未启用事件日志（EVENT_LOG_PATH 为空）且任务由其他 worker 执行时，轮询共享的任务状态，结束后补发最终消息
+
+    Yields:
+        tuple | None: (event_id, data)，None 表示心跳
+    """
+    if not channels.has_stream(task_id):
+        status = job_engine.status(task_id)
+        if status is None:
+            # 没有任务记录（例如结果来自旧版本或任务记录已过期）
+            if result_store.get(task_id):
+                yield None, _final_event({'state': DONE})
+                return
+            job_engine.submit(task_id, params)
+        else:
+            while status['state'] not in FINISHED_STATES:
+                yield None
+                time.sleep(JOB_HEARTBEAT_SECONDS)
+                status = job_engine.status(task_id)
+            yield None, _final_event(status)
+            return
+    
+    def alive():
+        status = job_engine.status(task_id)
+        return status is not None and status['state'] not in FINISHED_STATES
+    
+    for item in channels.subscribe(task_id, last_event_id, alive=alive):
+        yield item
+    if not channels.is_closed(task_id):
+        # 生产者没有正常结束事件流：任务已被其他 worker 取消，或执行任务的进程已退出
+        yield None, _final_event(job_engine.status(task_id) or {'state': FAILED})
+
+@app.route('/api/design/events')
+def api_design_events():
+    """
+    SSE 进度通道
+
+    每条事件带 id，EventSource 断线重连时会自动携带 Last-Event-ID，
+    服务端立即补发缺失的事件：任务由本进程执行时从环形缓冲区补发，
+    重连落到其他 worker 时从共享的事件日志补发（EVENT_LOG_PATH 为空时只能等待最终消息）
+    """
+    task_id = session.get('task_id')
+    params = session.get('design_params')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', '0')
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    
+    def generate_events():
+        yield 'retry: 3000\n\n'
+        
+        if not task_id or params is None:
+            yield format_sse(json.dumps({'step': -1, 'error': '设计任务不存在，请重新提交', 'progress': 0}))
+            return
+        
+        try:
+            for item in _subscribe_job(task_id, params, last_event_id):
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                event_id, data = item
+                yield format_sse(data, event_id)
+        except JobQueueFullError as e:
+            yield format_sse(json.dumps({'step': -1, 'error': str(e), 'progress': 0}))
+    
+    response = app.response_class(generate_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/design', methods=['POST'])
+def api_design():
+    """NDJSON 进度接口（兼容旧客户端），与 SSE 通道订阅同一个后台任务"""
+    # 从session获取参数和task_id
+    params = session.get('design_params')
+    task_id = session.get('task_id')
+    if not task_id or params is None:
+        return jsonify({'step': -1, 'error': '设计任务不存在，请重新提交', 'progress': 0})
+    
+    # 响应体是惰性生成器，提交任务时的异常只能在生成器内部处理
+    def generate_progress():
+        try:
+            for item in _subscribe_job(task_id, params):
+                if item is not None:
+                    yield item[1] + '\n'
+        except JobQueueFullError as e:
+            yield json.dumps({'step': -1, 'error': str(e), 'progress': 0}) + '\n'
+
+    response = app.response_class(generate_progress(), mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _batch_design(params):
+    """
+    批量设计中的一组参数：执行完整的设计流程，结果与单次设计一样写入 result_store
+
+    Returns:
+        dict: 成功时 {'task_id', 'design_data', 'usage', 'cached'}，失败时 {'error'}
+    """
+    task_id = str(uuid.uuid4())
+    error = None
+    requested = []  # 命中设计缓存时不会调用模型，也不占用限流配额
+    
+    def throttle():
+        requested.append(True)
+        batch_bucket.acquire()
+    
+    for line in design_progress(task_id, params, throttle=throttle):
+        event = json.loads(line)
+        if event.get('step') == -1:
+            error = event.get('error') or '设计失败'
+    result_data = result_store.get(task_id)
+    if not result_data:
+        return {'error': error or '设计失败'}
+    return {
+        'task_id': task_id,
+        'design_data': result_data['design_data'],
+        'usage': result_data.get('usage'),
+        'cached': not requested,
+    }
+
+@app.route('/api/design/batch', methods=['POST'])
+def api_design_batch():
+    """
+    批量设计（参数扫描），NDJSON 流式返回
+
+    请求体：{"base": {公共参数}, "grid": {"bandgap": [[1.2, 1.5], ...], "thickness": [[300, 500], ...]},
+             "items": [{参数组}, ...], "concurrency": 4}
+    相同的参数组只执行一次；首行为批次概况，之后每完成一组返回一行，末行为汇总
+    """
+    payload = request.get_json(silent=True)
+    try:
+        param_sets = expand_batch(payload)
+        concurrency = int(payload.get('concurrency') or DESIGN_BATCH_CONCURRENCY)
+    except (BatchRequestError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    concurrency = max(1, min(concurrency, DESIGN_BATCH_CONCURRENCY))
+    groups = group_duplicates(param_sets, _model_for, DESIGN_PROMPT_VERSION, design_space_version())
+
+    def generate_results():
+        started = time.time()
+        completed = failed = 0
+        yield json.dumps({'type': 'batch', 'total': len(param_sets), 'unique': len(groups),
+                          'duplicates': len(param_sets) - len(groups), 'concurrency': concurrency},
+                         ensure_ascii=False) + '\n'
+        for key, params, indices, result, elapsed in run_batch(groups, _batch_design, concurrency):
+            if 'error' in result:
+                failed += 1
+                line = {'type': 'error', 'indices': indices, 'params': params, 'error': result['error']}
+            else:
+                completed += 1
+                line = {'type': 'design', 'indices': indices, 'params': params, **result}
+            line['elapsed'] = round(elapsed, 2)
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+        yield json.dumps({'type': 'done', 'completed': completed, 'failed': failed,
+                          'elapsed': round(time.time() - started, 2)}, ensure_ascii=False) + '\n'
+
+    response = app.response_class(generate_results(), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/design/candidates')
+def api_design_candidates():
+    """
+    规则预筛的候选叠层结构（不调用模型）
+
+    查询参数与设计表单相同（material_type、bandgap_min/max、thickness_min/max），可选 top_k
+    """
+    try:
+        top_k = max(1, min(int(request.args.get('top_k', DESIGN_SPACE_TOP_K)), 20))
+    except ValueError:
+        return jsonify({'error': 'top_k 必须是整数'}), 400
+    started = time.perf_counter()
+    candidates = rank_stacks(request.args, top_k=top_k)
+    return jsonify({
+        'candidates': candidates,
+        'evaluated': get_table().stack_count(),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@app.route('/api/jobs/<task_id>')
+def api_job_status(task_id):
+    """查询设计任务状态：queued / running / done / failed / cancelled（只能查询当前会话的任务）"""
+    status = job_engine.status(task_id) if task_id == session.get('task_id') else None
+    if status is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<task_id>/cancel', methods=['POST'])
+def api_job_cancel(task_id):
+    """取消尚未结束的设计任务（只能取消当前会话的任务）"""
+    if task_id != session.get('task_id'):
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({'task_id': task_id, 'cancelled': job_engine.cancel(task_id)})
+
+@app.route('/api/stats/prompt-cache')
+def api_prompt_cache_stats():
+    """DeepSeek 上下文缓存命中统计：按模型累计的请求数、token 用量与命中率"""
+    return jsonify(prompt_cache_stats.summary())
 
 @app.route('/result')
 def result():
     """显示设计结果"""
     task_id = session.get('task_id')
+    result_data = result_store.get(task_id) if task_id else None
     
-    if not task_id or task_id not in design_results:
+    if not result_data:
         return redirect(url_for('index'))
     
-    result_data = design_results[task_id]['data']
-    
-    return render_template('result.html', active_tab='result', **result_data)
+    return render_template('result.html', active_tab='result', task_id=task_id, **result_data)
+
+@app.route('/api/charts/<task_id>')
+def api_charts(task_id):
+    """
+    结果页图表（层叠结构图与光谱响应曲线）的地址
+
+    ECharts option 由 design_data 构建，按内容哈希保存在渲染缓存中，
+    相同输入只渲染一次；返回 {图表类型: /charts/<哈希>.json}
+    """
+    result_data = result_store.get(task_id)
+    if not result_data or not result_data.get('design_data'):
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    charts = render_charts(result_data['design_data'])
+    return jsonify({kind: url_for('chart_artifact', name=name) for kind, (name, _) in charts.items()})
+
+@app.route('/charts/<name>.json')
+def chart_artifact(name):
+    """按内容哈希读取渲染好的图表，内容永不变化，浏览器可永久缓存"""
+    data = render_cache.get(name) if is_valid_name(name) else None
+    if data is None:
+        return jsonify({'error': '图表不存在'}), 404
+    response = app.response_class(data, mimetype='application/json')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.set_etag(name)
+    return response.make_conditional(request)
 
 @app.route('/design', methods=['POST'])
 def design():
@@ -259,57 +424,11 @@ def design():
         target_application = request.form.get('target_application')
         additional_requirements = request.form.get('additional_requirements', '')
         
-        # 构建提示词
-        prompt = f"""请设计一个叠层光电探测器，参数如下：
-材料类型: {material_type}
-禁带宽度范围: {bandgap_min}-{bandgap_max} eV
-厚度范围: {thickness_min}-{thickness_max} nm
-目标应用: {target_application}
-额外要求: {additional_requirements}
-
-请务必包含完整的层叠结构，必须明确包含以下功能层：
-1. 顶电极 (Top Electrode)
-2. 电子传输层 (Electron Transport Layer, ETL)
-3. 光吸收层 (Absorber Layer) - **特别要求**：光吸收层严禁使用单一均质材料。请将其设计为复合结构（如量子阱结构、超晶格结构、异质结或梯度带隙结构），并在返回的layers列表中将其拆分为具体的子层（例如："吸收层(量子阱)"、"吸收层(量子垒)"等）。
-4. 空穴传输层 (Hole Transport Layer, HTL)
-5. 底电极 (Bottom Electrode)
-
-
-请严格按照以下JSON格式返回设计结果（注意：thickness和bandgap必须是纯数字，不要带单位）：
-{{
-    "layers": [
-        {{
-            "name": "层名称",
-            "material": "材料名称",
-            "thickness": 100,
-            "bandgap": 1.5,
-            "function": "功能描述",
-            "fabrication_process": "制备工艺",
-            "alternative_materials": [
-                {{"material": "备选材料1", "bandgap": 1.4, "pros": "优点描述", "cons": "缺点描述"}},
-                {{"material": "备选材料2", "bandgap": 1.6, "pros": "优点描述", "cons": "缺点描述"}}
-            ]
-        }}
-    ],
-    "performance": {{
-        "wavelength_range": [400, 1000],
-        "responsivity_data": [[400, 0.5], [600, 0.8]],
-        "quantum_efficiency": 85,
-        "quantum_efficiency_type": "EQE",
-        "dark_current": 1e-9
-    }},
-    "optimization_suggestions": ["建议1", "建议2"],
-    "explanation": "设计说明"
-}}
-
-**关键要求**：
-1. 所有数值字段(thickness, bandgap等)必须是数字，不要加单位或文字说明
-2. alternative_materials数组中每个对象必须包含: material(字符串), bandgap(数字), pros(字符串), cons(字符串)
-3. 每层提供2-3个备选材料
-4. 不要在说明中包含参考文献标记"""
+        # 构建提示词（与渐进式设计共用 prompts.py 中的模板）
+        prompt = build_design_prompt(request.form, rank_stacks(request.form) if DESIGN_SPACE_ENABLED else None)
         
         # 调用DeepSeek API
-        api_response = call_deepseek_api(prompt)
+        api_response = call_deepseek_api(prompt, rag_mode=request.form.get('rag_mode') or None)
         
         if api_response['status'] == 'error':
             return render_template('result.html', 
@@ -337,14 +456,10 @@ def design():
                                      'additional_requirements': additional_requirements
                                  })
         
-        # 生成可视化
-        temp_task_id = str(uuid.uuid4())
-        image_paths = generate_visualizations(design_data, temp_task_id)
-        
-        # 渲染结果页面
+        # 渲染结果页面（结果不进入存储，图表配置直接内联到页面中）
         return render_template('result.html',
                              design_data=design_data,
-                             images=image_paths,
+                             charts=chart_options(design_data),
                              user_input={
                                  'material_type': material_type,
                                  'bandgap_range': f"{bandgap_min}-{bandgap_max} eV",
@@ -365,4 +480,5 @@ def design():
                              })
 
 if __name__ == '__main__':
+    result_store.start_cleanup_thread()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,130 @@
+# 功能：ANN 索引基准测试
+# 在向量库（vector_db 的 vectors.f32）上构建各类索引，对比精确检索（Flat）的
+# recall@k、单条查询的 p50/p99 延迟、索引大小和构建耗时，用于选择索引类型和检索参数
+#
+# 查询向量：向量库中随机抽取的片段向量与另一随机片段按 0.7/0.3 混合，模拟“与某段文献相近”的查询；
+# 没有向量库时使用 --synthetic N 生成带聚类结构的合成向量
+#
+# 用法：python benchmarks/bench_ann_index.py [--index-dir vector_db] [--synthetic N]
+#           [--types flat,ivf,hnsw,ivfpq,opq] [--nprobe 8,16,32] [--ef 32,128,512] [--json OUT]
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import INDEX_TYPES, factory_string, build_index, set_search_params
+from vector_store import MmapVectorStore, store_exists
+
+
+def synthetic_vectors(count, dim, clusters=64, seed=0):
+    """带聚类结构的单位向量，比均匀随机向量更接近真实文本嵌入"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, count, seed=1):
+    rng = np.random.default_rng(seed)
+    a = np.asarray(vectors[np.sort(rng.choice(len(vectors), count))], dtype=np.float32)
+    b = np.asarray(vectors[np.sort(rng.choice(len(vectors), count))], dtype=np.float32)
+    return np.ascontiguousarray(0.7 * a + 0.3 * b)
+
+
+def measure(index, queries, k):
+    """逐条查询，返回 (结果行号, 每条查询耗时 ms 列表)"""
+    results = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, indices = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results[i] = indices[0]
+    return results, latencies
+
+
+def recall_at_k(results, truth):
+    hits = sum(len(set(r[r != -1]) & set(t)) for r, t in zip(results, truth))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ANN 索引基准测试')
+    parser.add_argument('--index-dir', default='vector_db')
+    parser.add_argument('--synthetic', type=int, default=0, help='使用 N 条合成向量代替向量库')
+    parser.add_argument('--dim', type=int, default=1024, help='合成向量维度')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--types', default=','.join(INDEX_TYPES))
+    parser.add_argument('--nlist', type=int, default=0, help='IVF 簇数，0 为自动')
+    parser.add_argument('--m', type=int, default=32, help='PQ 子空间数')
+    parser.add_argument('--nprobe', default='8,16,32')
+    parser.add_argument('--ef', default='32,128,512')
+    parser.add_argument('--json', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors, metric = synthetic_vectors(args.synthetic, args.dim), 'l2'
+        source = f'合成向量 {args.synthetic} 条'
+    elif store_exists(args.index_dir):
+        store = MmapVectorStore(args.index_dir)
+        vectors, metric = store.vectors, store.metric
+        source = f'{args.index_dir} 向量 {len(store)} 条'
+    else:
+        parser.error(f'{args.index_dir} 中没有 vector_store 格式的向量库，请先运行 python vector_store.py 或使用 --synthetic')
+
+    count, dim = vectors.shape
+    queries = make_queries(vectors, args.queries)
+    print(f'语料：{source}，维度 {dim}，查询 {len(queries)} 条，k={args.k}')
+
+    flat = build_index(vectors, 'Flat', metric=metric)
+    truth, _ = measure(flat, queries, args.k)
+
+    rows = []
+    for index_type in args.types.split(','):
+        description = factory_string(index_type, dim, count, nlist=args.nlist, pq_m=args.m)
+        start = time.perf_counter()
+        index = build_index(vectors, description, metric=metric)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+
+        if index_type in ('ivf', 'ivfpq', 'opq'):
+            settings = [('nprobe', int(v)) for v in args.nprobe.split(',')]
+        elif index_type == 'hnsw':
+            settings = [('efSearch', int(v)) for v in args.ef.split(',')]
+        else:
+            settings = [('', None)]
+
+        for name, value in settings:
+            if name == 'nprobe':
+                set_search_params(index, nprobe=value)
+            elif name == 'efSearch':
+                set_search_params(index, ef_search=value)
+            results, latencies = measure(index, queries, args.k)
+            row = {
+                'type': index_type,
+                'description': description,
+                'param': f'{name}={value}' if name else '-',
+                f'recall@{args.k}': recall_at_k(results, truth),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'size_mb': size_mb,
+                'build_s': build_seconds,
+            }
+            rows.append(row)
+            print(f"{index_type:6s} {row['param']:12s} recall@{args.k} {row[f'recall@{args.k}']:.3f}  "
+                  f"p50 {row['p50_ms']:.3f} ms  p99 {row['p99_ms']:.3f} ms  "
+                  f"大小 {size_mb:.1f} MB  构建 {build_seconds:.1f} s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'source': source, 'count': count, 'dim': dim, 'results': rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
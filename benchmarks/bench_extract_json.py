@@ -0,0 +1,161 @@
+# 功能：extract_json_from_text 基准测试
+# 对比旧实现（最多三次 json.loads + 正则）与单遍扫描修复实现的解析耗时和成功率
+#
+# 语料来源：
+#   1. benchmarks/corpus/*.txt：线上采集的模型原始输出
+#      （运行服务时设置 CAPTURE_MODEL_OUTPUT_DIR=benchmarks/corpus 即可自动采集）
+#   2. 按设计方案模板生成的合成样本，覆盖常见的模型输出缺陷
+#
+# 用法：python benchmarks/bench_extract_json.py [--corpus DIR] [--repeat N] [--json OUT]
+import os
+import re
+import sys
+import json
+import time
+import glob
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import extract_json_from_text
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def legacy_extract_json_from_text(text):
+    """旧版实现，作为对照基线"""
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    start_idx = text.find('{')
+    end_idx = text.rfind('}')
+    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+        try:
+            return json.loads(text[start_idx:end_idx + 1])
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def make_design(num_layers):
+    """构造与提示词模板一致的设计方案"""
+    layers = []
+    for i in range(num_layers):
+        layers.append({
+            'name': f'功能层{i + 1}',
+            'material': f'材料{i + 1}',
+            'thickness': 50 + i * 10,
+            'bandgap': round(1.2 + i * 0.1, 2),
+            'function': '负责载流子传输与界面钝化，抑制暗电流。' * 3,
+            'fabrication_process': '旋涂后 100°C 退火 10 分钟',
+            'alternative_materials': [
+                {'material': f'备选{i}-{j}', 'bandgap': 1.5, 'pros': '稳定性好', 'cons': '成本较高'}
+                for j in range(3)
+            ]
+        })
+    return {
+        'layers': layers,
+        'performance': {
+            'wavelength_range': [400, 1000],
+            'responsivity_data': [[w, round(0.2 + w / 2000, 3)] for w in range(400, 1001, 50)],
+            'quantum_efficiency': 85,
+            'quantum_efficiency_type': 'EQE',
+            'dark_current': 1e-9
+        },
+        'optimization_suggestions': ['建议一：优化界面', '建议二：调节厚度'],
+        'explanation': '本设计参考了文献中的界面工程方法。' * 20
+    }
+
+
+def synthetic_corpus():
+    """生成覆盖常见缺陷的合成样本 [(名称, 文本)]"""
+    samples = []
+    for num_layers in (5, 12, 30):
+        text = json.dumps(make_design(num_layers), ensure_ascii=False, indent=2)
+        samples.append((f'clean_{num_layers}', text))
+        samples.append((f'fenced_{num_layers}', f'以下是设计方案：\n```json\n{text}\n```\n如需调整请告知。'))
+        samples.append((f'prose_braces_{num_layers}',
+                        f'采用 {{ETL/吸收层/HTL}} 结构。\n{text}\n以上方案中 {{x}} 表示可替换材料。'))
+        samples.append((f'trailing_comma_{num_layers}', re.sub(r'(\]|\}|"|\d)\n(\s*)(\]|\})', r'\1,\n\2\3', text)))
+        samples.append((f'units_{num_layers}',
+                        re.sub(r'"thickness": (\d+)', r'"thickness": \1nm', text)
+                        .replace('"dark_current": 1e-09', '"dark_current": 1e-9 A')
+                        .replace('"quantum_efficiency": 85', '"quantum_efficiency": 85%')))
+        samples.append((f'fullwidth_{num_layers}', text.replace('",\n', '"，\n').replace('": ', '"： ', 3)))
+        samples.append((f'comments_{num_layers}',
+                        text.replace('"layers": [', '"layers": [ // 从顶到底\n', 1)
+                        .replace('"performance": {', '/* 性能预测 */ "performance": {', 1)))
+    return samples
+
+
+def load_corpus(corpus_dir):
+    samples = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            samples.append((os.path.basename(path), f.read()))
+    return samples
+
+
+def run(samples, func, repeat):
+    """返回 (总耗时秒, 成功数, 每个样本耗时列表)"""
+    per_sample = []
+    success = 0
+    for _, text in samples:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = func(text)
+        per_sample.append((time.perf_counter() - start) / repeat)
+        if isinstance(result, dict) and isinstance(result.get('layers'), list):
+            success += 1
+    return sum(per_sample), success, per_sample
+
+
+def main():
+    parser = argparse.ArgumentParser(description='extract_json_from_text 基准测试')
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help='采集的模型输出目录')
+    parser.add_argument('--repeat', type=int, default=20, help='每个样本重复解析次数')
+    parser.add_argument('--json', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    captured = load_corpus(args.corpus)
+    samples = captured + synthetic_corpus()
+    print(f"语料：采集样本 {len(captured)} 个，合成样本 {len(samples) - len(captured)} 个")
+
+    results = {}
+    for name, func in (('legacy', legacy_extract_json_from_text), ('single_pass', extract_json_from_text)):
+        total, success, per_sample = run(samples, func, args.repeat)
+        by_category = {}
+        for (sample_name, _), elapsed in zip(samples, per_sample):
+            by_category.setdefault(sample_name.rsplit('_', 1)[0], []).append(elapsed * 1000)
+        results[name] = {
+            'total_ms': total * 1000,
+            'mean_ms': total * 1000 / len(samples),
+            'success': success,
+            'success_rate': success / len(samples),
+            'by_category_ms': {k: sum(v) / len(v) for k, v in by_category.items()},
+        }
+        print(f"{name:12s} 平均耗时 {results[name]['mean_ms']:.3f} ms  "
+              f"成功 {success}/{len(samples)} ({results[name]['success_rate']:.0%})")
+        for category, mean_ms in results[name]['by_category_ms'].items():
+            print(f"    {category:16s} {mean_ms:.3f} ms")
+
+    failures = [name for name, text in samples if not extract_json_from_text(text)]
+    if failures:
+        print("单遍实现未能解析的样本：", ', '.join(failures))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+# 功能：热点路径微基准测试套件（带回归阈值）
+# 覆盖设计请求中的纯计算部分：
+#   extract_json    解析大段模型输出（干净 / 代码块 / 需要修复的样本，5-50 层）
+#   structure_plot  structure_chart 构建 5-50 层的层叠结构图 option，以及 /api/charts 的 chart_options
+#   performance_plot performance_chart 构建光谱响应曲线 option，以及 chart_options
+#   layer_layout    layout_layers（api_design 中的 3D 视图布局）
+#   prompt          设计提示词与 RAG 增强消息的构建
+#   design_space    候选叠层结构预筛（全部组合一次向量化打分）
+#   faiss_search    FAISS 精确检索（IndexFlatL2）与 vector_store 的 mmap 检索，多种语料规模
+# 每项取多轮测量的最小值（毫秒，越小越好），结果写入 JSON；与基线（benchmarks/baseline.json）
+# 对比，任一指标比基线慢超过容差即以非零状态退出，可直接用于 CI
+#
+# 共享机器上 CPU 整体快慢会随时间漂移，每项测量都与一个固定的校准负载交替执行，
+# 比较时默认使用 指标 / 校准耗时 的相对值（--absolute 改为直接比较毫秒数）；
+# 超出容差的测试组会复测（--retries），仍超出才判定为回归；
+# 基线仍与机器类型相关，更换测试机器或确认性能变化符合预期后用 --update-baseline 重新生成
+#
+# 用法：python benchmarks/run_benchmarks.py [--only extract_json,prompt] [--sizes 1000,10000,50000]
+#           [--output benchmarks/results.json] [--baseline benchmarks/baseline.json]
+#           [--tolerance 0.3] [--retries 1] [--absolute] [--update-baseline]
+import os
+import re
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from utils import extract_json_from_text
+from visualize import structure_chart, performance_chart, layout_layers, chart_options
+from prompts import build_design_prompt, build_design_messages, format_references
+from design_space import rank_stacks, get_table
+from vector_store import MmapVectorStore, VectorStoreWriter
+from bench_extract_json import make_design
+from bench_ann_index import synthetic_vectors, make_queries
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_TOLERANCE = 0.3
+LAYER_COUNTS = (5, 10, 20, 50)
+GROUPS = ('extract_json', 'structure_plot', 'performance_plot', 'layer_layout', 'prompt', 'design_space',
+          'faiss_search')
+
+
+_CALIBRATION_MATRIX = np.arange(64 * 64, dtype=np.float32).reshape(64, 64)
+
+
+def _calibration_workload():
+    """固定的混合负载：纯 Python 循环、字符串处理、JSON 编解码和一次小矩阵乘法"""
+    total = 0
+    for i in range(2000):
+        total += len(str(i * i))
+    json.loads(json.dumps({'layers': [{'name': f'层{i}', 'thickness': i} for i in range(50)]}, ensure_ascii=False))
+    return total + float((_CALIBRATION_MATRIX @ _CALIBRATION_MATRIX).sum())
+
+
+def _autorange(timer, min_round_seconds):
+    """按 timeit.autorange 的方式确定每轮调用次数，使一轮至少持续 min_round_seconds"""
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_round_seconds:
+            return number
+        number *= 2 if elapsed * 10 > min_round_seconds else 10
+
+
+_calibration_timer = timeit.Timer(_calibration_workload)
+_calibration_number = None
+
+
+def measure(func, rounds=7, min_round_seconds=0.05):
+    """
+    测量 func 单次调用的耗时（毫秒），同时测量校准负载
+
+    每轮先跑校准负载再跑 func，两者各取 rounds 轮中的最小值：其余轮次的额外耗时来自调度和
+    其他进程的干扰，而不是被测代码；校准负载与被测代码交替执行，能跟上机器整体快慢的漂移
+
+    Returns:
+        tuple: (func 耗时 ms, 校准负载耗时 ms)
+    """
+    global _calibration_number
+    if _calibration_number is None:
+        _calibration_number = _autorange(_calibration_timer, min_round_seconds)
+    timer = timeit.Timer(func)
+    number = _autorange(timer, min_round_seconds)
+    times, calibration = [], []
+    for _ in range(rounds):
+        calibration.append(_calibration_timer.timeit(_calibration_number) / _calibration_number)
+        times.append(timer.timeit(number) / number)
+    return min(times) * 1000, min(calibration) * 1000
+
+
+def bench_extract_json(rounds):
+    results = {}
+    for num_layers in LAYER_COUNTS:
+        text = json.dumps(make_design(num_layers), ensure_ascii=False, indent=2)
+        samples = {
+            'clean': text,
+            'fenced': f'以下是设计方案：\n```json\n{text}\n```\n如需调整请告知。',
+            # 尾随逗号 + 带单位的数值，走修复路径
+            'repair': re.sub(r'"thickness": (\d+)', r'"thickness": \1nm',
+                             re.sub(r'(\]|\}|"|\d)\n(\s*)(\]|\})', r'\1,\n\2\3', text)),
+        }
+        for name, sample in samples.items():
+            assert extract_json_from_text(sample) is not None, f'{name}_{num_layers} 解析失败'
+            results[f'extract_json/{name}_{num_layers}'] = measure(lambda: extract_json_from_text(sample), rounds)
+    return results
+
+
+def bench_plots(rounds):
+    results = {}
+    for num_layers in LAYER_COUNTS:
+        design = make_design(num_layers)
+        results[f'structure_plot/build_layers_{num_layers}'] = measure(
+            lambda: structure_chart(design['layers']).dump_options(), rounds)
+        results[f'structure_plot/option_layers_{num_layers}'] = measure(
+            lambda: chart_options({'layers': design['layers']}), rounds)
+    performance = make_design(5)['performance']
+    results['performance_plot/build'] = measure(lambda: performance_chart(performance).dump_options(), rounds)
+    results['performance_plot/option'] = measure(
+        lambda: chart_options({'performance': performance}), rounds)
+    return results
+
+
+def bench_layer_layout(rounds):
+    results = {}
+    for num_layers in LAYER_COUNTS:
+        layers = make_design(num_layers)['layers']
+        for i in range(0, num_layers, 3):
+            layers[i]['name'] = f'吸收层{i}'
+        results[f'layer_layout/layers_{num_layers}'] = measure(lambda: layout_layers(layers), rounds)
+    return results
+
+
+def bench_prompt(rounds):
+    params = {
+        'material_type': '钙钛矿/硅',
+        'bandgap_min': '1.1',
+        'bandgap_max': '1.8',
+        'thickness_min': '50',
+        'thickness_max': '800',
+        'target_application': '可见-近红外宽谱探测',
+        'additional_requirements': '低暗电流，响应速度快' * 5,
+    }
+    # 与 RAG_REFERENCE_LIMIT 默认值一致：5 个 1000 字左右的片段
+    documents = [Document(page_content=f'参考片段{i}：' + '钙钛矿叠层器件的界面钝化与能带对齐。' * 55)
+                 for i in range(5)]
+    return {
+        'prompt/design': measure(lambda: build_design_prompt(params), rounds),
+        'prompt/messages_rag': measure(
+            lambda: build_design_messages(build_design_prompt(params), format_references(documents)), rounds),
+    }
+
+
+def bench_design_space(rounds):
+    params = {
+        'material_type': 'CsPbBr₃量子点',
+        'bandgap_min': '1.5',
+        'bandgap_max': '2.4',
+        'thickness_min': '50',
+        'thickness_max': '800',
+    }
+    get_table()
+    return {
+        'design_space/rank_distinct': measure(lambda: rank_stacks(params), rounds),
+        'design_space/rank_top10': measure(lambda: rank_stacks(params, top_k=10, distinct_absorbers=False), rounds),
+    }
+
+
+def bench_faiss_search(rounds, sizes, dim, k=5, batch=3):
+    """每次检索 batch 条查询（与 search_references 的批量检索一致）"""
+    results = {}
+    for size in sizes:
+        vectors = synthetic_vectors(size, dim)
+        queries = make_queries(vectors, batch)
+        index = faiss.IndexFlatL2(dim)
+        index.add(vectors)
+        results[f'faiss_search/flat_{size}'] = measure(lambda: index.search(queries, k), rounds)
+        del index
+
+        with tempfile.TemporaryDirectory() as index_dir:
+            writer = VectorStoreWriter(index_dir, dim=dim, model='bench')
+            writer.add(vectors, [Document(page_content='') for _ in range(size)])
+            writer.close()
+            store = MmapVectorStore(index_dir)
+            results[f'faiss_search/mmap_{size}'] = measure(lambda: store.search(queries, k), rounds)
+            del store
+    return results
+
+
+def compare(metrics, calibration, baseline, baseline_calibration, tolerance):
+    """
+    返回 [(指标, 基线, 当前, 变化比例, 是否回归)]，基线中没有的指标不参与比较
+
+    提供校准耗时时比较 指标 / 校准耗时 的相对值，扣除机器整体快慢的变化
+    """
+    rows = []
+    for name, value in metrics.items():
+        if name not in baseline or baseline[name] <= 0:
+            continue
+        ratio = value / baseline[name]
+        if name in calibration and name in baseline_calibration:
+            ratio *= baseline_calibration[name] / calibration[name]
+        change = ratio - 1
+        rows.append((name, baseline[name], value, change, change > tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热点路径微基准测试')
+    parser.add_argument('--only', help=f"逗号分隔的测试组（{', '.join(GROUPS)}）")
+    parser.add_argument('--rounds', type=int, default=7, help='每项测量轮数，取最小值')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='检索测试的语料规模')
+    parser.add_argument('--dim', type=int, default=1024, help='检索测试的向量维度')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'), help='结果 JSON 路径')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线 JSON 路径')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许比基线慢的比例')
+    parser.add_argument('--retries', type=int, default=1, help='超出容差时复测的次数（生成基线时为全部重测的次数）')
+    parser.add_argument('--absolute', action='store_true', help='直接比较毫秒数，不按校准负载换算')
+    parser.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基线')
+    args = parser.parse_args()
+
+    groups = args.only.split(',') if args.only else list(GROUPS)
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"未知的测试组: {', '.join(sorted(unknown))}")
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    runners = {
+        'extract_json': lambda: bench_extract_json(args.rounds),
+        'structure_plot': lambda: bench_plots(args.rounds),
+        'performance_plot': lambda: bench_plots(args.rounds),
+        'layer_layout': lambda: bench_layer_layout(args.rounds),
+        'prompt': lambda: bench_prompt(args.rounds),
+        'design_space': lambda: bench_design_space(args.rounds),
+        'faiss_search': lambda: bench_faiss_search(args.rounds, sizes, args.dim),
+    }
+    baseline, baseline_calibration = {}, {}
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline_report = json.load(f)
+        baseline = baseline_report.get('metrics', {})
+        baseline_calibration = {} if args.absolute else baseline_report.get('calibration_ms', {})
+
+    def run_group(group):
+        started = time.perf_counter()
+        group_results = runners[group]()
+        print(f"[{group}] 完成，耗时 {time.perf_counter() - started:.1f}s")
+        return {name: result for name, result in group_results.items() if name.split('/', 1)[0] in groups}
+
+    results = {}
+    for group in groups:
+        if any(name.startswith(group + '/') for name in results):
+            continue  # structure_plot 与 performance_plot 在同一次运行中测量
+        results.update(run_group(group))
+
+    def split(results):
+        metrics = {name: round(ms, 6) for name, (ms, _) in sorted(results.items())}
+        calibration = {name: round(ms, 6) for name, (_, ms) in sorted(results.items())}
+        return metrics, calibration
+
+    # 超出容差的测试组重新测量（生成基线时全部重测），每项指标保留相对耗时较小的一次，
+    # 避免偶发干扰导致误报或基线偏慢
+    for _ in range(args.retries):
+        if args.update_baseline:
+            regressed = groups
+        else:
+            rows = compare(*split(results), baseline, baseline_calibration, args.tolerance)
+            regressed = sorted({name.split('/', 1)[0] for name, *_, flag in rows if flag})
+        if not regressed:
+            break
+        print(f"复测: {', '.join(regressed)}")
+        retried = {}
+        for group in regressed:
+            if not any(name.startswith(group + '/') for name in retried):
+                retried.update(run_group(group))
+        for name, (ms, cal) in retried.items():
+            if name in results and ms / cal < results[name][0] / results[name][1]:
+                results[name] = (ms, cal)
+
+    metrics, calibration = split(results)
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'unit': 'ms',
+        'metrics': metrics,
+        'calibration_ms': calibration,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            # 只运行部分测试组时保留其余指标的基线
+            with open(args.baseline, encoding='utf-8') as f:
+                previous = json.load(f)
+            report['metrics'] = {**previous.get('metrics', {}), **metrics}
+            report['calibration_ms'] = {**previous.get('calibration_ms', {}), **calibration}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"未找到基线 {args.baseline}，使用 --update-baseline 生成")
+        return 0
+
+    rows = compare(metrics, calibration, baseline, baseline_calibration, args.tolerance)
+    print(f"{'指标':40s} {'基线 ms':>12s} {'当前 ms':>12s} {'变化':>9s}")
+    for name, base, value, change, regressed in rows:
+        print(f"{name:40s} {base:12.4f} {value:12.4f} {change:+9.1%}{'  ✗ 回归' if regressed else ''}")
+    missing = sorted(set(metrics) - set(baseline))
+    if missing:
+        print(f"基线中没有的新指标（不参与比较）: {', '.join(missing)}")
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"✗ {len(regressions)} 项指标比基线慢超过 {args.tolerance:.0%}")
+        return 1
+    print(f"✓ 全部 {len(rows)} 项指标在基线 {args.tolerance:.0%} 容差内")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
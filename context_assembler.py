@@ -0,0 +1,155 @@
+# 功能：按 token 预算组装参考文献上下文
+# 检索返回的片段每条约 1000 字符，原样拼进提示词会拉长推理模型的预填充时间和费用；
+# 这里先用本地分词器计算 token 数，片段总长超过预算时按句子与查询的相关度挑选：
+#   1. 片段按句切分，句子得分 = 命中查询词的权重之和（词在候选句中越少见权重越高），
+#      再按片段的检索排名衰减
+#   2. 每个片段先保留得分最高的一句，剩余预算按得分从高到低补充句子；
+#      没有命中查询词的句子和与已选句子相同的句子（重叠切块）不选
+#   3. 保留的句子按原文顺序输出，不相邻处用 … 连接；一句也没有选中的片段被丢弃
+# 每个片段实际使用的 token 数随进度流返回，便于在上下文长度与延迟之间取舍
+#
+# token 计数：安装了 tokenizers 且 DEEPSEEK_TOKENIZER_PATH 指向 tokenizer.json 时精确计数；
+# 否则按 DeepSeek 文档的换算估算（中文约 0.6 token/字，英文约 0.3 token/字符）
+import os
+import re
+import math
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from lexical_index import tokenize
+from prompts import format_references
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+load_dotenv()
+
+# 参考文献部分的 token 预算，0 表示不限制（原样使用检索到的片段）
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv('RAG_CONTEXT_TOKEN_BUDGET', 1200))
+# 检索排名每靠后一位，句子得分乘以该系数
+RAG_CONTEXT_RANK_DECAY = float(os.getenv('RAG_CONTEXT_RANK_DECAY', 0.85))
+DEEPSEEK_TOKENIZER_PATH = os.getenv('DEEPSEEK_TOKENIZER_PATH', '')
+
+# 中文句末标点后直接断句；英文标点后需跟空白（避免切开 1.55 eV 之类的小数）
+_SENTENCE_BREAK_RE = re.compile(r'(?<=[。！？；])|(?<=[.!?;])(?=\s)|\n+')
+_CJK_RE = re.compile(r'[㐀-䶿一-鿿豈-﫿　-〿＀-￯]')
+
+_tokenizer = None
+
+
+def _load_tokenizer():
+    global _tokenizer
+    if _tokenizer is None and Tokenizer is not None and DEEPSEEK_TOKENIZER_PATH \
+            and os.path.exists(DEEPSEEK_TOKENIZER_PATH):
+        _tokenizer = Tokenizer.from_file(DEEPSEEK_TOKENIZER_PATH)
+    return _tokenizer
+
+
+def count_tokens(text):
+    """文本的 token 数（本地计算，不调用接口）"""
+    if not text:
+        return 0
+    tokenizer = _load_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def split_sentences(text):
+    """按中英文句末标点和换行切句，保留标点"""
+    return [sentence.strip() for sentence in _SENTENCE_BREAK_RE.split(text or '') if sentence.strip()]
+
+
+def _term_weights(query_terms, sentences):
+    """查询词的权重：在候选句中出现得越少越有区分度（提示词模板里的常见词权重接近 0）"""
+    df = {}
+    for terms in sentences:
+        for term in query_terms & terms:
+            df[term] = df.get(term, 0) + 1
+    total = len(sentences)
+    return {term: math.log(1 + total / count) - math.log(2) for term, count in df.items() if count < total}
+
+
+def assemble_references(documents, query, budget=RAG_CONTEXT_TOKEN_BUDGET, rank_decay=RAG_CONTEXT_RANK_DECAY):
+    """
+    在 token 预算内组装参考文献
+
+    Args:
+        documents: 检索到的 Document 列表，靠前的更相关
+        query: 查询文本（用于挑选句子）
+        budget: 片段正文的 token 预算，0 表示不限制
+        rank_decay: 检索排名的衰减系数
+
+    Returns:
+        tuple: (格式化后的文献文本, 每个片段的用量 [{'source', 'page', 'tokens', 'original_tokens'}])
+    """
+    if not documents:
+        return "", []
+    originals = [count_tokens(doc.page_content) for doc in documents]
+    if budget <= 0 or sum(originals) <= budget:
+        report = [_usage(doc, tokens, tokens) for doc, tokens in zip(documents, originals)]
+        return format_references(documents), report
+
+    # (片段序号, 句序号) -> 句子、词集合、token 数
+    sentences = [split_sentences(doc.page_content) for doc in documents]
+    entries = [(i, j, sentence, set(tokenize(sentence)), count_tokens(sentence))
+               for i, doc_sentences in enumerate(sentences) for j, sentence in enumerate(doc_sentences)]
+    query_terms = set(tokenize(query))
+    weights = _term_weights(query_terms, [terms for _, _, _, terms, _ in entries])
+    scored = sorted(
+        ((sum(weights.get(term, 0) for term in terms) * rank_decay ** i, -i, -j, i, j, tokens)
+         for i, j, _, terms, tokens in entries),
+        reverse=True)
+
+    # 所有句子都没有命中查询词时（例如查询全是常见词）退化为按检索排名和原文顺序截取
+    relevant_only = bool(scored) and scored[0][0] > 0
+    selected, seen = set(), set()
+    used = 0
+    # 第一轮：每个片段保留得分最高的一句；第二轮：剩余预算按得分补充
+    for first_pass in (True, False):
+        covered = {i for i, _ in selected}
+        for score, _, _, i, j, tokens in scored:
+            if (i, j) in selected or (first_pass and i in covered) or (relevant_only and score <= 0):
+                continue
+            if used + tokens > budget or sentences[i][j] in seen:
+                continue
+            selected.add((i, j))
+            seen.add(sentences[i][j])
+            covered.add(i)
+            used += tokens
+
+    trimmed, report = [], []
+    for i, doc in enumerate(documents):
+        keep = sorted(j for doc_index, j in selected if doc_index == i)
+        if not keep:
+            continue
+        parts = []
+        for position, j in enumerate(keep):
+            if position == 0 and j > 0 or position > 0 and j != keep[position - 1] + 1:
+                parts.append('…')
+            parts.append(sentences[i][j])
+        if keep[-1] < len(sentences[i]) - 1:
+            parts.append('…')
+        content = ''.join(_join(parts))
+        trimmed.append(Document(page_content=content, metadata=doc.metadata))
+        report.append(_usage(doc, count_tokens(content), originals[i]))
+    return format_references(trimmed), report
+
+
+def _join(parts):
+    """相邻的英文句子之间补空格"""
+    for position, part in enumerate(parts):
+        if position and part != '…' and parts[position - 1] != '…' and part[0].isascii():
+            yield ' '
+        yield part
+
+
+def _usage(doc, tokens, original_tokens):
+    return {
+        'source': os.path.basename(str(doc.metadata.get('source', ''))),
+        'page': doc.metadata.get('page'),
+        'tokens': tokens,
+        'original_tokens': original_tokens,
+    }
@@ -1,117 +1,65 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
 
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+# 设置后将模型的原始方案文本保存到该目录（benchmarks/bench_extract_json.py 的语料）
+CAPTURE_MODEL_OUTPUT_DIR = os.getenv('CAPTURE_MODEL_OUTPUT_DIR', '')
 
 import json
 import time
+import uuid
 from utils import extract_json_from_text
+from prompts import SYSTEM_PROMPT, build_design_messages
+from context_assembler import assemble_references
+from prompt_cache_stats import prompt_cache_stats, usage_summary, hit_rate
+from deepseek_client import create_chat_completion, is_configured
+from stream_json import IncrementalDesignParser
 
 # 导入 RAG 服务
 try:
-    from rag_service import _retriever, initialize_rag
+    import rag_service
+    from embedding_cache import STATIC_QUERIES
     RAG_AVAILABLE = True
     # 确保 RAG 系统已初始化
-    initialize_rag()
+    rag_service.initialize_rag()
 except Exception as e:
     print(f"RAG 系统不可用: {e}")
     RAG_AVAILABLE = False
-    _retriever = None
 
-# 初始化OpenAI客户端，使用DeepSeek的base_url
-if DEEPSEEK_API_KEY:
-    client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url="https://api.deepseek.com")
-else:
-    client = None
-
-def get_academic_references(user_prompt):
+def get_academic_references(user_prompt, rag_mode=None):
     """
     从知识库检索与设计需求相关的学术文献
     
     Args:
         user_prompt: 用户的设计需求
+        rag_mode: 检索模式 vector / lexical / hybrid，默认取 RAG_RETRIEVAL_MODE
         
     Returns:
-        str: 相关学术文献内容，如果 RAG 不可用则返回空字符串
+        tuple: (相关学术文献内容, 每个片段的 token 用量)，如果 RAG 不可用则返回 ("", [])
     """
-    if not RAG_AVAILABLE or _retriever is None:
-        return ""
+    if not RAG_AVAILABLE or not rag_service.is_available():
+        return "", []
     
     try:
-        # 构建检索查询，提取关键信息
-        search_queries = [
-            f"光电探测器设计 {user_prompt}",
-            "叠层光电探测器结构",
-            "量子效率优化方法"
-        ]
-        
-        all_docs = []
-        for query in search_queries:
-            docs = _retriever.invoke(query)
-            all_docs.extend(docs)
+        # 构建检索查询，提取关键信息；固定查询的向量在建库时已预先计算
+        search_queries = [f"光电探测器设计 {user_prompt}", *STATIC_QUERIES]
         
-        # 去重并限制文档数量
-        unique_docs = []
-        seen_content = set()
-        for doc in all_docs:
-            content_hash = hash(doc.page_content[:100])  # 使用前100字符作为去重依据
-            if content_hash not in seen_content:
-                seen_content.add(content_hash)
-                unique_docs.append(doc)
-                if len(unique_docs) >= 5:  # 最多5个文档片段
-                    break
+        # 一次嵌入请求 + 一次向量检索（lexical 模式无网络请求），按文档 ID 去重并限制文档数量
+        unique_docs = rag_service.search_references(search_queries, mode=rag_mode)
         
         if not unique_docs:
-            return ""
+            return "", []
         
-        # 格式化文献内容
-        references = "\n\n".join([
-            f"【参考文献片段 {i+1}】\n{doc.page_content}"
-            for i, doc in enumerate(unique_docs)
-        ])
-        
-        return references
+        # 在 token 预算内按与查询的相关度挑选句子并格式化
+        return assemble_references(unique_docs, " ".join(search_queries))
         
     except Exception as e:
         print(f"检索学术文献失败: {e}")
-        return ""
-
-SYSTEM_PROMPT = """你是一位专业的光电探测器设计专家，精通半导体物理、材料科学和光电器件工程。
-你的任务是根据用户提供的参数，设计一个高性能的叠层光电探测器。
-
-设计时需要考虑：
-1. 材料的禁带宽度与目标波长的匹配
-2. 各层厚度对光吸收和载流子收集的影响
-3. 异质结界面的能带匹配
-4. 暗电流的抑制
-5. 量子效率的优化
+        return "", []
 
-请严格按照JSON格式输出设计结果，包含layers（层结构）、performance（性能参数）、optimization_suggestions（优化建议）和explanation（设计说明）。
-"""
-
-SYSTEM_PROMPT_WITH_RAG = """你是一位专业的光电探测器设计专家，精通半导体物理、材料科学和光电器件工程。
-你的任务是根据用户提供的参数和学术文献资料，设计一个高性能的叠层光电探测器。
-
-**重要要求**：
-1. 你必须参考提供的【学术文献】中的设计思路、材料选择和性能参数
-2. 设计方案应基于文献中的实验数据和理论分析
-3. 在 explanation 字段中明确说明你参考了哪些文献内容，以及如何应用这些知识
-4. 优化建议应结合文献中的最新研究成果
-
-设计时需要考虑：
-1. 材料的禁带宽度与目标波长的匹配（参考文献中的材料特性）
-2. 各层厚度对光吸收和载流子收集的影响（参考文献中的优化参数）
-3. 异质结界面的能带匹配（参考文献中的界面工程）
-4. 暗电流的抑制（参考文献中的抑制策略）
-5. 量子效率的优化（参考文献中的效率提升方法）
-
-请严格按照JSON格式输出设计结果，包含layers（层结构）、performance（性能参数）、optimization_suggestions（优化建议）和explanation（设计说明，必须引用文献）。
-"""
-
-def call_deepseek_api(user_prompt, model="deepseek-reasoner", use_rag=True):
+def call_deepseek_api(user_prompt, model="deepseek-reasoner", use_rag=True, rag_mode=None):
     """
     调用DeepSeek API进行探测器设计（非流式）
     
@@ -119,8 +67,9 @@ def call_deepseek_api(user_prompt, model="deepseek-reasoner", use_rag=True):
         user_prompt: 用户提示词
         model: 模型名称，默认为 "deepseek-reasoner" (R1)，可选 "deepseek-chat" (V3)
         use_rag: 是否使用 RAG 增强，默认为 True
+        rag_mode: 文献检索模式 vector / lexical / hybrid
     """
-    if not client:
+    if not is_configured():
         return {
             'status': 'error',
             'message': 'API密钥未配置，请在.env文件中设置DEEPSEEK_API_KEY'
@@ -130,40 +79,26 @@ def call_deepseek_api(user_prompt, model="deepseek-reasoner", use_rag=True):
         # 检索学术文献
         academic_refs = ""
         if use_rag and RAG_AVAILABLE:
-            academic_refs = get_academic_references(user_prompt)
-        
-        # 根据是否有文献选择不同的系统提示词
-        if academic_refs:
-            system_prompt = SYSTEM_PROMPT_WITH_RAG
-            # 将文献添加到用户提示词中
-            enhanced_prompt = f"""【学术文献】
-{academic_refs}
-
-【设计需求】
-{user_prompt}
-
-请基于以上学术文献和设计需求，给出专业的探测器设计方案。"""
-        else:
-            system_prompt = SYSTEM_PROMPT
-            enhanced_prompt = user_prompt
+            academic_refs, _ = get_academic_references(user_prompt, rag_mode)
         
-        messages = [
-            {'role': 'system', 'content': system_prompt},
-            {'role': 'user', 'content': enhanced_prompt}
-        ]
+        # 固定内容在前、文献和设计需求在后，与流式接口共用同一模板（命中上下文缓存）
+        messages = build_design_messages(user_prompt, academic_refs)
         
-        response = client.chat.completions.create(
+        response = create_chat_completion(
             model=model,
             messages=messages,
             stream=False
         )
         
         content = response.choices[0].message.content
+        usage = usage_summary(response.usage)
+        prompt_cache_stats.record(model, usage)
         
         return {
             'status': 'success',
             'content': content,
-            'used_rag': bool(academic_refs)
+            'used_rag': bool(academic_refs),
+            'usage': usage
         }
         
     except Exception as e:
@@ -172,7 +107,42 @@ def call_deepseek_api(user_prompt, model="deepseek-reasoner", use_rag=True):
             'message': f'API调用失败: {str(e)}'
         }
 
-def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True):
+def capture_model_output(content, model_type):
+    """保存模型原始输出（未设置 CAPTURE_MODEL_OUTPUT_DIR 时不做任何事）"""
+    if not CAPTURE_MODEL_OUTPUT_DIR or not content:
+        return
+    try:
+        os.makedirs(CAPTURE_MODEL_OUTPUT_DIR, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}_{model_type}_{uuid.uuid4().hex[:8]}.txt"
+        with open(os.path.join(CAPTURE_MODEL_OUTPUT_DIR, filename), 'w', encoding='utf-8') as f:
+            f.write(content)
+    except OSError as e:
+        print(f"保存模型输出失败: {e}")
+
+def _partial_event(event, model_display):
+    """将增量解析器的事件转换为进度消息"""
+    if event[0] == 'layer':
+        _, index, layer = event
+        return {
+            'type': 'layer',
+            'index': index,
+            'layer': layer,
+            'step': 4,
+            'message': f'🧱 {model_display}已生成第 {index + 1} 层: {layer.get("name", "")} '
+                       f'({layer.get("material", "")}, {layer.get("thickness", "?")} nm)',
+            'log': True
+        }
+    _, key, value = event
+    return {
+        'type': 'field',
+        'key': key,
+        'value': value,
+        'step': 4,
+        'message': f'📄 {model_display}已生成 {key}',
+        'log': True
+    }
+
+def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True, rag_mode=None, cancelled=None):
     """
     生成器函数，用于流式调用DeepSeek API并返回特定格式的进度数据
     
@@ -180,8 +150,10 @@ def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True)
         prompt: 用户提示词
         model_type: 模型类型
         use_rag: 是否使用 RAG 增强，默认为 True
+        rag_mode: 文献检索模式 vector / lexical / hybrid
+        cancelled: 可选的无参函数，返回 True 时（任务已取消）不再调用模型并关闭连接，生成器直接结束
     """
-    if not client:
+    if not is_configured():
         yield json.dumps({
             'step': -1,
             'error': 'API密钥未配置',
@@ -196,55 +168,63 @@ def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True)
     academic_refs = ""
     if use_rag and RAG_AVAILABLE:
         yield json.dumps({'step': 3, 'message': '📚 检索学术文献...', 'progress': 25, 'log': True}) + '\n'
-        time.sleep(0.2)
         
-        academic_refs = get_academic_references(prompt)
+        academic_refs, usage = get_academic_references(prompt, rag_mode)
         
         if academic_refs:
             yield json.dumps({'step': 3, 'message': '✅ 已检索到相关学术文献，将用于增强设计', 'progress': 28, 'log': True}) + '\n'
+            # 每个片段实际使用 / 原始的 token 数
+            details = '，'.join(f"{i + 1}: {item['tokens']}/{item['original_tokens']}" for i, item in enumerate(usage))
+            yield json.dumps({
+                'step': 3,
+                'message': f"📏 文献上下文 {sum(item['tokens'] for item in usage)} tokens（{details}）",
+                'progress': 29,
+                'log': True,
+                'references': usage
+            }) + '\n'
         else:
             yield json.dumps({'step': 3, 'message': '⚠️ 未找到相关文献，使用标准设计模式', 'progress': 28, 'log': True}) + '\n'
-        time.sleep(0.2)
+
+    # 文献检索可能耗时数秒，取消的任务不再调用模型
+    if cancelled is not None and cancelled():
+        return
 
     yield json.dumps({'step': 3, 'message': f'调用{model_display} API', 'progress': 30}) + '\n'
-    time.sleep(0.3)
     
     yield json.dumps({'step': 3, 'message': f'🔗 连接{model_display} API...', 'progress': 35, 'log': True}) + '\n'
     yield json.dumps({'step': 3, 'message': f'📡 发送设计请求到{model_display}模型...', 'progress': 38, 'log': True}) + '\n'
-    yield json.dumps({'step': 3, 'message': f'✅ 连接成功，{model_display}开始推理...', 'progress': 40, 'log': True}) + '\n'
 
     try:
         # 根据是否有文献选择不同的系统提示词和用户提示词
-        if academic_refs:
-            system_prompt = SYSTEM_PROMPT_WITH_RAG
-            enhanced_prompt = f"""【学术文献】
-{academic_refs}
-
-【设计需求】
-{prompt}
-
-请基于以上学术文献和设计需求，给出专业的探测器设计方案。在设计说明中请明确引用文献内容。"""
-        else:
-            system_prompt = SYSTEM_PROMPT
-            enhanced_prompt = prompt
+        messages = build_design_messages(prompt, academic_refs)
         
-        messages = [
-            {'role': 'system', 'content': system_prompt},
-            {'role': 'user', 'content': enhanced_prompt}
-        ]
-        
-        response = client.chat.completions.create(
+        # include_usage：最后一个 chunk 携带 usage（含上下文缓存命中的 token 数），choices 为空
+        response = create_chat_completion(
             model=model_type,
             messages=messages,
-            stream=True
+            stream=True,
+            stream_options={'include_usage': True},
+            cancelled=cancelled
         )
+
+        # 连接建立后再通知前端，进度消息与实际调用进展保持一致
+        yield json.dumps({'step': 3, 'message': f'✅ 连接成功，{model_display}开始推理...', 'progress': 40, 'log': True}) + '\n'
         
         reasoning_content = ""
         content = ""
         reasoning_count = 0
         content_count = 0
+        parser = IncrementalDesignParser()
+        usage = None
         
         for chunk in response:
+            if cancelled is not None and cancelled():
+                response.close()
+                return
+            if not chunk.choices:
+                usage = usage_summary(chunk.usage) or usage
+                continue
+            
             # 处理推理过程（仅R1模型有）
             if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
                 reasoning_chunk = chunk.choices[0].delta.reasoning_content
@@ -268,6 +248,10 @@ def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True)
                 content += content_chunk
                 content_count += 1
                 
+                # 增量解析：每完成一层或一个顶层字段立即推送，前端可以提前绘制层叠结构
+                for event in parser.feed(content_chunk):
+                    yield json.dumps(_partial_event(event, model_display)) + '\n'
+                
                 # 每收到3个内容chunk输出一次日志
                 if content_count % 3 == 0:
                     current_progress = min(60 + content_count // 3, 70)
@@ -285,12 +269,26 @@ def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True)
             'log': True
         }) + '\n'
         
+        if usage is not None:
+            prompt_cache_stats.record(model_type, usage)
+            yield json.dumps({
+                'step': 4,
+                'message': f"🗄️ 上下文缓存命中 {usage['prompt_cache_hit_tokens']} / "
+                           f"{usage['prompt_cache_hit_tokens'] + usage['prompt_cache_miss_tokens']} tokens"
+                           f"（{hit_rate(usage):.0%}）",
+                'progress': 76,
+                'log': True,
+                'usage': usage
+            }) + '\n'
+        
         # 返回最终的完整内容，作为一个特殊的消息类型，或者让调用者自己解析
         # 这里我们不直接yield结果对象，而是让调用者知道API调用已完成，并提供内容
         # 但为了保持流的一致性，我们可以在生成器最后返回结果
         
         yield json.dumps({'step': 5, 'message': '解析设计方案', 'progress': 80}) + '\n'
-        time.sleep(0.5)
+
+        # 采集模型原始输出，用于 JSON 解析基准测试的语料
+        capture_model_output(content, model_type)
 
         # 使用 utils 中的函数解析
         design_data = extract_json_from_text(content)
@@ -308,10 +306,14 @@ def generate_design_stream(prompt, model_type='deepseek-reasoner', use_rag=True)
         yield json.dumps({
             'type': 'result',
             'design_data': design_data,
-            'reasoning_content': reasoning_content
+            'reasoning_content': reasoning_content,
+            'usage': usage
         }) + '\n'
 
     except Exception as e:
+        # 取消时看门狗关闭了连接，读取失败不是调用错误
+        if cancelled is not None and cancelled():
+            return
         yield json.dumps({
             'step': -1,
             'error': f'API调用失败: {str(e)}',
@@ -347,7 +349,7 @@ def call_deepseek_api_stream(user_prompt, log_callback=None):
         if log_callback:
             log_callback('📡 发送设计请求到深度学习模型...')
         
-        response = client.chat.completions.create(
+        response = create_chat_completion(
             model="deepseek-reasoner",
             messages=messages,
             stream=True
@@ -0,0 +1,280 @@
+# 功能：DeepSeek API 客户端层
+# 基于 httpx 连接池（显式连接数、keep-alive、连接/读取/首 token 超时），
+# 对连接错误和 429/5xx 响应做带抖动的指数退避重试；同时提供 asyncio 版本，
+# 多个并发流可以共享一个事件循环
+import os
+import time
+import random
+import asyncio
+import weakref
+import threading
+import httpx
+import openai
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+
+# 连接池
+DEEPSEEK_MAX_CONNECTIONS = int(os.getenv('DEEPSEEK_MAX_CONNECTIONS', 32))
+DEEPSEEK_MAX_KEEPALIVE = int(os.getenv('DEEPSEEK_MAX_KEEPALIVE', 16))
+DEEPSEEK_KEEPALIVE_EXPIRY = float(os.getenv('DEEPSEEK_KEEPALIVE_EXPIRY', 60))
+
+# 超时（秒）
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', 10))
+DEEPSEEK_READ_TIMEOUT = float(os.getenv('DEEPSEEK_READ_TIMEOUT', 120))
+DEEPSEEK_WRITE_TIMEOUT = float(os.getenv('DEEPSEEK_WRITE_TIMEOUT', 30))
+DEEPSEEK_POOL_TIMEOUT = float(os.getenv('DEEPSEEK_POOL_TIMEOUT', 30))
+# 流式请求从发出到收到第一个推理/内容 token 的最长等待时间
+DEEPSEEK_FIRST_TOKEN_TIMEOUT = float(os.getenv('DEEPSEEK_FIRST_TOKEN_TIMEOUT', 180))
+# 流式请求看门狗检查首 token 超时与取消请求的间隔
+STREAM_WATCH_INTERVAL = 0.5
+
+# 重试
+DEEPSEEK_MAX_RETRIES = int(os.getenv('DEEPSEEK_MAX_RETRIES', 3))
+DEEPSEEK_BACKOFF_BASE = float(os.getenv('DEEPSEEK_BACKOFF_BASE', 0.5))
+DEEPSEEK_BACKOFF_MAX = float(os.getenv('DEEPSEEK_BACKOFF_MAX', 8))
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+# {事件循环: (AsyncOpenAI, 关闭客户端的异步生成器)}，事件循环被回收后条目自动消失
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class FirstTokenTimeoutError(TimeoutError):
+    """流式请求在规定时间内没有返回任何 token"""
+
+    def __init__(self, timeout):
+        super().__init__(f'等待首个 token 超时（{timeout:.0f}s）')
+
+
+def _timeout():
+    return httpx.Timeout(
+        connect=DEEPSEEK_CONNECT_TIMEOUT,
+        read=DEEPSEEK_READ_TIMEOUT,
+        write=DEEPSEEK_WRITE_TIMEOUT,
+        pool=DEEPSEEK_POOL_TIMEOUT
+    )
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=DEEPSEEK_MAX_CONNECTIONS,
+        max_keepalive_connections=DEEPSEEK_MAX_KEEPALIVE,
+        keepalive_expiry=DEEPSEEK_KEEPALIVE_EXPIRY
+    )
+
+
+def is_configured():
+    return bool(DEEPSEEK_API_KEY)
+
+
+def get_client():
+    """获取同步客户端（每个进程一个连接池，fork 后重新创建）"""
+    global _client, _client_pid
+    if not DEEPSEEK_API_KEY:
+        return None
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            http_client = httpx.Client(limits=_limits(), timeout=_timeout())
+            # 重试由本模块统一处理，关闭 SDK 自带的重试
+            _client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL,
+                             http_client=http_client, max_retries=0)
+            _client_pid = os.getpid()
+        return _client
+
+
+async def _close_with_loop(loop, client):
+    """
+    随事件循环关闭客户端：asyncio.run 结束前会调用 loop.shutdown_asyncgens()，
+    未结束的异步生成器在事件循环仍可用时被关闭，finally 中释放连接池并移除登记
+    """
+    try:
+        yield
+    finally:
+        with _lock:
+            if _async_clients.get(loop, (None,))[0] is client:
+                del _async_clients[loop]
+        await client.close()
+
+
+async def get_async_client():
+    """获取异步客户端（每个事件循环一个连接池，事件循环关闭时随之关闭）"""
+    if not DEEPSEEK_API_KEY:
+        return None
+    loop = asyncio.get_running_loop()
+    with _lock:
+        entry = _async_clients.get(loop)
+        if entry is None or entry[0].is_closed():
+            http_client = httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+            client = AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL,
+                                 http_client=http_client, max_retries=0)
+            entry = (client, _close_with_loop(loop, client))
+            _async_clients[loop] = entry
+        else:
+            return entry[0]
+    # 首次迭代时事件循环登记该生成器（asyncgen hooks），之后停在 yield 处直到事件循环关闭
+    await entry[1].__anext__()
+    return entry[0]
+
+
+async def aclose_async_client():
+    """关闭当前事件循环的异步客户端（手动管理事件循环、不经过 shutdown_asyncgens 时调用）"""
+    with _lock:
+        entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+def _is_retryable(error):
+    """连接错误、超时、429 和 5xx 可以重试，其余错误（如 401/400）直接抛出"""
+    if isinstance(error, openai.APIConnectionError):  # 包含 APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _backoff_delay(attempt, error):
+    """指数退避 + 全抖动；服务端给出 Retry-After 时以其为下限"""
+    delay = random.uniform(0, min(DEEPSEEK_BACKOFF_MAX, DEEPSEEK_BACKOFF_BASE * (2 ** attempt)))
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            delay = max(delay, min(float(response.headers.get('retry-after', 0)), DEEPSEEK_BACKOFF_MAX))
+        except ValueError:
+            pass
+    return delay
+
+
+def _has_token(chunk):
+    if not chunk.choices:
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, 'reasoning_content', None) or delta.content)
+
+
+def _guard_stream(stream, timeout=None, cancelled=None):
+    """
+    流式响应看门狗：首 token 超时或任务被取消时关闭底层连接，使阻塞的读取立即失败
+
+    服务端排队期间会发送 keep-alive 注释行，httpx 的读取超时不会触发，因此需要单独计时；
+    推理模型首个 token 之前可能等待数分钟，取消请求同样不能等到下一个 chunk 才生效
+    """
+    expired = threading.Event()
+    done = threading.Event()
+    got_token = threading.Event()
+    deadline = time.monotonic() + timeout if timeout else None
+
+    def watch():
+        while not done.wait(STREAM_WATCH_INTERVAL):
+            if cancelled is not None and cancelled():
+                stream.close()
+                return
+            if deadline is not None and not got_token.is_set() and time.monotonic() >= deadline:
+                expired.set()
+                stream.close()
+                return
+            if cancelled is None and got_token.is_set():
+                return
+
+    watcher = threading.Thread(target=watch, name='deepseek-stream-guard', daemon=True)
+    watcher.start()
+    try:
+        for chunk in stream:
+            if not got_token.is_set() and _has_token(chunk):
+                got_token.set()
+            yield chunk
+    except Exception as e:
+        if expired.is_set():
+            raise FirstTokenTimeoutError(timeout) from e
+        raise
+    finally:
+        done.set()
+        # 调用方提前关闭生成器（例如任务取消）时同时释放连接
+        stream.close()
+    if expired.is_set():
+        raise FirstTokenTimeoutError(timeout)
+
+
+def create_chat_completion(first_token_timeout=DEEPSEEK_FIRST_TOKEN_TIMEOUT, cancelled=None, **kwargs):
+    """
+    调用 chat.completions.create，失败时按策略重试
+
+    Args:
+        first_token_timeout: 流式请求的首 token 超时（秒），为 None 时不限制
+        cancelled: 可选的无参函数，返回 True 时停止重试，流式请求立即关闭连接
+        **kwargs: 透传给 chat.completions.create 的参数（model、messages、stream 等）
+
+    Returns:
+        非流式返回 ChatCompletion；流式返回可迭代的 chunk 生成器
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError('API密钥未配置，请在.env文件中设置DEEPSEEK_API_KEY')
+
+    attempt = 0
+    while True:
+        try:
+            response = client.chat.completions.create(**kwargs)
+            break
+        except Exception as e:
+            if (attempt >= DEEPSEEK_MAX_RETRIES or not _is_retryable(e)
+                    or (cancelled is not None and cancelled())):
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"DeepSeek API 调用失败，{delay:.1f}s 后重试 ({attempt + 1}/{DEEPSEEK_MAX_RETRIES}): {e}")
+            time.sleep(delay)
+            attempt += 1
+
+    if kwargs.get('stream') and (first_token_timeout or cancelled is not None):
+        return _guard_stream(response, first_token_timeout, cancelled)
+    return response
+
+
+async def _aguard_first_token(stream, timeout):
+    iterator = stream.__aiter__()
+    deadline = asyncio.get_running_loop().time() + timeout
+    got_token = False
+    while True:
+        try:
+            if got_token:
+                chunk = await iterator.__anext__()
+            else:
+                remaining = max(0.0, deadline - asyncio.get_running_loop().time())
+                chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            await stream.close()
+            raise FirstTokenTimeoutError(timeout)
+        got_token = got_token or _has_token(chunk)
+        yield chunk
+
+
+async def acreate_chat_completion(first_token_timeout=DEEPSEEK_FIRST_TOKEN_TIMEOUT, **kwargs):
+    """create_chat_completion 的 asyncio 版本，流式时返回异步生成器"""
+    client = await get_async_client()
+    if client is None:
+        raise RuntimeError('API密钥未配置，请在.env文件中设置DEEPSEEK_API_KEY')
+
+    attempt = 0
+    while True:
+        try:
+            response = await client.chat.completions.create(**kwargs)
+            break
+        except Exception as e:
+            if attempt >= DEEPSEEK_MAX_RETRIES or not _is_retryable(e):
+                raise
+            delay = _backoff_delay(attempt, e)
+            print(f"DeepSeek API 调用失败，{delay:.1f}s 后重试 ({attempt + 1}/{DEEPSEEK_MAX_RETRIES}): {e}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    if kwargs.get('stream') and first_token_timeout:
+        return _aguard_first_token(response, first_token_timeout)
+    return response
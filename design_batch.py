@@ -0,0 +1,194 @@
+# 功能：批量设计（参数扫描）
+# 研究人员扫描禁带宽度、厚度范围时原先只能逐个提交 /thinking → /api/design；
+# 批量接口接收参数网格或参数列表：
+#   1. 网格按笛卡尔积展开，与列表合并后逐项套用公共参数
+#   2. 按设计缓存键（make_cache_key）合并相同的参数组，每组只请求一次
+#   3. 本进程内所有批量请求共享一个有界线程池（同时运行的设计总数不超过 DESIGN_BATCH_CONCURRENCY），
+#      调用模型前从令牌桶取令牌（每分钟请求数限制，同样由所有批量请求共享），命中设计缓存的参数组不占用配额
+#   4. 每完成一组立即以 NDJSON 行返回，不等待整批结束
+import os
+import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from rate_limit import TokenBucket
+from design_cache import make_cache_key
+
+load_dotenv()
+
+# 本进程内所有批量请求同时运行的设计总数（单个请求的 concurrency 也不能超过该值）
+DESIGN_BATCH_CONCURRENCY = int(os.getenv('DESIGN_BATCH_CONCURRENCY', 4))
+# 批量设计每分钟最多发起的模型请求数，0 表示不限流
+DESIGN_BATCH_RPM = int(os.getenv('DESIGN_BATCH_RPM', 30))
+# 单个批量请求展开后的最大参数组数
+DESIGN_BATCH_MAX_ITEMS = int(os.getenv('DESIGN_BATCH_MAX_ITEMS', 64))
+
+PARAM_FIELDS = ('material_type', 'bandgap_min', 'bandgap_max', 'thickness_min', 'thickness_max',
+                'target_application', 'additional_requirements', 'deep_thinking', 'rag_mode')
+# 网格中可以直接给出 [下限, 上限] 的范围参数
+RANGE_FIELDS = {
+    'bandgap': ('bandgap_min', 'bandgap_max'),
+    'thickness': ('thickness_min', 'thickness_max'),
+}
+
+batch_bucket = TokenBucket.per_minute(DESIGN_BATCH_RPM)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class BatchRequestError(ValueError):
+    """批量请求格式错误或参数组过多"""
+
+
+def _axis(name, values):
+    """网格的一个维度：[(字段, 值), ...] 的列表"""
+    if not isinstance(values, list) or not values:
+        raise BatchRequestError(f'grid.{name} 必须是非空列表')
+    if name in RANGE_FIELDS:
+        low_field, high_field = RANGE_FIELDS[name]
+        axis = []
+        for value in values:
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
+                raise BatchRequestError(f'grid.{name} 的每一项必须是 [下限, 上限]')
+            axis.append(((low_field, value[0]), (high_field, value[1])))
+        return axis
+    if name not in PARAM_FIELDS:
+        raise BatchRequestError(f'未知参数：{name}')
+    return [((name, value),) for value in values]
+
+
+def expand_batch(payload, max_items=DESIGN_BATCH_MAX_ITEMS):
+    """
+    展开批量请求中的参数组
+
+    Args:
+        payload: {'base': 公共参数, 'grid': {参数: [取值...]}, 'items': [参数组...]}；
+                 grid 中 bandgap / thickness 可直接给出 [下限, 上限] 列表，grid 与 items 至少提供一个
+        max_items: 展开后的最大参数组数
+
+    Returns:
+        list: 参数组列表（与 /thinking 表单相同的字段，取值统一为字符串）
+
+    Raises:
+        BatchRequestError: 格式错误或参数组过多
+    """
+    if not isinstance(payload, dict):
+        raise BatchRequestError('请求体必须是 JSON 对象')
+    base = payload.get('base') or {}
+    grid = payload.get('grid') or {}
+    items = payload.get('items') or []
+    if not isinstance(base, dict) or not isinstance(grid, dict) or not isinstance(items, list):
+        raise BatchRequestError('base、grid 必须是对象，items 必须是列表')
+    if not grid and not items:
+        raise BatchRequestError('grid 与 items 至少提供一个')
+
+    combos = []
+    if grid:
+        axes = [_axis(name, values) for name, values in grid.items()]
+        total = 1
+        for axis in axes:
+            total *= len(axis)
+        if total + len(items) > max_items:
+            raise BatchRequestError(f'参数组过多（{total + len(items)} 组），单次最多 {max_items} 组')
+        for product in itertools.product(*axes):
+            combos.append(dict(pair for pairs in product for pair in pairs))
+    elif len(items) > max_items:
+        raise BatchRequestError(f'参数组过多（{len(items)} 组），单次最多 {max_items} 组')
+    for item in items:
+        if not isinstance(item, dict):
+            raise BatchRequestError('items 的每一项必须是对象')
+        combos.append(item)
+
+    param_sets = []
+    for combo in combos:
+        params = {field: base.get(field) for field in PARAM_FIELDS}
+        params.update({field: combo[field] for field in PARAM_FIELDS if field in combo})
+        params = {field: '' if value is None else str(value) for field, value in params.items()}
+        params['deep_thinking'] = params['deep_thinking'] or 'yes'
+        param_sets.append(params)
+    return param_sets
+
+
+def group_duplicates(param_sets, model_for, prompt_version, design_space=None):
+    """
+    按设计缓存键合并相同的参数组
+
+    Args:
+        param_sets: expand_batch 的返回值
+        model_for: 函数，参数组 -> 模型名称
+        prompt_version: 提示词模板版本
+        design_space: 预筛配置版本，见 make_cache_key
+
+    Returns:
+        list: [(缓存键, 参数组, 原始序号列表)]，按首次出现的顺序
+    """
+    groups = {}
+    for index, params in enumerate(param_sets):
+        key = make_cache_key(params, model_for(params), prompt_version, design_space)
+        if key in groups:
+            groups[key][2].append(index)
+        else:
+            groups[key] = (key, params, [index])
+    return list(groups.values())
+
+
+def _get_executor():
+    """所有批量请求共享的线程池，按进程创建（preload_app 时 fork 之前不启动线程）"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(1, DESIGN_BATCH_CONCURRENCY),
+                                           thread_name_prefix='design-batch')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def run_batch(groups, run_one, concurrency=DESIGN_BATCH_CONCURRENCY):
+    """
+    并发执行参数组，按完成顺序逐个返回
+
+    参数组提交到共享线程池，多个批量请求同时运行时总并发仍不超过 DESIGN_BATCH_CONCURRENCY；
+    每个请求最多同时占用 concurrency 个名额，完成一组再提交下一组
+
+    Args:
+        groups: group_duplicates 的返回值
+        run_one: 函数 run_one(params) -> dict，执行一次设计（异常时以 {'error': ...} 返回）
+        concurrency: 本请求同时运行的设计数
+
+    Yields:
+        tuple: (缓存键, 参数组, 原始序号列表, run_one 的返回值, 耗时秒数)
+    """
+    executor = _get_executor()
+    pending = iter(groups)
+    running = {}
+
+    def timed(params):
+        started = time.time()
+        try:
+            result = run_one(params)
+        except Exception as e:
+            result = {'error': f'系统错误: {str(e)}'}
+        return result, time.time() - started
+
+    def submit_next():
+        group = next(pending, None)
+        if group is not None:
+            running[executor.submit(timed, group[1])] = group
+
+    try:
+        for _ in range(max(1, concurrency)):
+            submit_next()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, params, indices = running.pop(future)
+                submit_next()
+                result, elapsed = future.result()
+                yield key, params, indices, result, elapsed
+    finally:
+        # 客户端断开时生成器被关闭，尚未开始的参数组不再执行
+        for future in running:
+            future.cancel()
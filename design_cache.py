@@ -0,0 +1,187 @@
+# 功能：设计结果精确匹配缓存
+# 课堂和实验室用户经常重复提交相同的预设参数，命中缓存时直接回放上一次的进度流和结果，
+# 不再调用 deepseek-reasoner
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from result_store import connect_sqlite
+
+load_dotenv()
+
+DESIGN_CACHE_ENABLED = os.getenv('DESIGN_CACHE_ENABLED', 'true').lower() == 'true'
+DESIGN_CACHE_MAX_ENTRIES = int(os.getenv('DESIGN_CACHE_MAX_ENTRIES', 256))
+DESIGN_CACHE_TTL_SECONDS = int(os.getenv('DESIGN_CACHE_TTL_SECONDS', 24 * 3600))
+# 磁盘缓存路径，留空则只使用内存缓存
+DESIGN_CACHE_DISK_PATH = os.getenv('DESIGN_CACHE_DISK_PATH', 'instance/design_cache.db')
+
+
+def _normalize_text(value):
+    """去除首尾空白、合并连续空白并统一大小写"""
+    if value is None:
+        return ''
+    return re.sub(r'\s+', ' ', str(value)).strip().casefold()
+
+
+def _normalize_number(value):
+    """将数值字符串统一为规范形式，例如 '1.50'、' 1.5 ' 都转换为 '1.5'"""
+    try:
+        number = round(float(value), 4)
+    except (TypeError, ValueError):
+        return _normalize_text(value)
+    return repr(number + 0.0)  # + 0.0 将 -0.0 归一为 0.0
+
+
+def _normalize_range(low, high):
+    """规范化数值范围，上下限顺序颠倒时自动交换"""
+    low, high = _normalize_number(low), _normalize_number(high)
+    try:
+        if float(low) > float(high):
+            low, high = high, low
+    except ValueError:
+        pass
+    return [low, high]
+
+
+def make_cache_key(params, model, prompt_version, design_space=None):
+    """
+    根据设计参数生成缓存键
+
+    Args:
+        params: 设计参数字典（material_type、bandgap_min 等，可选 rag_mode）
+        model: 模型名称
+        prompt_version: 提示词模板版本，模板变化后旧缓存自动失效
+        design_space: 预筛配置版本（design_space.design_space_version），材料表变化后旧缓存自动失效
+
+    Returns:
+        str: sha256 十六进制缓存键
+    """
+    canonical = {
+        'material_type': _normalize_text(params.get('material_type')),
+        'bandgap': _normalize_range(params.get('bandgap_min'), params.get('bandgap_max')),
+        'thickness': _normalize_range(params.get('thickness_min'), params.get('thickness_max')),
+        'target_application': _normalize_text(params.get('target_application')),
+        'additional_requirements': _normalize_text(params.get('additional_requirements')),
+        'model': model,
+        'prompt_version': prompt_version,
+        'design_space': design_space,
+    }
+    # 指定了文献检索模式时才加入，未指定的请求与旧缓存键保持一致
+    if params.get('rag_mode'):
+        canonical['rag_mode'] = _normalize_text(params.get('rag_mode'))
+    payload = json.dumps(canonical, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DesignCache:
+    """
+    两级缓存：进程内 LRU + 可选的 SQLite 磁盘缓存（多 worker 共享）
+
+    缓存内容是 generate_design_stream 输出的完整行列表（进度消息 + 最终结果），
+    命中时按原顺序立即回放
+    """
+
+    def __init__(self, max_entries=DESIGN_CACHE_MAX_ENTRIES, ttl_seconds=DESIGN_CACHE_TTL_SECONDS,
+                 disk_path=DESIGN_CACHE_DISK_PATH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # {key: (expires_at, lines)}
+        self._local = threading.local()
+        if disk_path:
+            directory = os.path.dirname(disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connect().executescript("""
+                CREATE TABLE IF NOT EXISTS design_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    lines TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_design_cache_expires ON design_cache(expires_at);
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(self.disk_path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """读取缓存，返回行列表，未命中返回 None"""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._memory.move_to_end(key)
+                    return item[1]
+                del self._memory[key]
+
+        if not self.disk_path:
+            return None
+        row = self._connect().execute(
+            'SELECT lines, expires_at FROM design_cache WHERE cache_key = ? AND expires_at > ?',
+            (key, now)
+        ).fetchone()
+        if not row:
+            return None
+        lines = json.loads(row[0])
+        self._put_memory(key, lines, row[1])
+        return lines
+
+    def put(self, key, lines):
+        expires_at = time.time() + self.ttl_seconds
+        self._put_memory(key, lines, expires_at)
+        if self.disk_path:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO design_cache (cache_key, lines, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(lines, ensure_ascii=False), expires_at)
+            )
+            conn.execute('DELETE FROM design_cache WHERE expires_at <= ?', (time.time(),))
+
+    def _put_memory(self, key, lines, expires_at):
+        with self._lock:
+            self._memory[key] = (expires_at, lines)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stream(self, key, producer):
+        """
+        包装生成器：命中时立即回放缓存，未命中时透传 producer 的输出并在成功后写入缓存
+
+        Args:
+            key: make_cache_key 生成的缓存键
+            producer: 无参函数，返回 generate_design_stream 生成器
+
+        Yields:
+            str: 与 generate_design_stream 相同格式的 JSON 行
+        """
+        cached = self.get(key)
+        if cached is not None:
+            yield json.dumps({'step': 3, 'message': '⚡ 命中设计缓存，直接返回历史方案', 'progress': 40, 'log': True}) + '\n'
+            for line in cached:
+                yield line
+            return
+
+        lines = []
+        for line in producer():
+            lines.append(line)
+            # 只缓存成功的结果，错误消息不写入缓存
+            # 调用方收到结果后可能直接关闭生成器，因此必须在 yield 之前写入
+            if json.loads(line).get('type') == 'result':
+                self.put(key, lines)
+            yield line
+
+
+design_cache = DesignCache() if DESIGN_CACHE_ENABLED else None
@@ -0,0 +1,366 @@
+# 功能：候选叠层结构预筛（规则打分，向量化枚举）
+# 设计提示词原先让模型从零构思整个叠层；这里先用材料表（禁带宽度、电子亲和能、功函数、常用厚度）
+# 枚举 顶电极 / ETL / 吸收层 / HTL / 底电极 的全部组合，一次 NumPy 广播计算所有组合的得分：
+#   bandgap           吸收层禁带宽度落在用户给定的窗口内（窗口外按距离衰减）
+#   material          吸收层与用户选择的材料一致（材料表中没有该材料时不计）
+#   etl_offset        ETL 与吸收层的导带偏移（0-0.4 eV 为最佳，反向势垒迅速扣分）
+#   htl_offset        吸收层与 HTL 的价带偏移（同上）
+#   hole_blocking     ETL 价带足够深，阻挡空穴
+#   electron_blocking HTL 导带足够浅，阻挡电子
+#   contacts          电极功函数与相邻传输层形成欧姆接触
+#   thickness         吸收层常用厚度与用户给定的厚度范围重叠
+# 得分最高的几组（默认每种吸收层取最佳的一组）作为种子写入设计提示词，缩短模型的推理过程；
+# 进度流中也会先推送这些候选结构，快速模式在 API 返回前就能看到确定的建议
+#
+# 能级均以真空能级为 0、取正值（eV）：电离能 = 电子亲和能 + 禁带宽度；
+# 内置材料表的数值为文献中的典型值，DESIGN_SPACE_MATERIALS_PATH 指向 JSON 文件时替换内置材料表
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DESIGN_SPACE_ENABLED = os.getenv('DESIGN_SPACE_ENABLED', 'true').lower() == 'true'
+# 写入提示词与进度流的候选结构数
+DESIGN_SPACE_TOP_K = int(os.getenv('DESIGN_SPACE_TOP_K', 3))
+# 自定义材料表（JSON 列表，字段同 BUILTIN_MATERIALS），留空使用内置材料表
+DESIGN_SPACE_MATERIALS_PATH = os.getenv('DESIGN_SPACE_MATERIALS_PATH', '')
+
+ROLES = ('top_electrode', 'etl', 'absorber', 'htl', 'bottom_electrode')
+ROLE_NAMES = {
+    'top_electrode': ('顶电极', '透明导电电极，收集电子'),
+    'etl': ('电子传输层', '传输电子、阻挡空穴'),
+    'absorber': ('光吸收层', '吸收入射光并产生载流子'),
+    'htl': ('空穴传输层', '传输空穴、阻挡电子'),
+    'bottom_electrode': ('底电极', '收集空穴'),
+}
+
+# 各项得分的权重
+WEIGHTS = {
+    'bandgap': 3.0,
+    'material': 2.0,
+    'etl_offset': 1.5,
+    'htl_offset': 1.5,
+    'hole_blocking': 1.0,
+    'electron_blocking': 1.0,
+    'contacts': 1.0,
+    'thickness': 1.5,
+}
+
+# 内置材料表：name, roles, bandgap, electron_affinity（电极为功函数 work_function）,
+# thickness [下限, 常用, 上限] nm, aliases（与用户输入的材料名称匹配，统一为小写、数字下标转为普通数字）
+BUILTIN_MATERIALS = [
+    # 透明顶电极
+    {'name': 'FTO', 'roles': ['top_electrode'], 'work_function': 4.4, 'thickness': [300, 400, 600]},
+    {'name': 'ITO', 'roles': ['top_electrode'], 'work_function': 4.7, 'thickness': [100, 150, 200]},
+    {'name': 'AZO', 'roles': ['top_electrode'], 'work_function': 4.5, 'thickness': [200, 300, 500]},
+    {'name': '石墨烯', 'roles': ['top_electrode'], 'work_function': 4.5, 'thickness': [0.34, 1, 3],
+     'aliases': ['石墨烯', 'graphene']},
+    # 电子传输层
+    {'name': 'TiO₂', 'roles': ['etl', 'absorber'], 'bandgap': 3.2, 'electron_affinity': 4.0,
+     'thickness': [20, 50, 300], 'aliases': ['tio2', '二氧化钛']},
+    {'name': 'SnO₂', 'roles': ['etl'], 'bandgap': 3.6, 'electron_affinity': 4.3, 'thickness': [20, 30, 60]},
+    {'name': 'ZnO', 'roles': ['etl', 'absorber'], 'bandgap': 3.3, 'electron_affinity': 4.2,
+     'thickness': [20, 40, 300], 'aliases': ['zno', '氧化锌']},
+    {'name': 'PCBM', 'roles': ['etl'], 'bandgap': 2.0, 'electron_affinity': 3.9, 'thickness': [30, 50, 80]},
+    {'name': 'C60', 'roles': ['etl'], 'bandgap': 2.0, 'electron_affinity': 4.2, 'thickness': [20, 30, 40]},
+    # 吸收层：卤化物钙钛矿
+    {'name': 'MAPbI₃', 'roles': ['absorber'], 'bandgap': 1.55, 'electron_affinity': 3.9,
+     'thickness': [300, 400, 600], 'aliases': ['mapbi3', 'ch3nh3pbi3', '钙钛矿']},
+    {'name': 'FAPbI₃', 'roles': ['absorber'], 'bandgap': 1.48, 'electron_affinity': 4.0,
+     'thickness': [300, 500, 700], 'aliases': ['fapbi3', '钙钛矿']},
+    {'name': 'MAPbBr₃', 'roles': ['absorber'], 'bandgap': 2.3, 'electron_affinity': 3.6,
+     'thickness': [300, 400, 600], 'aliases': ['mapbbr3', 'ch3nh3pbbr3', '钙钛矿']},
+    {'name': 'CsPbI₃', 'roles': ['absorber'], 'bandgap': 1.73, 'electron_affinity': 3.95,
+     'thickness': [300, 400, 500], 'aliases': ['cspbi3', '钙钛矿']},
+    {'name': 'CsPbBr₃', 'roles': ['absorber'], 'bandgap': 2.3, 'electron_affinity': 3.6,
+     'thickness': [200, 300, 500], 'aliases': ['cspbbr3', '钙钛矿']},
+    {'name': 'CsPbCl₃', 'roles': ['absorber'], 'bandgap': 3.0, 'electron_affinity': 3.4,
+     'thickness': [100, 200, 400], 'aliases': ['cspbcl3', '钙钛矿']},
+    {'name': 'CsSnI₃', 'roles': ['absorber'], 'bandgap': 1.3, 'electron_affinity': 3.9,
+     'thickness': [200, 300, 500], 'aliases': ['cssni3', '钙钛矿']},
+    # 吸收层：量子点（禁带宽度随尺寸变化，取常用尺寸的典型值）
+    {'name': 'CsPbCl₃量子点', 'roles': ['absorber'], 'bandgap': 3.05, 'electron_affinity': 3.4,
+     'thickness': [50, 100, 200], 'aliases': ['cspbcl3量子点', 'cspbcl3 qd']},
+    {'name': 'CH₃NH₃PbI₃量子点', 'roles': ['absorber'], 'bandgap': 1.7, 'electron_affinity': 3.8,
+     'thickness': [50, 100, 200], 'aliases': ['ch3nh3pbi3量子点', 'mapbi3量子点']},
+    {'name': 'CdSe量子点', 'roles': ['absorber'], 'bandgap': 2.0, 'electron_affinity': 4.0,
+     'thickness': [50, 100, 300], 'aliases': ['cdse']},
+    {'name': 'CdTe量子点', 'roles': ['absorber'], 'bandgap': 1.7, 'electron_affinity': 3.9,
+     'thickness': [50, 100, 300], 'aliases': ['cdte量子点']},
+    {'name': 'PbS量子点', 'roles': ['absorber'], 'bandgap': 1.3, 'electron_affinity': 4.1,
+     'thickness': [100, 250, 400], 'aliases': ['pbs']},
+    {'name': 'InP量子点', 'roles': ['absorber'], 'bandgap': 2.0, 'electron_affinity': 3.9,
+     'thickness': [50, 100, 200], 'aliases': ['inp量子点', 'inp qd']},
+    {'name': 'InAs量子点', 'roles': ['absorber'], 'bandgap': 1.0, 'electron_affinity': 4.4,
+     'thickness': [50, 150, 300], 'aliases': ['inas']},
+    {'name': 'CuInS₂量子点', 'roles': ['absorber'], 'bandgap': 1.8, 'electron_affinity': 3.8,
+     'thickness': [50, 150, 300], 'aliases': ['cuins2']},
+    {'name': 'AgInS₂量子点', 'roles': ['absorber'], 'bandgap': 1.9, 'electron_affinity': 3.7,
+     'thickness': [50, 150, 300], 'aliases': ['agins2']},
+    {'name': '硅量子点', 'roles': ['absorber'], 'bandgap': 1.7, 'electron_affinity': 3.8,
+     'thickness': [50, 150, 300], 'aliases': ['硅量子点', 'si qd']},
+    {'name': '锗量子点', 'roles': ['absorber'], 'bandgap': 1.2, 'electron_affinity': 4.0,
+     'thickness': [50, 150, 300], 'aliases': ['锗量子点', 'ge qd']},
+    # 吸收层：体材料与二维材料
+    {'name': '单晶硅', 'roles': ['absorber'], 'bandgap': 1.12, 'electron_affinity': 4.05,
+     'thickness': [2000, 10000, 500000], 'aliases': ['硅单晶', '单晶硅', 'c-si']},
+    {'name': '单晶锗', 'roles': ['absorber'], 'bandgap': 0.66, 'electron_affinity': 4.0,
+     'thickness': [1000, 5000, 500000], 'aliases': ['锗单晶', '单晶锗']},
+    {'name': 'GaAs', 'roles': ['absorber'], 'bandgap': 1.42, 'electron_affinity': 4.07,
+     'thickness': [500, 2000, 5000], 'aliases': ['gaas', '砷化镓']},
+    {'name': 'CdTe', 'roles': ['absorber'], 'bandgap': 1.5, 'electron_affinity': 4.28,
+     'thickness': [1000, 2000, 5000], 'aliases': ['碲化镉']},
+    {'name': 'Sb₂Se₃', 'roles': ['absorber'], 'bandgap': 1.2, 'electron_affinity': 4.04,
+     'thickness': [300, 500, 800], 'aliases': ['sb2se3', '硒化锑']},
+    {'name': 'GaN', 'roles': ['absorber'], 'bandgap': 3.4, 'electron_affinity': 4.1,
+     'thickness': [200, 1000, 3000], 'aliases': ['gan', '氮化镓']},
+    {'name': 'β-Ga₂O₃', 'roles': ['absorber'], 'bandgap': 4.8, 'electron_affinity': 4.0,
+     'thickness': [100, 300, 1000], 'aliases': ['ga2o3', '氧化镓']},
+    {'name': 'MoS₂', 'roles': ['absorber'], 'bandgap': 1.8, 'electron_affinity': 4.2,
+     'thickness': [0.65, 5, 20], 'aliases': ['mos2', '二硫化钼']},
+    {'name': 'WS₂', 'roles': ['absorber'], 'bandgap': 2.0, 'electron_affinity': 3.9,
+     'thickness': [0.7, 5, 20], 'aliases': ['ws2', '二硫化钨']},
+    {'name': '黑磷', 'roles': ['absorber'], 'bandgap': 0.3, 'electron_affinity': 4.1,
+     'thickness': [5, 20, 50], 'aliases': ['黑磷', 'black phosphorus']},
+    # 空穴传输层
+    {'name': 'Spiro-OMeTAD', 'roles': ['htl'], 'bandgap': 3.0, 'electron_affinity': 2.2,
+     'thickness': [150, 200, 300]},
+    {'name': 'PTAA', 'roles': ['htl'], 'bandgap': 2.9, 'electron_affinity': 2.3, 'thickness': [20, 40, 60]},
+    {'name': 'NiOₓ', 'roles': ['htl'], 'bandgap': 3.6, 'electron_affinity': 1.8, 'thickness': [20, 30, 60]},
+    {'name': 'PEDOT:PSS', 'roles': ['htl'], 'bandgap': 1.6, 'electron_affinity': 3.5, 'thickness': [30, 40, 80]},
+    {'name': 'CuSCN', 'roles': ['htl'], 'bandgap': 3.8, 'electron_affinity': 1.5, 'thickness': [30, 50, 80]},
+    {'name': 'P3HT', 'roles': ['htl'], 'bandgap': 2.0, 'electron_affinity': 3.0, 'thickness': [50, 100, 200]},
+    {'name': 'CuI', 'roles': ['htl'], 'bandgap': 3.1, 'electron_affinity': 2.1, 'thickness': [30, 50, 100]},
+    # 底电极
+    {'name': 'Au', 'roles': ['bottom_electrode'], 'work_function': 5.1, 'thickness': [60, 80, 100]},
+    {'name': 'Ag', 'roles': ['bottom_electrode'], 'work_function': 4.3, 'thickness': [80, 100, 120]},
+    {'name': 'Al', 'roles': ['bottom_electrode'], 'work_function': 4.2, 'thickness': [80, 100, 150]},
+    {'name': 'Cu', 'roles': ['bottom_electrode'], 'work_function': 4.6, 'thickness': [80, 100, 120]},
+    {'name': '碳电极', 'roles': ['bottom_electrode'], 'work_function': 5.0, 'thickness': [5000, 10000, 20000],
+     'aliases': ['碳电极', 'carbon']},
+]
+
+_SUBSCRIPTS = str.maketrans('₀₁₂₃₄₅₆₇₈₉ₓ', '0123456789x')
+
+
+def normalize_name(text):
+    """材料名称规范化：小写、数字下标转为普通数字、去掉空白与括号"""
+    return re.sub(r'[\s()（）]+', '', str(text or '').translate(_SUBSCRIPTS).casefold())
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _window(params, low_field, high_field):
+    """参数中的数值范围，缺失或无法解析时返回 None；上下限颠倒时自动交换"""
+    low, high = _to_float(params.get(low_field)), _to_float(params.get(high_field))
+    if low is None or high is None:
+        return None
+    return (low, high) if low <= high else (high, low)
+
+
+def _band_window(offset, low=0.0, high=0.4, below=0.15, above=0.3):
+    """能带偏移在 [low, high] 内得 1 分；反向（势垒）按 below、过大按 above 的尺度高斯衰减"""
+    return (np.exp(-(np.maximum(low - offset, 0) / below) ** 2)
+            * np.exp(-(np.maximum(offset - high, 0) / above) ** 2))
+
+
+class MaterialTable:
+    """按角色分组的材料数组（能级、厚度），供 rank_stacks 广播计算"""
+
+    def __init__(self, materials):
+        self.materials = materials
+        # 材料表内容摘要，参与设计缓存键
+        self.digest = hashlib.sha256(
+            json.dumps(materials, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        self.roles = {}
+        for role in ROLES:
+            entries = [material for material in materials if role in material['roles']]
+            if not entries:
+                raise ValueError(f'材料表中没有可用作 {role} 的材料')
+            self.roles[role] = {
+                'entries': entries,
+                'names': np.array([material['name'] for material in entries], dtype=object),
+                'bandgap': np.array([material.get('bandgap', 0.0) for material in entries]),
+                'affinity': np.array([material.get('electron_affinity', 0.0) for material in entries]),
+                'work_function': np.array([material.get('work_function', 0.0) for material in entries]),
+                'thickness': np.array([material['thickness'] for material in entries], dtype=float),
+                'aliases': [[normalize_name(alias) for alias in material.get('aliases', [material['name']])]
+                            for material in entries],
+            }
+
+    def stack_count(self):
+        """枚举的组合总数"""
+        return int(np.prod([len(self.roles[role]['entries']) for role in ROLES]))
+
+    def match_absorbers(self, material_type):
+        """与用户选择的材料匹配的吸收层（布尔数组）"""
+        text = normalize_name(material_type)
+        aliases = self.roles['absorber']['aliases']
+        return np.array([bool(text) and any(alias and alias in text for alias in names) for names in aliases])
+
+
+def load_materials(path=DESIGN_SPACE_MATERIALS_PATH):
+    if not path:
+        return BUILTIN_MATERIALS
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    """材料表只在首次使用时构建"""
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = MaterialTable(load_materials())
+        return _table
+
+
+def design_space_version():
+    """
+    预筛配置的版本（材料表摘要与候选数），未启用预筛时返回 None
+
+    候选结构写入提示词，更换材料表或候选数后，设计缓存中的旧结果不再适用
+    """
+    if not DESIGN_SPACE_ENABLED:
+        return None
+    return f'{get_table().digest[:16]}-top{DESIGN_SPACE_TOP_K}'
+
+
+def rank_stacks(params, top_k=DESIGN_SPACE_TOP_K, table=None, distinct_absorbers=True):
+    """
+    枚举全部组合并打分，返回得分最高的候选叠层结构
+
+    Args:
+        params: 设计参数（material_type、bandgap_min/max、thickness_min/max）
+        top_k: 返回的候选数
+        table: MaterialTable，默认使用内置或 DESIGN_SPACE_MATERIALS_PATH 指定的材料表
+        distinct_absorbers: 每种吸收层只保留得分最高的一组，使候选结构更多样
+
+    Returns:
+        list: [{'score', 'matched_material', 'layers': [与 design_data['layers'] 相同格式], 'scores': {各项得分}}]
+    """
+    table = table or get_table()
+    top, etl, absorber, htl, bottom = (table.roles[role] for role in ROLES)
+    # 组合轴：(顶电极, ETL, 吸收层, HTL, 底电极)
+    T, E, A, H, B = np.ix_(*(np.arange(len(table.roles[role]['entries'])) for role in ROLES))
+
+    abs_bandgap = absorber['bandgap'][A]
+    abs_affinity = absorber['affinity'][A]
+    abs_ionization = abs_affinity + abs_bandgap
+    etl_affinity = etl['affinity'][E]
+    etl_ionization = etl_affinity + etl['bandgap'][E]
+    htl_affinity = htl['affinity'][H]
+    htl_ionization = htl_affinity + htl['bandgap'][H]
+
+    scores = {}
+    window = _window(params, 'bandgap_min', 'bandgap_max')
+    if window is None:
+        scores['bandgap'] = np.ones_like(abs_bandgap)
+    else:
+        distance = np.maximum(np.maximum(window[0] - abs_bandgap, abs_bandgap - window[1]), 0)
+        scores['bandgap'] = np.exp(-distance / 0.2)
+
+    matched = table.match_absorbers(params.get('material_type'))
+    scores['material'] = matched[A].astype(float) if matched.any() else np.ones(A.shape)
+
+    # 导带偏移 = ETL 电子亲和能 - 吸收层电子亲和能（电子"下坡"进入 ETL 为正）
+    scores['etl_offset'] = _band_window(etl_affinity - abs_affinity)
+    # 价带偏移 = 吸收层电离能 - HTL 电离能（空穴"上坡"进入 HTL 为正）
+    scores['htl_offset'] = _band_window(abs_ionization - htl_ionization)
+    scores['hole_blocking'] = np.clip((etl_ionization - abs_ionization) / 0.3, 0, 1)
+    scores['electron_blocking'] = np.clip((abs_affinity - htl_affinity) / 0.3, 0, 1)
+    # n 型欧姆接触要求电极功函数不高于 ETL 的电子亲和能，p 型要求不低于 HTL 的电离能
+    scores['contacts'] = (np.exp(-(np.maximum(top['work_function'][T] - etl_affinity, 0) / 0.6) ** 2)
+                          * np.exp(-(np.maximum(htl_ionization - bottom['work_function'][B], 0) / 0.6) ** 2))
+
+    abs_thickness = absorber['thickness']
+    thickness_window = _window(params, 'thickness_min', 'thickness_max')
+    if thickness_window is None or thickness_window[1] <= 0:
+        thickness_score = np.ones(len(abs_thickness))
+        suggested = abs_thickness[:, 1]
+    else:
+        low, high = max(thickness_window[0], 1e-3), thickness_window[1]
+        overlap_low = np.maximum(abs_thickness[:, 0], low)
+        overlap_high = np.minimum(abs_thickness[:, 2], high)
+        width = np.maximum(np.minimum(abs_thickness[:, 2] - abs_thickness[:, 0], high - low), 1e-9)
+        overlap = np.clip((overlap_high - overlap_low) / width, 0, 1)
+        # 没有重叠时按对数距离衰减（相差 10 倍得 0.1 分）
+        ratio = np.maximum(abs_thickness[:, 0] / high, low / abs_thickness[:, 2])
+        thickness_score = np.where(overlap_high >= overlap_low, np.maximum(overlap, 0.5), 0.5 / np.maximum(ratio, 1))
+        suggested = np.where(overlap_high >= overlap_low,
+                             np.clip(abs_thickness[:, 1], overlap_low, overlap_high),
+                             np.clip(abs_thickness[:, 1], low, high))
+    scores['thickness'] = thickness_score[A]
+
+    total = sum(WEIGHTS[name] * score for name, score in scores.items()) / sum(WEIGHTS.values())
+    shape = tuple(len(table.roles[role]['entries']) for role in ROLES)
+    total = np.broadcast_to(total, shape).copy()
+    # 同一种材料不能同时作为两层（TiO₂、ZnO 既可作 ETL 也可作吸收层）
+    total[np.broadcast_to(etl['names'][E] == absorber['names'][A], shape)] = -np.inf
+
+    if distinct_absorbers:
+        # 每种吸收层的最佳组合，再取吸收层中得分最高的 top_k 个
+        per_absorber = np.moveaxis(total, 2, 0).reshape(shape[2], -1)
+        best = per_absorber.argmax(axis=1)
+        best_scores = per_absorber[np.arange(shape[2]), best]
+        order = np.argsort(-best_scores, kind='stable')[:top_k]
+        rest_shape = shape[:2] + shape[3:]
+        flat = []
+        for a in order:
+            t, e, h, b = np.unravel_index(best[a], rest_shape)
+            flat.append((t, e, a, h, b))
+    else:
+        count = min(top_k, total.size)
+        candidates = np.argpartition(-total.ravel(), count - 1)[:count]
+        candidates = candidates[np.argsort(-total.ravel()[candidates], kind='stable')]
+        flat = [np.unravel_index(index, shape) for index in candidates]
+
+    results = []
+    for index in flat:
+        if not np.isfinite(total[index]):
+            continue
+        layers = []
+        for role, i in zip(ROLES, index):
+            material = table.roles[role]['entries'][i]
+            name, function = ROLE_NAMES[role]
+            thickness = suggested[i] if role == 'absorber' else material['thickness'][1]
+            layers.append({
+                'name': name,
+                'material': material['name'],
+                'thickness': round(float(thickness), 2),
+                'bandgap': material.get('bandgap', 0.0),
+                'function': function,
+            })
+        results.append({
+            'score': round(float(total[index]), 4),
+            'matched_material': bool(matched[index[2]]),
+            'layers': layers,
+            'scores': {name: round(float(np.broadcast_to(score, shape)[index]), 4) for name, score in scores.items()},
+            'etl_offset': round(float(etl['affinity'][index[1]] - absorber['affinity'][index[2]]), 2),
+            'htl_offset': round(float(absorber['affinity'][index[2]] + absorber['bandgap'][index[2]]
+                                      - htl['affinity'][index[3]] - htl['bandgap'][index[3]]), 2),
+        })
+    return results
+
+
+def suggestion_message(candidates):
+    """进度流中展示的候选结构摘要"""
+    if not candidates:
+        return '🧮 材料表中没有满足条件的候选结构'
+    best = candidates[0]
+    stack = ' / '.join(f"{layer['material']} {layer['thickness']:g} nm" for layer in best['layers'])
+    return f"🧮 规则预筛最佳候选（得分 {best['score']:.2f}）：{stack}"
@@ -0,0 +1,118 @@
+# 功能：嵌入模型后端
+# 建库、增量同步、检索和示例脚本都通过 create_embeddings 获取嵌入模型，由 EMBEDDING_BACKEND 选择：
+#   dashscope  DashScope text-embedding-v4（默认，需要网络和 API 额度）
+#   local      本地哈希 n-gram 嵌入：字符 n-gram 经哈希随机投影到固定维度，结果确定、无需网络，
+#              可模拟接口延迟，用于在隔离环境中复现地测量入库和检索的吞吐
+# 两种后端都实现 LangChain Embeddings 接口，并提供批量查询的 embed_queries；
+# 模型名称（model 属性）写入向量库元数据，切换后端后需要重建向量库
+import os
+import re
+import time
+import hashlib
+import unicodedata
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import DashScopeEmbeddings
+from langchain_community.embeddings.dashscope import embed_with_retry
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'dashscope')  # dashscope / local
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-v4')
+DASHSCOPE_API_KEY = os.getenv('DASHSCOPE_API_KEY')
+
+# 本地后端参数
+LOCAL_EMBEDDING_DIM = int(os.getenv('LOCAL_EMBEDDING_DIM', 256))
+LOCAL_EMBEDDING_NGRAMS = tuple(int(n) for n in os.getenv('LOCAL_EMBEDDING_NGRAMS', '1,2,3').split(','))
+# 模拟接口延迟：每次请求固定耗时 + 每条文本耗时（毫秒）
+LOCAL_EMBEDDING_LATENCY_MS = float(os.getenv('LOCAL_EMBEDDING_LATENCY_MS', 0))
+LOCAL_EMBEDDING_PER_TEXT_MS = float(os.getenv('LOCAL_EMBEDDING_PER_TEXT_MS', 0))
+
+BACKENDS = ('dashscope', 'local')
+
+
+class DashScopeBackend(DashScopeEmbeddings):
+    """DashScope 嵌入模型，增加多条查询文本一次请求的 embed_queries"""
+
+    def embed_queries(self, texts):
+        embeddings = embed_with_retry(self, input=list(texts), text_type="query", model=self.model)
+        return [item["embedding"] for item in embeddings]
+
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    本地确定性嵌入：字符 n-gram 特征哈希（带符号）后 L2 归一化
+
+    特征哈希等价于对稀疏 n-gram 计数向量做一次稀疏随机投影，
+    文本相似度在投影后近似保留，检索结果有意义；哈希使用 blake2b，跨进程、跨机器结果一致
+
+    Args:
+        dim: 向量维度
+        ngrams: 使用的字符 n-gram 长度
+        latency_ms: 每次请求的模拟延迟
+        per_text_ms: 每条文本的模拟延迟
+    """
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM, ngrams=LOCAL_EMBEDDING_NGRAMS,
+                 latency_ms=LOCAL_EMBEDDING_LATENCY_MS, per_text_ms=LOCAL_EMBEDDING_PER_TEXT_MS):
+        self.dim = dim
+        self.dimension = dim
+        self.ngrams = tuple(ngrams)
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.model = f"local-hash-{dim}-{''.join(str(n) for n in self.ngrams)}"
+
+    def _simulate_latency(self, count):
+        delay = (self.latency_ms + self.per_text_ms * count) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+
+    def _embed(self, text):
+        text = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text).lower()).strip()
+        indices, signs = [], []
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                digest = int.from_bytes(hashlib.blake2b(text[i:i + n].encode('utf-8'), digest_size=8).digest(), 'little')
+                indices.append(digest % self.dim)
+                signs.append(1.0 if digest >> 63 else -1.0)
+        vector = np.bincount(indices, weights=signs, minlength=self.dim).astype(np.float32) if indices \
+            else np.zeros(self.dim, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def embed_documents(self, texts):
+        self._simulate_latency(len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        self._simulate_latency(len(texts))
+        return [self._embed(text) for text in texts]
+
+
+def create_embeddings(backend=None, model=None):
+    """
+    按配置创建嵌入模型
+
+    Args:
+        backend: dashscope / local，默认取 EMBEDDING_BACKEND
+        model: DashScope 模型名称，默认取 EMBEDDING_MODEL
+
+    Returns:
+        Embeddings: 带 model 属性（写入向量库元数据的模型名称）与 embed_queries 方法
+
+    Raises:
+        RuntimeError: 使用 dashscope 后端但未配置 DASHSCOPE_API_KEY
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend == 'dashscope':
+        if not DASHSCOPE_API_KEY:
+            raise RuntimeError('DashScope 嵌入需要 API 密钥，请在.env文件中设置DASHSCOPE_API_KEY'
+                               '（或设置 EMBEDDING_BACKEND=local 使用本地嵌入）')
+        return DashScopeBackend(model=model or EMBEDDING_MODEL, dashscope_api_key=DASHSCOPE_API_KEY)
+    if backend == 'local':
+        return LocalHashEmbeddings()
+    raise ValueError(f"未知的嵌入后端: {backend}（可选: {', '.join(BACKENDS)}）")
@@ -0,0 +1,386 @@
+# 功能：向量缓存
+# 检索时相同的查询文本（尤其是固定查询）每次都要调用一次 DashScope 嵌入接口，
+# 重建向量库（修改切块参数、中断后重跑、更换索引类型）也会为内容未变的区块重复付费，
+# 这里按 (模型, 维度, 规范化文本) 缓存向量：进程内 LRU + 磁盘数组文件（多进程共享）；
+# 查询向量的磁盘缓存超过行数上限时按最近使用时间压缩，文档向量供重建向量库使用，不设上限；
+# 固定查询的向量在建库时预先计算，与向量数据库保存在一起
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import unicodedata
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+from result_store import connect_sqlite
+
+load_dotenv()
+
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 1024))
+# 磁盘缓存目录，留空则只使用内存缓存
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', 'instance/embedding_cache')
+# 磁盘上查询向量的最大行数（每个 模型 + 维度），超出后只保留最近使用的 3/4；0 表示不限制
+EMBEDDING_CACHE_QUERY_MAX_ROWS = int(os.getenv('EMBEDDING_CACHE_QUERY_MAX_ROWS', 20000))
+# DashScope 嵌入维度（text-embedding-v4 默认 1024），用于在第一次调用接口前查找缓存
+EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION', 1024))
+
+# 检索时固定使用的查询，建库时预先计算向量
+STATIC_QUERIES = ("叠层光电探测器结构", "量子效率优化方法")
+
+# 与向量数据库保存在一起的文件
+QUERY_VECTORS_FILE = 'query_vectors.json'
+INDEX_VERSION_FILE = 'index_version'
+
+
+def normalize_text(text):
+    """统一 Unicode 形式并合并空白，仅空白不同的文本共用一个向量"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def _cache_key(model, dim, text):
+    return hashlib.sha256(f'{model}\n{dim}\n{normalize_text(text)}'.encode('utf-8')).hexdigest()
+
+
+class ArrayVectorCache:
+    """
+    磁盘向量缓存：向量按 (模型, 维度) 追加写入 float32 数组文件，SQLite 只保存 键 -> 行号
+
+    多进程共享：写入在 SQLite 的 BEGIN IMMEDIATE 事务中分配行号并写文件，提交后才对其他进程可见；
+    写文件后、提交前中断时，残留的行会在下次写入时被覆盖
+
+    数组文件只追加；写入时指定 max_rows 且行数超出时，把最近使用的行复制到新的数组文件
+    （file_id 递增，不复用），提交后删除旧文件，正在读取旧文件的进程读取失败时按未命中处理
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS vector_files (
+                file_id INTEGER PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (model, dim)
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                cache_key TEXT PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                row INTEGER NOT NULL,
+                last_used REAL NOT NULL DEFAULT 0
+            );
+        """)
+        # 旧版本创建的表没有 last_used 列
+        conn = self._connect()
+        if 'last_used' not in {column[1] for column in conn.execute('PRAGMA table_info(vectors)')}:
+            try:
+                conn.execute('ALTER TABLE vectors ADD COLUMN last_used REAL NOT NULL DEFAULT 0')
+            except sqlite3.OperationalError:
+                pass  # 其他进程已经添加
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_vectors_last_used ON vectors(file_id, last_used)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(os.path.join(self.directory, 'index.sqlite'))
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._local.files = {}
+        return conn
+
+    def _path(self, file_id):
+        return os.path.join(self.directory, f'vectors-{file_id}.f32')
+
+    def _file(self, file_id):
+        """每个线程各自打开文件句柄读取"""
+        self._connect()
+        f = self._local.files.get(file_id)
+        if f is None:
+            f = open(self._path(file_id), 'rb')
+            self._local.files[file_id] = f
+        return f
+
+    @staticmethod
+    def _lookup(conn, keys):
+        """{键: (file_id, 行号)}，分段查询以避开 SQLite 的参数个数上限"""
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            found.update((key, (file_id, row)) for key, file_id, row in conn.execute(
+                f"SELECT cache_key, file_id, row FROM vectors WHERE cache_key IN ({','.join('?' * len(part))})",
+                part
+            ))
+        return found
+
+    def get_many(self, model, dim, texts, touch=False):
+        """
+        批量读取，返回与 texts 对应的向量列表，未命中为 None
+
+        Args:
+            touch: 记录命中行的最近使用时间（有行数上限的缓存使用）
+        """
+        keys = [_cache_key(model, dim, text) for text in texts]
+        conn = self._connect()
+        found = self._lookup(conn, keys)
+        row_bytes = dim * 4
+        vectors = []
+        for key in keys:
+            location = found.get(key)
+            data = None
+            if location is not None:
+                try:
+                    f = self._file(location[0])
+                    f.seek(location[1] * row_bytes)
+                    data = f.read(row_bytes)
+                except OSError:
+                    pass  # 数组文件已被压缩替换
+            if data is None or len(data) != row_bytes:
+                vectors.append(None)
+                continue
+            vectors.append(np.frombuffer(data, dtype=np.float32))
+        if touch and found:
+            hits = list(found)
+            now = time.time()
+            for start in range(0, len(hits), 500):
+                part = hits[start:start + 500]
+                conn.execute(f"UPDATE vectors SET last_used = ? WHERE cache_key IN ({','.join('?' * len(part))})",
+                             [now] + part)
+        return vectors
+
+    def put_many(self, model, dim, texts, vectors, max_rows=0):
+        """
+        批量写入
+
+        Args:
+            max_rows: 该 (模型, 维度) 的最大行数，超出时压缩为最近使用的 3/4；0 表示不限制
+        """
+        if not len(texts):
+            return
+        stale_path = None
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, dim)
+        keys = [_cache_key(model, dim, text) for text in texts]
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            record = conn.execute('SELECT file_id, rows FROM vector_files WHERE model = ? AND dim = ?',
+                                  (model, dim)).fetchone()
+            if record is None:
+                file_id = conn.execute('INSERT INTO vector_files (model, dim) VALUES (?, ?)', (model, dim)).lastrowid
+                rows = 0
+            else:
+                file_id, rows = record
+            existing = self._lookup(conn, keys)
+            new = [i for i, key in enumerate(keys) if key not in existing]
+            new = list({keys[i]: i for i in new}.values())  # 同一批内的重复文本只写一次
+            if new:
+                path = self._path(file_id)
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    f.seek(rows * dim * 4)
+                    f.write(vectors[new].tobytes())
+                now = time.time()
+                conn.executemany('INSERT INTO vectors (cache_key, file_id, row, last_used) VALUES (?, ?, ?, ?)',
+                                 [(keys[i], file_id, rows + n, now) for n, i in enumerate(new)])
+                conn.execute('UPDATE vector_files SET rows = ? WHERE file_id = ?', (rows + len(new), file_id))
+                if max_rows and rows + len(new) > max_rows:
+                    stale_path = self._compact(conn, file_id, dim, rows + len(new), max(1, max_rows * 3 // 4))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if stale_path is not None:
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+    def _compact(self, conn, file_id, dim, rows, keep):
+        """
+        在写事务中把最近使用的 keep 行复制到新的数组文件，返回待删除的旧文件路径
+
+        新文件使用更大的 file_id，读取方不会把旧行号用在新文件上
+        """
+        records = conn.execute(
+            'SELECT cache_key, row, last_used FROM vectors WHERE file_id = ? ORDER BY last_used DESC LIMIT ?',
+            (file_id, keep)
+        ).fetchall()
+        records.sort(key=lambda record: record[1])  # 按行号顺序读取旧文件
+        new_id = conn.execute('SELECT MAX(file_id) FROM vector_files').fetchone()[0] + 1
+        old_path = self._path(file_id)
+        source = np.memmap(old_path, dtype=np.float32, mode='r', shape=(rows, dim))
+        source[[row for _, row, _ in records]].tofile(self._path(new_id))
+        del source
+        conn.execute('DELETE FROM vectors WHERE file_id = ?', (file_id,))
+        conn.executemany('INSERT INTO vectors (cache_key, file_id, row, last_used) VALUES (?, ?, ?, ?)',
+                         [(cache_key, new_id, n, last_used) for n, (cache_key, _, last_used) in enumerate(records)])
+        conn.execute('UPDATE vector_files SET file_id = ?, rows = ? WHERE file_id = ?', (new_id, len(records), file_id))
+        return old_path
+
+
+class EmbeddingCache:
+    """
+    两级向量缓存，键为 (模型, 维度, 规范化后的文本)
+
+    进程内 LRU 只用于查询向量；建库时的文档向量数量大，只走磁盘缓存。
+    查询向量（memory=True）的磁盘缓存不超过 query_max_rows 行，按最近使用时间淘汰
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_MAX_ENTRIES, directory=EMBEDDING_CACHE_DIR,
+                 query_max_rows=EMBEDDING_CACHE_QUERY_MAX_ROWS):
+        self.max_entries = max_entries
+        self.query_max_rows = query_max_rows
+        self.disk = ArrayVectorCache(directory) if directory else None
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # {key: np.ndarray}
+
+    def get_many(self, model, dim, texts, memory=True):
+        """批量读取，返回与 texts 对应的向量列表，未命中为 None"""
+        vectors = [None] * len(texts)
+        if memory:
+            with self._lock:
+                for i, text in enumerate(texts):
+                    key = _cache_key(model, dim, text)
+                    vector = self._memory.get(key)
+                    if vector is not None:
+                        self._memory.move_to_end(key)
+                        vectors[i] = vector
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing and self.disk is not None:
+            for i, vector in zip(missing, self.disk.get_many(model, dim, [texts[i] for i in missing], touch=memory)):
+                if vector is not None:
+                    vectors[i] = vector
+                    if memory:
+                        self._put_memory(_cache_key(model, dim, texts[i]), vector)
+        return vectors
+
+    def put_many(self, model, texts, vectors, memory=True, persist=True):
+        """
+        批量写入，维度取自向量长度
+
+        Args:
+            memory: 是否放入进程内 LRU
+            persist: 是否写入磁盘缓存；预计算向量已随索引保存，只需放入内存
+        """
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dim = vectors.shape[1]
+        if memory:
+            for text, vector in zip(texts, vectors):
+                self._put_memory(_cache_key(model, dim, text), vector)
+        if persist and self.disk is not None:
+            self.disk.put_many(model, dim, texts, vectors, max_rows=self.query_max_rows if memory else 0)
+
+    def _put_memory(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    为 LangChain 嵌入模型加上向量缓存
+
+    查询向量与文档向量（DashScope 的 text_type 不同）分开缓存；
+    embed_documents 先查磁盘缓存，只把未命中的文本交给底层模型
+    """
+
+    def __init__(self, embeddings, model, cache, dim=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+        # 后端声明了维度（本地嵌入）时直接使用；第一次拿到真实向量后以其长度为准
+        self.dim = dim or getattr(embeddings, 'dimension', None) or EMBEDDING_DIMENSION
+        self._query_model = f'{model}/query'
+        self._document_model = f'{model}/document'
+
+    def _learn_dim(self, vectors):
+        if len(vectors):
+            self.dim = len(vectors[0])
+
+    def preload_queries(self, vectors):
+        """放入预计算的查询向量 {查询: 向量}，只进内存"""
+        if vectors:
+            texts = list(vectors)
+            self.cache.put_many(self._query_model, texts, [vectors[text] for text in texts], persist=False)
+            self._learn_dim([vectors[texts[0]]])
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0].tolist()
+
+    def embed_queries(self, texts):
+        """
+        批量嵌入查询文本：未命中缓存的文本合并为一次请求
+
+        底层模型没有 embed_queries 时退化为逐条 embed_query
+        """
+        vectors = self.cache.get_many(self._query_model, self.dim, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts_to_embed = [texts[i] for i in missing]
+            if hasattr(self.embeddings, 'embed_queries'):
+                embedded = self.embeddings.embed_queries(texts_to_embed)
+            else:
+                embedded = [self.embeddings.embed_query(text) for text in texts_to_embed]
+            self._learn_dim(embedded)
+            self.cache.put_many(self._query_model, texts_to_embed, embedded)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return vectors
+
+    def lookup_documents(self, texts):
+        """只查磁盘缓存，返回与 texts 对应的向量列表，未命中为 None"""
+        return self.cache.get_many(self._document_model, self.dim, texts, memory=False)
+
+    def embed_documents(self, texts):
+        vectors = self.lookup_documents(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts_to_embed = [texts[i] for i in missing]
+            embedded = self.embeddings.embed_documents(texts_to_embed)
+            self._learn_dim(embedded)
+            self.cache.put_many(self._document_model, texts_to_embed, embedded, memory=False)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return [np.asarray(vector, dtype=np.float32).tolist() for vector in vectors]
+
+
+def save_index_metadata(index_dir, embeddings, model, queries=STATIC_QUERIES):
+    """
+    建库完成后调用：预先计算固定查询的向量，并写入新的索引版本号
+
+    版本号变化后，rag_service 中缓存的检索结果全部失效
+    """
+    vectors = {query: [float(x) for x in embeddings.embed_query(query)] for query in queries}
+    with open(os.path.join(index_dir, QUERY_VECTORS_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'model': model, 'vectors': vectors}, f, ensure_ascii=False)
+    with open(os.path.join(index_dir, INDEX_VERSION_FILE), 'w', encoding='utf-8') as f:
+        f.write(f'{int(time.time())}-{uuid.uuid4().hex[:8]}')
+
+
+def load_query_vectors(index_dir):
+    """读取预计算的固定查询向量，返回 (模型, {查询: 向量})，不存在时返回 (None, {})"""
+    path = os.path.join(index_dir, QUERY_VECTORS_FILE)
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('model'), data.get('vectors', {})
+
+
+def read_index_version(index_dir, index_file='index.faiss'):
+    """读取索引版本号；旧索引没有版本文件时，用索引文件的大小和修改时间代替"""
+    path = os.path.join(index_dir, INDEX_VERSION_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return f.read().strip()
+    stat = os.stat(os.path.join(index_dir, index_file))
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
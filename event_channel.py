@@ -0,0 +1,290 @@
+# 功能：设计任务进度事件通道（Server-Sent Events）
+# 每个任务一个环形缓冲区，事件带递增 id；客户端断线重连时携带 Last-Event-ID，
+# 服务端立即补发缺失的事件，之后继续实时推送
+#
+# gunicorn 多 worker 时，订阅请求（包括 EventSource 断线重连）可能落到没有执行该任务的 worker 上，
+# 因此事件同时写入共享的 SQLite 事件日志（默认与任务状态共用数据库）：
+# 执行任务的 worker 从内存缓冲区推送，其他 worker 轮询事件日志推送和补发
+import os
+import time
+import threading
+from itertools import islice
+from collections import deque
+from dotenv import load_dotenv
+from result_store import connect_sqlite, RESULT_STORE_PATH, RESULT_TTL_SECONDS
+
+load_dotenv()
+
+EVENT_BUFFER_SIZE = int(os.getenv('EVENT_BUFFER_SIZE', 500))
+# 任务结束后通道继续保留的时间，供断线的客户端重连补发
+EVENT_CHANNEL_RETENTION = int(os.getenv('EVENT_CHANNEL_RETENTION', 600))
+# 心跳间隔，防止反向代理因长时间无数据断开连接
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+# 共享事件日志路径（默认与任务状态共用数据库），留空则事件只保存在执行任务的进程内
+EVENT_LOG_PATH = os.getenv('EVENT_LOG_PATH', RESULT_STORE_PATH)
+# 其他 worker 轮询事件日志的间隔
+EVENT_LOG_POLL_SECONDS = float(os.getenv('EVENT_LOG_POLL_SECONDS', 0.5))
+
+
+def format_sse(data, event_id=None, event=None):
+    """按 SSE 协议格式化一条事件"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in data.splitlines() or ['']:
+        lines.append(f"data: {line}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventLog:
+    """多 worker 共享的事件日志：(task_id, event_id, data) 与事件流是否已结束"""
+
+    def __init__(self, path=EVENT_LOG_PATH, ttl_seconds=RESULT_TTL_SECONDS, poll_interval=EVENT_LOG_POLL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                task_id TEXT NOT NULL,
+                event_id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (task_id, event_id)
+            );
+            CREATE TABLE IF NOT EXISTS job_event_streams (
+                task_id TEXT PRIMARY KEY,
+                closed INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_job_event_streams_created ON job_event_streams(created_at);
+        """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(self.path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def reset(self, task_id):
+        """开始新的事件流：清除该任务以前的事件，顺带删除过期的事件流"""
+        conn = self._connect()
+        expired_before = time.time() - self.ttl_seconds
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM job_events WHERE task_id IN '
+                         '(SELECT task_id FROM job_event_streams WHERE created_at < ?) OR task_id = ?',
+                         (expired_before, task_id))
+            conn.execute('DELETE FROM job_event_streams WHERE created_at < ? OR task_id = ?',
+                         (expired_before, task_id))
+            conn.execute('INSERT INTO job_event_streams (task_id, closed, created_at) VALUES (?, 0, ?)',
+                         (task_id, time.time()))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def append(self, task_id, event_id, data):
+        self._connect().execute('INSERT OR REPLACE INTO job_events (task_id, event_id, data) VALUES (?, ?, ?)',
+                                (task_id, event_id, data))
+
+    def close(self, task_id):
+        self._connect().execute('UPDATE job_event_streams SET closed = 1 WHERE task_id = ?', (task_id,))
+
+    def exists(self, task_id):
+        return self._connect().execute(
+            'SELECT 1 FROM job_event_streams WHERE task_id = ?', (task_id,)).fetchone() is not None
+
+    def is_closed(self, task_id):
+        row = self._connect().execute(
+            'SELECT closed FROM job_event_streams WHERE task_id = ?', (task_id,)).fetchone()
+        return bool(row and row[0])
+
+    def read(self, task_id, after=0, until=None):
+        """id 大于 after（且小于 until）的事件，按 id 排序"""
+        if until is None:
+            return self._connect().execute(
+                'SELECT event_id, data FROM job_events WHERE task_id = ? AND event_id > ? ORDER BY event_id',
+                (task_id, after)).fetchall()
+        return self._connect().execute(
+            'SELECT event_id, data FROM job_events WHERE task_id = ? AND event_id > ? AND event_id < ? '
+            'ORDER BY event_id', (task_id, after, until)).fetchall()
+
+    def tail(self, task_id, last_event_id=0, heartbeat=SSE_HEARTBEAT_SECONDS, alive=None):
+        """
+        轮询订阅事件日志（任务由其他 worker 执行时使用）
+
+        Args:
+            alive: 可选的无参函数，返回 False 表示生产者已不存在（例如所在进程退出），读完剩余事件后结束
+
+        Yields:
+            tuple | None: (event_id, data)，或表示心跳的 None
+        """
+        cursor = last_event_id
+        idle_since = time.time()
+        while True:
+            # 先判断是否结束再读取，结束前写入的事件不会漏掉
+            finished = self.is_closed(task_id) or (alive is not None and not alive())
+            rows = self.read(task_id, cursor)
+            for event_id, data in rows:
+                cursor = event_id
+                yield event_id, data
+            if finished:
+                return
+            if rows:
+                idle_since = time.time()
+            elif time.time() - idle_since >= heartbeat:
+                idle_since = time.time()
+                yield None
+            time.sleep(self.poll_interval)
+
+
+class EventChannel:
+    """单个任务的事件环形缓冲区（提供事件日志时同时写入日志）"""
+
+    def __init__(self, maxlen=EVENT_BUFFER_SIZE, task_id=None, log=None):
+        self.task_id = task_id
+        self.log = log
+        self._events = deque(maxlen=maxlen)  # [(event_id, data)]
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self.closed = False
+        self.closed_at = None
+
+    def publish(self, data):
+        """追加一条事件并唤醒所有订阅者，返回事件 id"""
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            if self.log is not None:
+                self.log.append(self.task_id, event_id, data)
+            self._events.append((event_id, data))
+            self._cond.notify_all()
+        return event_id
+
+    def close(self):
+        """任务结束，订阅者读完剩余事件后退出"""
+        with self._cond:
+            self.closed = True
+            self.closed_at = time.time()
+            if self.log is not None:
+                self.log.close(self.task_id)
+            self._cond.notify_all()
+
+    def _pending(self, cursor):
+        """返回 id 大于 cursor 的事件，id 连续递增，因此可以直接按偏移定位"""
+        if not self._events:
+            return []
+        first_id = self._events[0][0]
+        start = max(0, cursor - first_id + 1)
+        pending = list(islice(self._events, start, None))
+        # 已被挤出环形缓冲区的事件从事件日志补发
+        if cursor + 1 < first_id and self.log is not None:
+            pending = [tuple(row) for row in self.log.read(self.task_id, cursor, first_id)] + pending
+        return pending
+
+    def subscribe(self, last_event_id=0, heartbeat=SSE_HEARTBEAT_SECONDS):
+        """
+        订阅事件
+
+        Args:
+            last_event_id: 客户端已收到的最后一个事件 id，之后的事件会立即补发
+            heartbeat: 无新事件时返回 None 的间隔（秒），调用方据此发送心跳
+
+        Yields:
+            tuple | None: (event_id, data)，或表示心跳的 None
+        """
+        cursor = last_event_id
+        while True:
+            with self._cond:
+                pending = self._pending(cursor)
+                if not pending:
+                    if self.closed:
+                        return
+                    self._cond.wait(timeout=heartbeat)
+                    pending = self._pending(cursor)
+                    if not pending and self.closed:
+                        return
+            if not pending:
+                yield None
+                continue
+            for event_id, data in pending:
+                cursor = event_id
+                yield event_id, data
+
+
+class EventChannelRegistry:
+    """进程内的任务通道注册表；提供事件日志时，本进程没有的任务从日志订阅"""
+
+    def __init__(self, retention=EVENT_CHANNEL_RETENTION, log=None):
+        self.retention = retention
+        self.log = log
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def get(self, task_id):
+        with self._lock:
+            return self._channels.get(task_id)
+
+    def get_or_create(self, task_id):
+        """
+        获取任务通道，不存在时创建
+
+        Returns:
+            tuple: (channel, created)，created 为 True 时调用方负责启动生产者
+        """
+        with self._lock:
+            self._sweep()
+            channel = self._channels.get(task_id)
+            if channel is not None:
+                return channel, False
+            channel = EventChannel(task_id=task_id, log=self.log)
+            if self.log is not None:
+                self.log.reset(task_id)
+            self._channels[task_id] = channel
+            return channel, True
+
+    def has_stream(self, task_id):
+        """本进程或事件日志中是否有该任务的事件流"""
+        return self.get(task_id) is not None or (self.log is not None and self.log.exists(task_id))
+
+    def is_closed(self, task_id):
+        """任务的事件流是否已正常结束（生产者发布了全部事件）"""
+        channel = self.get(task_id)
+        if channel is not None:
+            return channel.closed
+        return self.log is not None and self.log.is_closed(task_id)
+
+    def subscribe(self, task_id, last_event_id=0, heartbeat=SSE_HEARTBEAT_SECONDS, alive=None):
+        """
+        订阅任务事件：本进程执行的任务直接读内存缓冲区，否则轮询事件日志
+
+        Args:
+            alive: 见 EventLog.tail，只用于轮询事件日志
+
+        Yields:
+            tuple | None: (event_id, data)，或表示心跳的 None
+        """
+        channel = self.get(task_id)
+        if channel is not None:
+            yield from channel.subscribe(last_event_id, heartbeat)
+        elif self.log is not None:
+            yield from self.log.tail(task_id, last_event_id, heartbeat, alive)
+
+    def _sweep(self):
+        """移除已结束且超过保留时间的通道"""
+        now = time.time()
+        expired = [task_id for task_id, channel in self._channels.items()
+                   if channel.closed and now - channel.closed_at > self.retention]
+        for task_id in expired:
+            del self._channels[task_id]
+
+
+channels = EventChannelRegistry(log=EventLog() if EVENT_LOG_PATH else None)
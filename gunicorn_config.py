@@ -15,8 +15,8 @@ worker_class = "gevent"
 # 线程数（仅当 worker_class = "gthread" 时有效）
 threads = 2
 
-# 超时时间：600秒 (AI生成内容耗时较长，必须设置较大的超时时间，否则会报502错误)
-timeout = 600
+# 超时时间：设计任务由后台任务引擎执行，进度通道带心跳，不再需要为长时间生成保持超大超时
+timeout = 120
 
 # Worker 临时目录
 worker_tmp_dir = "/dev/shm"
@@ -39,3 +39,13 @@ limit_request_field_size = 8190
 
 # 响应超时（秒）- 用于流式响应
 graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    """
+    worker 进程启动后再开启结果清理线程
+
+    preload_app = True 时应用在 master 中导入，fork 之前启动的线程不会被 worker 继承
+    """
+    from app import result_store
+    result_store.start_cleanup_thread()
@@ -0,0 +1,198 @@
+# 功能：入库清单
+# 与向量库保存在一起（vector_db/manifest.sqlite），记录每个 PDF 的内容哈希、
+# 每个区块的内容哈希以及对应的向量行号，使增量入库可以重复执行：
+#   - 文件内容未变且区块都已入库：跳过，不解析也不调用嵌入接口
+#   - 新文件：解析并嵌入
+#   - 内容变化的文件：删除旧向量后重新入库
+#   - 上次中断或嵌入失败的文件：重新解析，只嵌入还没有向量的区块
+#   - 已删除的文件（prune）：删除其向量
+# 近似重复的区块共用同一行号（见 near_dup.py），只有不再被任何区块引用的行才会被删除
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+MANIFEST_FILE = 'manifest.sqlite'
+
+
+def file_hash(path, block_size=1 << 20):
+    """文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text, metadata):
+    """区块内容哈希，包含页码，避免不同页的相同文本被视为同一区块"""
+    return hashlib.sha256(f"{metadata.get('page')}\x00{text}".encode('utf-8')).hexdigest()
+
+
+def normalize_path(path):
+    return os.path.normpath(path)
+
+
+class IngestManifest:
+    """
+    入库清单
+
+    files  表：path、file_hash、parsed（是否已完整解析）
+    chunks 表：(path, seq) -> chunk_hash、row（向量行号，NULL 表示尚未嵌入）
+
+    清单的修改在 commit 时提交；流水线先让向量库落盘再提交清单，
+    清单中的行号因此一定已经持久化
+    """
+
+    def __init__(self, index_dir):
+        os.makedirs(index_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(index_dir, MANIFEST_FILE))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                file_hash TEXT,
+                parsed INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                path TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                row INTEGER,
+                PRIMARY KEY (path, seq)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_row ON chunks (row);
+        """)
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+
+    def bootstrap(self, index_dir):
+        """
+        为没有清单的已有向量库生成清单：按片段元数据中的 source 归组，
+        并假设向量库与磁盘上的文件内容一致
+        """
+        from vector_store import DOCSTORE_FILE
+        docstore = sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))
+        seqs = {}
+        for row, content, metadata in docstore.execute('SELECT id, page_content, metadata FROM chunks ORDER BY id'):
+            metadata = json.loads(metadata)
+            source = metadata.get('source')
+            if not source:
+                continue
+            path = normalize_path(source)
+            seq = seqs.get(path, 0)
+            seqs[path] = seq + 1
+            self.conn.execute('INSERT OR REPLACE INTO chunks (path, seq, chunk_hash, row) VALUES (?, ?, ?, ?)',
+                              (path, seq, chunk_hash(content, metadata), row))
+        docstore.close()
+        now = time.time()
+        for path in seqs:
+            digest = file_hash(path) if os.path.exists(path) else None
+            self.conn.execute('INSERT OR REPLACE INTO files (path, file_hash, parsed, updated_at) VALUES (?, ?, 1, ?)',
+                              (path, digest, now))
+        self.conn.commit()
+        return len(seqs)
+
+    def _rows(self, path):
+        return [row for (row,) in self.conn.execute(
+            'SELECT row FROM chunks WHERE path = ? AND row IS NOT NULL', (path,))]
+
+    def _unreferenced(self, rows):
+        """过滤掉仍被其他区块引用的行号（近似重复的区块共用一行）"""
+        return [row for row in dict.fromkeys(rows) if row is not None and self.conn.execute(
+            'SELECT 1 FROM chunks WHERE row = ? LIMIT 1', (row,)).fetchone() is None]
+
+    def _forget(self, path):
+        self.conn.execute('DELETE FROM chunks WHERE path = ?', (path,))
+        self.conn.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def plan(self, paths, prune=False):
+        """
+        对比文件哈希，决定本次需要处理的文件
+
+        Args:
+            paths: 本次入库范围内的 PDF 路径
+            prune: 是否删除清单中存在、但已不在 paths 中的文件
+
+        Returns:
+            tuple: (需要解析的路径列表, 需要删除的向量行号列表, 各类文件计数)
+        """
+        todo, stale_rows = [], []
+        counts = {'new': 0, 'changed': 0, 'resumed': 0, 'unchanged': 0, 'removed': 0}
+        now = time.time()
+        wanted = set()
+        for path in paths:
+            path = normalize_path(path)
+            wanted.add(path)
+            digest = file_hash(path)
+            record = self.conn.execute('SELECT file_hash, parsed FROM files WHERE path = ?', (path,)).fetchone()
+            if record is None:
+                counts['new'] += 1
+            elif record[0] != digest:
+                counts['changed'] += 1
+                stale_rows.extend(self._rows(path))
+                self._forget(path)
+            else:
+                pending = self.conn.execute(
+                    'SELECT 1 FROM chunks WHERE path = ? AND row IS NULL LIMIT 1', (path,)).fetchone()
+                if record[1] and pending is None:
+                    counts['unchanged'] += 1
+                    continue
+                counts['resumed'] += 1
+            self.conn.execute(
+                'INSERT OR REPLACE INTO files (path, file_hash, parsed, updated_at) VALUES (?, ?, 0, ?)',
+                (path, digest, now))
+            todo.append(path)
+
+        if prune:
+            for (path,) in self.conn.execute('SELECT path FROM files').fetchall():
+                if path not in wanted:
+                    counts['removed'] += 1
+                    stale_rows.extend(self._rows(path))
+                    self._forget(path)
+        return todo, self._unreferenced(stale_rows), counts
+
+    def record_chunk(self, path, seq, digest):
+        """
+        记录解析出的第 seq 个区块
+
+        Returns:
+            tuple: (是否需要嵌入, 需要删除的旧向量行号或 None)
+        """
+        existing = self.conn.execute(
+            'SELECT chunk_hash, row FROM chunks WHERE path = ? AND seq = ?', (path, seq)).fetchone()
+        if existing is not None and existing[0] == digest and existing[1] is not None:
+            return False, None
+        self.conn.execute('INSERT OR REPLACE INTO chunks (path, seq, chunk_hash, row) VALUES (?, ?, ?, NULL)',
+                          (path, seq, digest))
+        stale = existing[1] if existing is not None and existing[0] != digest else None
+        if stale is not None and not self._unreferenced([stale]):
+            stale = None
+        return True, stale
+
+    def mark_embedded(self, items):
+        """items: [((path, seq), row)]"""
+        self.conn.executemany('UPDATE chunks SET row = ? WHERE path = ? AND seq = ?',
+                              [(row, path, seq) for (path, seq), row in items])
+
+    def mark_parsed(self, path, chunk_count):
+        """
+        文件已完整解析：删除序号超出本次区块数的旧记录（切块参数变化时可能出现）
+
+        Returns:
+            list: 需要删除的向量行号
+        """
+        stale = [row for (row,) in self.conn.execute(
+            'SELECT row FROM chunks WHERE path = ? AND seq >= ? AND row IS NOT NULL', (path, chunk_count))]
+        self.conn.execute('DELETE FROM chunks WHERE path = ? AND seq >= ?', (path, chunk_count))
+        self.conn.execute('UPDATE files SET parsed = 1, updated_at = ? WHERE path = ?', (time.time(), path))
+        return self._unreferenced(stale)
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
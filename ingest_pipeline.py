@@ -0,0 +1,343 @@
+# 功能：PDF 入库流水线
+# 分三个阶段流式处理，阶段之间用有界队列连接，峰值内存与语料规模无关：
+#   1. 解析：进程池逐页解析 PDF 并切块，每页的片段立即放入有界队列（队列满时子进程阻塞）
+#   2. 嵌入：先查磁盘向量缓存（embedding_cache.py），未命中的区块按批并发调用嵌入接口，
+#      发出前经过令牌桶限流（RPM / TPM），在途批次数有上限
+#   3. 写入：嵌入结果直接追加到 vector_store 格式的向量库，不再逐批构建临时 FAISS 索引再合并
+# 配合入库清单（ingest_manifest.py）时只嵌入新增或变化的区块，见 sync
+# 嵌入之前先做近似重复检测（near_dup.py）：与已有区块几乎相同的区块不再嵌入，只记录出处
+# 重建整个 data/ 语料的耗时由嵌入接口配额决定，而不是单线程的解析和串行请求
+import os
+import queue
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_core.documents import Document
+from dotenv import load_dotenv
+from rate_limit import TokenBucket
+from vector_store import VectorStoreWriter, store_exists
+from ingest_manifest import IngestManifest, chunk_hash
+from near_dup import NearDupIndex, NEAR_DUP_ENABLED, provenance
+
+load_dotenv()
+
+INGEST_PARSE_WORKERS = int(os.getenv('INGEST_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+INGEST_EMBED_CONCURRENCY = int(os.getenv('INGEST_EMBED_CONCURRENCY', 4))
+# text-embedding-v4 单次请求最多 10 条文本
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 10))
+# 解析阶段与嵌入阶段之间最多缓冲的页数
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 64))
+# 每写入多少批提交一次检查点（向量落盘 + 入库清单提交），中断后从最近的检查点继续
+INGEST_CHECKPOINT_BATCHES = int(os.getenv('INGEST_CHECKPOINT_BATCHES', 20))
+# 嵌入接口配额，0 表示不限流；token 数按字符数估算（中文约 1 字 1 token，英文偏保守）
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', 600))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', 1000000))
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SEPARATORS = ['\n\n', '\n', '.', ' ', ""]
+
+# 解析子进程的全局状态，由 _init_worker 设置
+_queue = None
+_splitter = None
+
+
+def list_pdfs(folder):
+    """递归列出文件夹下的 PDF，按路径排序"""
+    paths = []
+    for root, _, files in os.walk(folder):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith('.pdf'))
+    return sorted(paths)
+
+
+def _init_worker(result_queue, chunk_size, chunk_overlap):
+    global _queue, _splitter
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    _queue = result_queue
+    _splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS
+    )
+
+
+def _parse_file(path):
+    """子进程：逐页解析并切块，每页的片段立即放入队列"""
+    from langchain_community.document_loaders import PyPDFLoader
+    pages = 0
+    try:
+        for page in PyPDFLoader(path).lazy_load():
+            chunks = _splitter.split_documents([page])
+            _queue.put(('chunks', path, [(chunk.page_content, chunk.metadata) for chunk in chunks]))
+            pages += 1
+    except Exception as e:
+        _queue.put(('error', path, str(e)))
+        return
+    _queue.put(('done', path, pages))
+
+
+def iter_chunks(paths, workers=INGEST_PARSE_WORKERS, queue_size=INGEST_QUEUE_SIZE,
+                chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    多进程解析 PDF，按页产出切块结果
+
+    Yields:
+        tuple: ('chunks', 文件路径, [(文本, 元数据)])  每页一次
+               ('done', 文件路径, 页数)                 文件解析完成
+               ('error', 文件路径, 错误信息)            文件解析失败
+    """
+    if not paths:
+        return
+    context = multiprocessing.get_context()
+    result_queue = context.Queue(maxsize=queue_size)
+    pool = ProcessPoolExecutor(max_workers=max(1, min(workers, len(paths))), mp_context=context,
+                               initializer=_init_worker, initargs=(result_queue, chunk_size, chunk_overlap))
+    finished = False
+    try:
+        futures = {pool.submit(_parse_file, path): path for path in paths}
+        remaining = set(paths)
+        while remaining:
+            try:
+                kind, path, payload = result_queue.get(timeout=1)
+            except queue.Empty:
+                # 子进程异常退出（例如进程池损坏）时不会发送 done，这里补发错误，避免永久等待
+                for future, path in futures.items():
+                    if path in remaining and future.done() and future.exception() is not None:
+                        remaining.discard(path)
+                        yield 'error', path, str(future.exception())
+                continue
+            if kind != 'chunks':
+                remaining.discard(path)
+            yield kind, path, payload
+        finished = True
+    finally:
+        if finished:
+            pool.shutdown(wait=True)
+        else:
+            # 消费方出错或提前关闭生成器：子进程可能正阻塞在已满队列的 put() 上，
+            # shutdown(wait=True) 会永久等待，这里取消未开始的文件并终止子进程
+            processes = list((pool._processes or {}).values())
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join(timeout=5)
+            result_queue.cancel_join_thread()
+            result_queue.close()
+
+
+def ingest(paths, index_dir, embeddings, model, manifest=None, stale_rows=(), near_dup=None,
+           parse_workers=INGEST_PARSE_WORKERS, embed_concurrency=INGEST_EMBED_CONCURRENCY,
+           batch_size=INGEST_BATCH_SIZE, queue_size=INGEST_QUEUE_SIZE, rpm=EMBEDDING_RPM, tpm=EMBEDDING_TPM):
+    """
+    将 PDF 解析、嵌入并追加到 index_dir 的向量库（不存在时新建）
+
+    Args:
+        paths: PDF 路径列表
+        index_dir: vector_store 格式的向量库目录
+        embeddings: LangChain 嵌入模型（使用 embed_documents）；
+                    为 CachedEmbeddings 时先查向量缓存，只把未命中的区块交给嵌入接口
+        model: 嵌入模型名称，写入向量库元数据
+        manifest: IngestManifest，提供时跳过已入库的区块并记录新区块的行号
+        stale_rows: 需要删除的旧向量行号
+        near_dup: NearDupIndex，提供时近似重复的区块映射到已有的行，不再嵌入（需要同时提供 manifest）
+
+    Returns:
+        dict: 统计信息（文件数、页数、片段数、跳过数、缓存命中数、近似重复数、失败数、耗时）
+    """
+    requests_bucket = TokenBucket.per_minute(rpm)
+    tokens_bucket = TokenBucket.per_minute(tpm)
+    stats = {'files': 0, 'failed_files': 0, 'pages': 0, 'chunks': 0, 'skipped': 0,
+             'embedded': 0, 'cached': 0, 'duplicates': 0, 'failed_chunks': 0, 'deleted': 0}
+    started = time.time()
+    # 向量库不存在时在第一批嵌入完成后按向量维度新建，此时也不会有需要删除的旧向量
+    writer = VectorStoreWriter(index_dir) if store_exists(index_dir) else None
+    seqs = {}
+    batches_since_checkpoint = 0
+    # 近似重复检测需要清单记录共用的行号
+    near_dup = near_dup if manifest is not None else None
+    # 待嵌入区块的键 -> 与它近似重复、等它写入后共用行号的区块 [(键, 元数据)]
+    waiting = {}
+
+    def delete(rows):
+        rows = [row for row in rows if row is not None]
+        if rows and writer is not None:
+            writer.delete(rows)
+            stats['deleted'] += len(rows)
+            if near_dup is not None:
+                near_dup.remove_rows(rows)
+
+    def checkpoint():
+        # 先让向量落盘，再提交近似重复索引和清单
+        if writer is not None:
+            writer.flush()
+        if near_dup is not None:
+            near_dup.commit()
+        if manifest is not None:
+            manifest.commit()
+
+    def deduplicate(text, metadata, key):
+        """近似重复的区块映射到已有的行或等待中的区块，返回 True；否则登记为新的去重目标"""
+        signature = near_dup.signature(text)
+        target = near_dup.find(signature)
+        if target is None:
+            near_dup.add_pending(key, signature)
+            return False
+        kind, value = target
+        if kind == 'row':
+            writer.add_duplicates(value, [provenance(metadata)])
+            manifest.mark_embedded([(key, value)])
+        else:
+            waiting.setdefault(value, []).append((key, metadata))
+        stats['duplicates'] += 1
+        return True
+
+    def embed(batch):
+        requests_bucket.acquire()
+        tokens_bucket.acquire(sum(len(text) for text, _, _ in batch))
+        return embeddings.embed_documents([text for text, _, _ in batch])
+
+    def write(batch, vectors):
+        nonlocal writer, batches_since_checkpoint
+        if writer is None:
+            writer = VectorStoreWriter(index_dir, dim=len(vectors[0]), model=model)
+        rows = writer.add(vectors, [Document(page_content=text, metadata=metadata) for text, metadata, _ in batch])
+        if manifest is not None:
+            manifest.mark_embedded([(key, row) for (_, _, key), row in zip(batch, rows)])
+        if near_dup is not None:
+            for (_, _, key), row in zip(batch, rows):
+                near_dup.commit_row(key, row)
+                duplicates = waiting.pop(key, ())
+                if duplicates:
+                    writer.add_duplicates(row, [provenance(metadata) for _, metadata in duplicates])
+                    manifest.mark_embedded([(duplicate, row) for duplicate, _ in duplicates])
+        stats['embedded'] += len(batch)
+        batches_since_checkpoint += 1
+        if batches_since_checkpoint >= INGEST_CHECKPOINT_BATCHES:
+            checkpoint()
+            batches_since_checkpoint = 0
+
+    def collect(future):
+        batch = inflight.pop(future)
+        try:
+            vectors = future.result()
+        except Exception as e:
+            # 清单中这些区块（以及等待与它们共用行号的重复区块）仍没有行号，下次运行时会重新嵌入
+            stats['failed_chunks'] += len(batch)
+            if near_dup is not None:
+                for _, _, key in batch:
+                    near_dup.discard(key)
+                    stats['failed_chunks'] += len(waiting.pop(key, ()))
+            print(f"  ✗ {len(batch)} 个区块嵌入失败: {e}")
+            return
+        write(batch, vectors)
+
+    def resolve(items):
+        """命中缓存的区块直接写入，未命中的凑满整批再提交嵌入"""
+        nonlocal batch
+        if not items:
+            return
+        cached = lookup([text for text, _, _ in items]) if lookup else [None] * len(items)
+        hits = [(item, vector) for item, vector in zip(items, cached) if vector is not None]
+        if hits:
+            write([item for item, _ in hits], [vector for _, vector in hits])
+            stats['cached'] += len(hits)
+        batch.extend(item for item, vector in zip(items, cached) if vector is None)
+        while len(batch) >= batch_size:
+            submit(batch[:batch_size])
+            batch = batch[batch_size:]
+
+    def submit(batch):
+        # 在途批次达到上限时先等待完成，反压到解析阶段
+        while len(inflight) >= embed_concurrency * 2:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+        inflight[executor.submit(embed, batch)] = batch
+
+    lookup = getattr(embeddings, 'lookup_documents', None)
+    inflight = {}
+    pending, batch = [], []
+    chunks = iter_chunks(paths, parse_workers, queue_size)
+    try:
+        delete(stale_rows)
+        with ThreadPoolExecutor(max_workers=embed_concurrency) as executor:
+            for kind, path, payload in chunks:
+                if kind == 'chunks':
+                    stats['pages'] += 1
+                    stats['chunks'] += len(payload)
+                    for text, metadata in payload:
+                        key = (path, seqs.get(path, 0))
+                        seqs[path] = key[1] + 1
+                        if manifest is not None:
+                            needed, stale = manifest.record_chunk(path, key[1], chunk_hash(text, metadata))
+                            delete([stale])
+                            if not needed:
+                                stats['skipped'] += 1
+                                continue
+                            if near_dup is not None and deduplicate(text, metadata, key):
+                                continue
+                        pending.append((text, metadata, key))
+                        if len(pending) >= batch_size:
+                            resolve(pending)
+                            pending = []
+                elif kind == 'done':
+                    stats['files'] += 1
+                    if manifest is not None:
+                        delete(manifest.mark_parsed(path, seqs.get(path, 0)))
+                    print(f"  ✓ {os.path.basename(path)}：{payload} 页")
+                else:
+                    stats['failed_files'] += 1
+                    print(f"  ✗ {os.path.basename(path)} 解析失败: {payload}")
+            resolve(pending)
+            if batch:
+                submit(batch)
+            while inflight:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+    finally:
+        # 出错时立即关闭解析阶段（终止子进程），不等到生成器被回收
+        chunks.close()
+        if writer is not None:
+            writer.close()
+        if near_dup is not None:
+            near_dup.commit()
+        if manifest is not None:
+            manifest.commit()
+
+    stats['seconds'] = time.time() - started
+    return stats
+
+
+def sync(paths, index_dir, embeddings, model, prune=False, near_dup=NEAR_DUP_ENABLED, **kwargs):
+    """
+    按入库清单增量同步：只处理新增、内容变化或上次未完成的文件，
+    内容变化和（prune 时）已删除文件的旧向量会被删除；
+    near_dup 为 True 时近似重复的区块合并到已有的行（NEAR_DUP_ENABLED）
+
+    可以重复执行；中断或嵌入失败后再次运行即从断点继续
+
+    Returns:
+        dict: ingest 的统计信息，另含 plan（各类文件计数）
+    """
+    manifest = IngestManifest(index_dir)
+    near_dup = NearDupIndex(index_dir) if near_dup else None
+    try:
+        if manifest.is_empty() and store_exists(index_dir):
+            count = manifest.bootstrap(index_dir)
+            print(f"已根据现有向量库生成入库清单（{count} 个文件）")
+        if near_dup is not None and near_dup.is_empty() and store_exists(index_dir):
+            count = near_dup.bootstrap(index_dir)
+            print(f"已为现有向量库计算近似重复签名（{count} 个区块）")
+        todo, stale_rows, plan = manifest.plan(paths, prune=prune)
+        print(f"新增 {plan['new']} / 变化 {plan['changed']} / 续传 {plan['resumed']} / "
+              f"未变 {plan['unchanged']} / 删除 {plan['removed']} 个文件")
+        stats = ingest(todo, index_dir, embeddings, model, manifest=manifest, stale_rows=stale_rows,
+                       near_dup=near_dup, **kwargs)
+    finally:
+        if near_dup is not None:
+            near_dup.close()
+        manifest.close()
+    stats['plan'] = plan
+    return stats
@@ -0,0 +1,232 @@
+# 功能：后台设计任务引擎
+# 设计任务由有界线程池执行，与 HTTP 连接解耦：关闭页面或代理超时不会中断已付费的生成；
+# 任务状态写入 SQLite，所有 gunicorn worker 都能查询
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from result_store import connect_sqlite, RESULT_STORE_PATH, RESULT_TTL_SECONDS
+from event_channel import channels
+
+load_dotenv()
+
+DESIGN_JOB_WORKERS = int(os.getenv('DESIGN_JOB_WORKERS', 4))
+DESIGN_JOB_QUEUE_LIMIT = int(os.getenv('DESIGN_JOB_QUEUE_LIMIT', 32))
+# 运行中的任务每隔多少秒刷新心跳并检查取消请求
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', 2))
+# 运行中的任务心跳超过该时间未更新，视为所在进程已退出
+# 推理模型首个 token 之前可能长时间没有输出，因此阈值需要足够大
+JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 600))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueueFullError(Exception):
+    """排队任务数超过上限"""
+
+
+class JobEngine:
+    """
+    设计任务引擎
+
+    Args:
+        runner: 任务执行函数 runner(task_id, params, cancelled)，逐条生成 JSON 进度行；
+                包含 redirect 的消息表示成功，step 为 -1 的消息表示失败；
+                cancelled 为无参函数，任务取消后返回 True，runner 应在阻塞调用前后检查
+        max_workers: 同时运行的任务数
+        queue_limit: 本进程允许排队的最大任务数
+        db_path: 任务状态数据库路径（默认与结果存储共用）
+    """
+
+    def __init__(self, runner, max_workers=DESIGN_JOB_WORKERS, queue_limit=DESIGN_JOB_QUEUE_LIMIT,
+                 db_path=RESULT_STORE_PATH):
+        self.runner = runner
+        self.max_workers = max_workers
+        self.queue_limit = queue_limit
+        self.db_path = db_path
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._cancel_flags = {}  # 本进程内任务的取消标记 {task_id: threading.Event}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                task_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                params TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
+        """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(self.db_path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _get_executor(self):
+        """线程池按进程创建，preload_app 时 fork 之前不会启动任何线程"""
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='design-job')
+                self._executor_pid = os.getpid()
+                self._cancel_flags = {}
+            return self._executor
+
+    def _set_state(self, task_id, state, error=None):
+        self._connect().execute(
+            'UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE task_id = ?',
+            (state, error, time.time(), task_id)
+        )
+
+    def submit(self, task_id, params):
+        """
+        提交设计任务，立即返回
+
+        Raises:
+            JobQueueFullError: 本进程排队任务过多
+        """
+        executor = self._get_executor()
+        with self._lock:
+            if task_id in self._cancel_flags:
+                return
+            if len(self._cancel_flags) >= self.max_workers + self.queue_limit:
+                raise JobQueueFullError('当前设计任务过多，请稍后再试')
+            self._cancel_flags[task_id] = threading.Event()
+
+        now = time.time()
+        conn = self._connect()
+        conn.execute('DELETE FROM jobs WHERE created_at < ?', (now - RESULT_TTL_SECONDS,))
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (task_id, state, params, error, created_at, updated_at) '
+            'VALUES (?, ?, ?, NULL, ?, ?)',
+            (task_id, QUEUED, json.dumps(params, ensure_ascii=False), now, now)
+        )
+        channel, _ = channels.get_or_create(task_id)
+        channel.publish(json.dumps({'step': 0, 'message': '⏳ 任务已进入队列', 'progress': 5, 'log': True}))
+        executor.submit(self._run, task_id, params, channel)
+
+    def _run(self, task_id, params, channel):
+        cancel_flag = self._cancel_flags.get(task_id) or threading.Event()
+        state, error = FAILED, '设计流程意外结束'
+        stop_watch = threading.Event()
+        try:
+            if self._is_cancelled(task_id, cancel_flag):
+                state, error = CANCELLED, None
+                channel.publish(json.dumps({'step': -1, 'error': '设计任务已取消', 'progress': 0}))
+                return
+
+            self._connect().execute(
+                'UPDATE jobs SET state = ?, updated_at = ? WHERE task_id = ? AND state = ?',
+                (RUNNING, time.time(), task_id, QUEUED)
+            )
+            # 文献检索、等待首个 token 等阻塞期间没有进度行，由监视线程刷新心跳并检查取消请求
+            threading.Thread(target=self._watch, args=(task_id, cancel_flag, stop_watch),
+                             name='design-job-watch', daemon=True).start()
+            lines = self.runner(task_id, params, cancelled=cancel_flag.is_set)
+            try:
+                for line in lines:
+                    if cancel_flag.is_set():
+                        break
+                    line = line.rstrip('\n')
+                    channel.publish(line)
+                    data = json.loads(line)
+                    if data.get('redirect'):
+                        state, error = DONE, None
+                    elif data.get('step') == -1:
+                        state, error = FAILED, data.get('error')
+            finally:
+                lines.close()
+            if cancel_flag.is_set() and state != DONE:
+                state, error = CANCELLED, None
+                channel.publish(json.dumps({'step': -1, 'error': '设计任务已取消', 'progress': 0}))
+        except Exception as e:
+            state, error = FAILED, str(e)
+            channel.publish(json.dumps({'step': -1, 'error': f'系统错误: {str(e)}', 'progress': 0}))
+        finally:
+            stop_watch.set()
+            # 先结束事件流再写入最终状态：其他 worker 的订阅者看到任务结束时，事件日志中已有全部事件
+            channel.close()
+            self._set_state(task_id, state, error)
+            with self._lock:
+                self._cancel_flags.pop(task_id, None)
+
+    def _watch(self, task_id, cancel_flag, stop):
+        """定期刷新心跳并检查取消请求（包括其他 worker 发出的取消），发现取消时设置取消标记"""
+        while not stop.wait(JOB_HEARTBEAT_SECONDS):
+            if self._is_cancelled(task_id, cancel_flag):
+                cancel_flag.set()
+                return
+            self._connect().execute(
+                'UPDATE jobs SET updated_at = ? WHERE task_id = ? AND state = ?',
+                (time.time(), task_id, RUNNING)
+            )
+
+    def _is_cancelled(self, task_id, cancel_flag):
+        if cancel_flag is not None and cancel_flag.is_set():
+            self._set_state(task_id, CANCELLED)
+            return True
+        row = self._connect().execute('SELECT state FROM jobs WHERE task_id = ?', (task_id,)).fetchone()
+        return bool(row) and row[0] == CANCELLED
+
+    def cancel(self, task_id):
+        """
+        取消任务；本进程的任务立即停止，其他 worker 的任务在下一次心跳检查时停止
+
+        Returns:
+            bool: 任务存在且尚未结束时返回 True
+        """
+        cursor = self._connect().execute(
+            'UPDATE jobs SET state = ?, updated_at = ? WHERE task_id = ? AND state IN (?, ?)',
+            (CANCELLED, time.time(), task_id, QUEUED, RUNNING)
+        )
+        with self._lock:
+            cancel_flag = self._cancel_flags.get(task_id)
+        if cancel_flag is not None:
+            cancel_flag.set()
+        return cursor.rowcount > 0
+
+    def status(self, task_id):
+        """
+        查询任务状态（任意 worker 均可查询）
+
+        Returns:
+            dict | None: {'task_id', 'state', 'error', 'created_at', 'updated_at'}
+        """
+        row = self._connect().execute(
+            'SELECT state, error, created_at, updated_at FROM jobs WHERE task_id = ?', (task_id,)
+        ).fetchone()
+        if not row:
+            return None
+        state, error, created_at, updated_at = row
+        # 所在进程已退出的任务不会再更新心跳
+        if state == RUNNING and time.time() - updated_at > JOB_STALE_SECONDS:
+            state, error = FAILED, '设计任务所在进程已退出'
+        return {
+            'task_id': task_id,
+            'state': state,
+            'error': error,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+    def is_local(self, task_id):
+        """任务是否由本进程执行（本进程持有其事件通道）"""
+        return channels.get(task_id) is not None
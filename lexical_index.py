@@ -0,0 +1,205 @@
+# 功能：BM25 词法索引
+# 向量检索每次都要先调用一次嵌入接口，DashScope 慢或不可用时整个 RAG 检索被阻塞；
+# 这里在建库时为同一批文本片段构建 BM25 倒排索引，检索完全在本地完成（无网络请求），
+# 可以单独使用（lexical），也可以与向量检索按倒数排名融合（hybrid，见 rag_service）
+#
+# 分词：英文/数字按单词切分（材料名如 TiO2、MAPbI3 保持完整），中文连续片段切成字二元组，
+# 不依赖中文分词词典
+# 存储：倒排表为 CSR 格式的 numpy 数组（词 -> 行号 int32 / 词频 uint16），检索时 mmap 只读打开，
+# 多个 worker 共享页缓存；行号与 vector_store 一致
+#
+# 用法：python lexical_index.py [vector_db]
+import os
+import re
+import sys
+import json
+import sqlite3
+import unicodedata
+from collections import Counter
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LEXICAL_META_FILE = 'lexical_meta.json'
+LEXICAL_TERMS_FILE = 'lexical_terms.json'
+LEXICAL_OFFSETS_FILE = 'lexical_offsets.npy'
+LEXICAL_ROWS_FILE = 'lexical_rows.npy'
+LEXICAL_TFS_FILE = 'lexical_tfs.npy'
+LEXICAL_DOCLEN_FILE = 'lexical_doclen.npy'
+LEXICAL_FILES = (LEXICAL_META_FILE, LEXICAL_TERMS_FILE, LEXICAL_OFFSETS_FILE,
+                 LEXICAL_ROWS_FILE, LEXICAL_TFS_FILE, LEXICAL_DOCLEN_FILE)
+
+# 分词规则变化时递增，旧索引需要重建
+TOKENIZER_VERSION = 1
+
+BM25_K1 = float(os.getenv('BM25_K1', 1.2))
+BM25_B = float(os.getenv('BM25_B', 0.75))
+# 查询只保留 idf 最高的若干个词：设计提示词很长，大量模板词出现在几乎所有片段中，既慢又没有区分度
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv('LEXICAL_MAX_QUERY_TERMS', 64))
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+|[㐀-䶿一-鿿豈-﫿]+')
+
+
+def tokenize(text):
+    """英文/数字按单词，中文按字二元组（单字片段保留单字）"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize('NFKC', text or '').lower()):
+        token = match.group()
+        if token[0] < '\u0080':
+            tokens.append(token)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+def build_lexical_index(index_dir):
+    """
+    从 vector_store 的文本库（docstore.sqlite）构建 BM25 索引；已删除的行不在文本库中，不会被索引
+
+    Returns:
+        dict: 索引元数据
+    """
+    from vector_store import DOCSTORE_FILE, read_meta
+
+    count = read_meta(index_dir)['count']
+    doclen = np.zeros(count, dtype=np.uint32)
+    vocabulary = {}
+    term_ids, rows, tfs = [], [], []
+    conn = sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))
+    try:
+        for row, content in conn.execute('SELECT id, page_content FROM chunks WHERE id < ? ORDER BY id', (count,)):
+            counts = Counter(tokenize(content))
+            doclen[row] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                tfs.append(min(tf, 65535))
+    finally:
+        conn.close()
+
+    term_ids = np.asarray(term_ids, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int32)
+    tfs = np.asarray(tfs, dtype=np.uint16)
+    # 按 (词, 行号) 排序后得到 CSR 倒排表
+    order = np.lexsort((rows, term_ids))
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+
+    docs = int((doclen > 0).sum())
+    meta = {
+        'count': count,
+        'docs': docs,
+        'terms': len(vocabulary),
+        'postings': int(len(rows)),
+        'avgdl': float(doclen.sum() / docs) if docs else 0.0,
+        'tokenizer': TOKENIZER_VERSION,
+    }
+    np.save(os.path.join(index_dir, LEXICAL_OFFSETS_FILE), offsets)
+    np.save(os.path.join(index_dir, LEXICAL_ROWS_FILE), rows[order])
+    np.save(os.path.join(index_dir, LEXICAL_TFS_FILE), tfs[order])
+    np.save(os.path.join(index_dir, LEXICAL_DOCLEN_FILE), doclen)
+    with open(os.path.join(index_dir, LEXICAL_TERMS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(list(vocabulary), f, ensure_ascii=False)
+    # 元数据最后写入，加载时以它为准
+    with open(os.path.join(index_dir, LEXICAL_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+class LexicalIndex:
+    """只读的 BM25 索引，search 的返回格式与向量检索一致（行号与 vector_store 相同）"""
+
+    def __init__(self, index_dir, k1=BM25_K1, b=BM25_B, max_query_terms=LEXICAL_MAX_QUERY_TERMS):
+        with open(os.path.join(index_dir, LEXICAL_META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, LEXICAL_TERMS_FILE), encoding='utf-8') as f:
+            self.vocabulary = {term: i for i, term in enumerate(json.load(f))}
+        self.offsets = np.load(os.path.join(index_dir, LEXICAL_OFFSETS_FILE), mmap_mode='r')
+        self.rows = np.load(os.path.join(index_dir, LEXICAL_ROWS_FILE), mmap_mode='r')
+        self.tfs = np.load(os.path.join(index_dir, LEXICAL_TFS_FILE), mmap_mode='r')
+        self.doclen = np.load(os.path.join(index_dir, LEXICAL_DOCLEN_FILE), mmap_mode='r')
+        self.count = self.meta['count']
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+        # 每行的长度归一化项 k1 * (1 - b + b * dl / avgdl) 预先算好
+        avgdl = self.meta['avgdl'] or 1.0
+        self._norm = (k1 * (1 - b + b * np.asarray(self.doclen, dtype=np.float32) / avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return self.count
+
+    def _query_terms(self, query):
+        """查询中在索引里出现过的词 -> (起止位置, idf)，只保留 idf 最高的 max_query_terms 个"""
+        docs = self.meta['docs']
+        terms = []
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            df = end - start
+            terms.append((np.log(1 + (docs - df + 0.5) / (df + 0.5)), start, end))
+        terms.sort(reverse=True)
+        return terms[:self.max_query_terms]
+
+    def search(self, queries, k, exclude=None):
+        """
+        BM25 检索
+
+        Args:
+            queries: 查询文本列表
+            k: 每个查询返回的条数
+            exclude: 可选的布尔数组（长度为 count），为 True 的行不返回（例如索引构建后删除的行）
+
+        Returns:
+            list: 与 queries 对应的 [(行号, 分数)]，按分数从高到低
+        """
+        results = []
+        for query in queries:
+            scores = np.zeros(self.count, dtype=np.float32)
+            for idf, start, end in self._query_terms(query):
+                rows = self.rows[start:end]
+                tf = self.tfs[start:end].astype(np.float32)
+                scores[rows] += np.float32(idf) * tf * (self.k1 + 1) / (tf + self._norm[rows])
+            if exclude is not None:
+                scores[exclude[:self.count]] = 0
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            results.append([(int(row), float(scores[row])) for row in candidates])
+        return results
+
+
+def remove_lexical_index(index_dir):
+    for name in LEXICAL_FILES:
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_lexical_index(index_dir, count):
+    """加载 BM25 索引，不存在、分词规则已变化或与向量条数不一致时返回 None"""
+    path = os.path.join(index_dir, LEXICAL_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('count') != count or meta.get('tokenizer') != TOKENIZER_VERSION:
+        print(f"警告：BM25 索引与向量库不一致，词法检索不可用（运行 python lexical_index.py 重建）")
+        return None
+    return LexicalIndex(index_dir)
+
+
+def main():
+    index_dir = sys.argv[1] if len(sys.argv) > 1 else 'vector_db'
+    meta = build_lexical_index(index_dir)
+    print(f"✓ BM25 索引已构建：{meta['docs']} 个片段，{meta['terms']} 个词，{meta['postings']} 条倒排记录")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# 功能：入库时的近似重复区块检测（MinHash + LSH）
+# 切块重叠 200 字符，不同论文又常有几乎相同的背景介绍，近乎相同的片段会挤满检索的 top-k；
+# 这里在嵌入之前为每个区块计算 MinHash 签名，按 LSH 分段找出候选，估计 Jaccard 相似度
+# 达到阈值的区块不再嵌入，直接映射到已有的行（入库清单中多个区块共用同一行号），
+# 并把来源（source / page）追加到该行元数据的 duplicates 中，保留全部出处
+#
+# 分词与 BM25 一致（lexical_index.tokenize），以连续 NEAR_DUP_SHINGLE 个词为一个 shingle，
+# shingle 用 crc32 哈希，跨进程结果一致，签名可以持久化
+# 存储：与向量库保存在一起（vector_db/near_dup.sqlite），行号与 vector_store 一致；
+# 本次运行中尚未写入向量库的区块只保存在内存中，写入后转为持久记录
+import os
+import json
+import zlib
+import sqlite3
+import hashlib
+import numpy as np
+from dotenv import load_dotenv
+from lexical_index import tokenize
+
+load_dotenv()
+
+NEAR_DUP_FILE = 'near_dup.sqlite'
+
+NEAR_DUP_ENABLED = os.getenv('NEAR_DUP_ENABLED', 'true').lower() == 'true'
+# 估计的 Jaccard 相似度达到该值视为重复
+NEAR_DUP_THRESHOLD = float(os.getenv('NEAR_DUP_THRESHOLD', 0.85))
+NEAR_DUP_NUM_PERM = int(os.getenv('NEAR_DUP_NUM_PERM', 128))
+NEAR_DUP_SHINGLE = int(os.getenv('NEAR_DUP_SHINGLE', 3))
+
+# 哈希函数 (a * x + b) mod p，x 为 32 位 shingle 哈希，a < 2^29 保证乘积不溢出 uint64
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# 置换参数固定，签名格式变化时递增，旧的签名需要重建
+SIGNATURE_VERSION = 1
+
+
+def choose_bands(num_perm, threshold):
+    """
+    选择 LSH 分段数 b 与每段行数 r（b * r = num_perm）
+
+    候选概率曲线的拐点约为 (1 / b) ** (1 / r)，取不超过阈值的最大拐点：偏向召回，
+    候选再按签名估计的相似度过滤
+    """
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1])) if below else options[-1]
+
+
+class MinHasher:
+    """MinHash 签名：num_perm 个哈希函数下 shingle 哈希的最小值"""
+
+    def __init__(self, num_perm=NEAR_DUP_NUM_PERM, shingle=NEAR_DUP_SHINGLE, seed=SIGNATURE_VERSION):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle = shingle
+        self._a = rng.integers(1, 1 << 29, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)[:, None]
+
+    def shingles(self, text):
+        tokens = tokenize(text)
+        n = self.shingle
+        if len(tokens) <= n:
+            return {' '.join(tokens)} if tokens else set()
+        return {' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+    def signature(self, text):
+        """
+        Returns:
+            np.ndarray: (num_perm,) uint64；没有任何词的文本返回 None（不参与去重）
+        """
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((self._a * hashes[None, :] + self._b) % _MERSENNE_PRIME).min(axis=1)
+
+
+def similarity(a, b):
+    """两个签名估计的 Jaccard 相似度"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class NearDupIndex:
+    """
+    近似重复索引
+
+    signatures 表：row -> 签名
+    buckets    表：LSH 桶 -> row（桶 = 分段序号与该段签名的哈希）
+
+    本次运行中待嵌入的区块用任意可哈希的键登记（add_pending），写入向量库后转为行号（commit_row）；
+    修改在 commit 时提交，流水线先让向量库落盘再提交
+    """
+
+    def __init__(self, index_dir, threshold=NEAR_DUP_THRESHOLD, num_perm=NEAR_DUP_NUM_PERM,
+                 shingle=NEAR_DUP_SHINGLE):
+        self.hasher = MinHasher(num_perm, shingle)
+        self.threshold = threshold
+        self.bands, self.rows_per_band = choose_bands(num_perm, threshold)
+        self.conn = sqlite3.connect(os.path.join(index_dir, NEAR_DUP_FILE))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS signatures (
+                row INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                bucket INTEGER NOT NULL,
+                row INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket);
+            CREATE INDEX IF NOT EXISTS buckets_row ON buckets (row);
+        """)
+        settings = json.dumps({'version': SIGNATURE_VERSION, 'num_perm': num_perm, 'shingle': shingle,
+                               'bands': self.bands}, sort_keys=True)
+        stored = self.conn.execute("SELECT value FROM settings WHERE key = 'signature'").fetchone()
+        if stored is not None and stored[0] != settings:
+            # 签名参数变化后旧签名不可比较，清空后由 bootstrap 重建
+            self.conn.execute('DELETE FROM signatures')
+            self.conn.execute('DELETE FROM buckets')
+        self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('signature', ?)", (settings,))
+        self.conn.commit()
+        self._pending = {}
+        self._pending_buckets = {}
+
+    def is_empty(self):
+        return self.conn.execute('SELECT 1 FROM signatures LIMIT 1').fetchone() is None
+
+    def signature(self, text):
+        return self.hasher.signature(text)
+
+    def _buckets(self, signature):
+        r = self.rows_per_band
+        return [int.from_bytes(hashlib.blake2b(band.to_bytes(2, 'little') + signature[band * r:(band + 1) * r].tobytes(),
+                                               digest_size=8).digest(), 'little', signed=True)
+                for band in range(self.bands)]
+
+    def find(self, signature):
+        """
+        查找与签名相似度达到阈值的已登记区块
+
+        Returns:
+            tuple: ('row', 行号) 或 ('pending', 键)，相似度最高者；没有时返回 None
+        """
+        if signature is None:
+            return None
+        buckets = self._buckets(signature)
+        candidates = {}
+        for bucket in buckets:
+            for key in self._pending_buckets.get(bucket, ()):
+                candidates[('pending', key)] = self._pending[key][0]
+        placeholders = ','.join('?' * len(buckets))
+        for row, blob in self.conn.execute(
+                f'SELECT row, signature FROM signatures WHERE row IN '
+                f'(SELECT row FROM buckets WHERE bucket IN ({placeholders}))', buckets):
+            candidates[('row', row)] = np.frombuffer(blob, dtype=np.uint64)
+        best, best_score = None, self.threshold
+        for target, other in candidates.items():
+            score = similarity(signature, other)
+            if score >= best_score:
+                best, best_score = target, score
+        return best
+
+    def add_pending(self, key, signature):
+        """登记本次运行中等待嵌入的区块"""
+        if signature is None:
+            return
+        buckets = self._buckets(signature)
+        self._pending[key] = (signature, buckets)
+        for bucket in buckets:
+            self._pending_buckets.setdefault(bucket, []).append(key)
+
+    def discard(self, key):
+        """嵌入失败的区块不再作为重复目标"""
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        for bucket in entry[1]:
+            keys = self._pending_buckets.get(bucket)
+            if keys is not None:
+                keys.remove(key)
+                if not keys:
+                    del self._pending_buckets[bucket]
+
+    def commit_row(self, key, row):
+        """待嵌入的区块已写入向量库第 row 行"""
+        entry = self._pending.get(key)
+        if entry is None:
+            return
+        self.discard(key)
+        self.add_row(row, entry[0])
+
+    def add_row(self, row, signature):
+        if signature is None:
+            return
+        self.conn.execute('INSERT OR REPLACE INTO signatures (row, signature) VALUES (?, ?)',
+                          (row, signature.tobytes()))
+        self.conn.executemany('INSERT INTO buckets (bucket, row) VALUES (?, ?)',
+                              [(bucket, row) for bucket in self._buckets(signature)])
+
+    def remove_rows(self, rows):
+        """已删除的行不再作为重复目标"""
+        params = [(int(row),) for row in rows]
+        self.conn.executemany('DELETE FROM signatures WHERE row = ?', params)
+        self.conn.executemany('DELETE FROM buckets WHERE row = ?', params)
+
+    def bootstrap(self, index_dir):
+        """为已有向量库的全部片段计算签名（旧库中已存在的重复片段不会被合并）"""
+        from vector_store import DOCSTORE_FILE, read_meta
+        count = read_meta(index_dir)['count']
+        docstore = sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))
+        added = 0
+        try:
+            for row, content in docstore.execute('SELECT id, page_content FROM chunks WHERE id < ? ORDER BY id', (count,)):
+                signature = self.signature(content)
+                if signature is not None:
+                    self.add_row(row, signature)
+                    added += 1
+        finally:
+            docstore.close()
+        self.conn.commit()
+        return added
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def provenance(metadata):
+    """重复区块的出处，追加到保留片段元数据的 duplicates 中"""
+    return {name: metadata[name] for name in ('source', 'page') if name in metadata}
@@ -0,0 +1,110 @@
+# 功能：DeepSeek 上下文缓存命中统计
+# DeepSeek 按请求前缀自动缓存，usage 中返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens；
+# 每次设计请求的用量随进度流返回，这里按模型累计，供 /api/stats/prompt-cache 查看
+# 提示词布局调整（见 prompts.py）是否让固定前缀真正命中缓存，可以直接从命中率看出
+# 统计默认写入 SQLite（多 worker 共享），PROMPT_CACHE_STATS_PATH 留空则只统计本进程
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from result_store import connect_sqlite
+
+load_dotenv()
+
+PROMPT_CACHE_STATS_PATH = os.getenv('PROMPT_CACHE_STATS_PATH', 'instance/prompt_cache_stats.db')
+
+USAGE_FIELDS = ('prompt_tokens', 'prompt_cache_hit_tokens', 'prompt_cache_miss_tokens', 'completion_tokens')
+
+
+def usage_summary(usage):
+    """
+    从 API 返回的 usage 中提取 token 用量
+
+    Returns:
+        dict | None: USAGE_FIELDS 各项的 token 数，usage 为空时返回 None
+    """
+    if usage is None:
+        return None
+    return {field: int(getattr(usage, field, 0) or 0) for field in USAGE_FIELDS}
+
+
+def hit_rate(summary):
+    """提示词 token 中命中缓存的比例"""
+    total = summary['prompt_cache_hit_tokens'] + summary['prompt_cache_miss_tokens']
+    return summary['prompt_cache_hit_tokens'] / total if total else 0.0
+
+
+class PromptCacheStats:
+    """按模型累计的请求数与 token 用量：进程内计数 + 可选的 SQLite 共享计数"""
+
+    def __init__(self, path=PROMPT_CACHE_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = {}  # {model: {'requests': n, 字段: token 数}}
+        self._local = threading.local()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connect().executescript("""
+                CREATE TABLE IF NOT EXISTS prompt_cache_stats (
+                    model TEXT PRIMARY KEY,
+                    requests INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    prompt_cache_hit_tokens INTEGER NOT NULL DEFAULT 0,
+                    prompt_cache_miss_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                );
+            """)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(self.path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def record(self, model, summary):
+        """累计一次请求的用量（summary 为 usage_summary 的返回值）"""
+        if summary is None:
+            return
+        if self.path:
+            self._connect().execute(f"""
+                INSERT INTO prompt_cache_stats (model, requests, {', '.join(USAGE_FIELDS)}, updated_at)
+                VALUES (?, 1, {', '.join('?' * len(USAGE_FIELDS))}, ?)
+                ON CONFLICT(model) DO UPDATE SET requests = requests + 1,
+                    {', '.join(f'{field} = {field} + excluded.{field}' for field in USAGE_FIELDS)},
+                    updated_at = excluded.updated_at
+            """, (model, *(summary[field] for field in USAGE_FIELDS), time.time()))
+            return
+        with self._lock:
+            totals = self._memory.setdefault(model, dict.fromkeys(('requests', *USAGE_FIELDS), 0))
+            totals['requests'] += 1
+            for field in USAGE_FIELDS:
+                totals[field] += summary[field]
+
+    def summary(self):
+        """
+        Returns:
+            dict: {'models': {模型: 累计用量与命中率}, 'total': 全部模型合计}
+        """
+        if self.path:
+            rows = self._connect().execute(
+                f"SELECT model, requests, {', '.join(USAGE_FIELDS)} FROM prompt_cache_stats").fetchall()
+            models = {row[0]: dict(zip(('requests', *USAGE_FIELDS), row[1:])) for row in rows}
+        else:
+            with self._lock:
+                models = {model: dict(totals) for model, totals in self._memory.items()}
+        total = dict.fromkeys(('requests', *USAGE_FIELDS), 0)
+        for totals in models.values():
+            for field in total:
+                total[field] += totals[field]
+            totals['hit_rate'] = round(hit_rate(totals), 4)
+        total['hit_rate'] = round(hit_rate(total), 4)
+        return {'models': models, 'total': total}
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,171 @@
+# 功能：提示词构建
+# 设计提示词模板与 RAG 增强消息的组装集中在这里，app.py / deepseek_api.py 共用，
+# benchmarks/run_benchmarks.py 也直接调用这些函数测量提示词构建耗时
+#
+# 消息布局按 DeepSeek 上下文缓存（按请求前缀命中）设计：系统提示词、设计要求与 JSON 格式等
+# 固定内容全部放在 system 消息中，构成所有请求共享的前缀；检索到的文献和设计参数这些
+# 每次都不同的内容放在最后的 user 消息中，命中情况见 prompt_cache_stats.py
+
+# 提示词模板版本，修改本文件中的任何模板时需要递增，使旧的设计缓存失效
+DESIGN_PROMPT_VERSION = '2026.10.2'
+
+
+SYSTEM_PROMPT = """你是一位专业的光电探测器设计专家，精通半导体物理、材料科学和光电器件工程。
+你的任务是根据用户提供的参数，设计一个高性能的叠层光电探测器。
+
+设计时需要考虑：
+1. 材料的禁带宽度与目标波长的匹配
+2. 各层厚度对光吸收和载流子收集的影响
+3. 异质结界面的能带匹配
+4. 暗电流的抑制
+5. 量子效率的优化
+
+请严格按照JSON格式输出设计结果，包含layers（层结构）、performance（性能参数）、optimization_suggestions（优化建议）和explanation（设计说明）。
+"""
+
+SYSTEM_PROMPT_WITH_RAG = """你是一位专业的光电探测器设计专家，精通半导体物理、材料科学和光电器件工程。
+你的任务是根据用户提供的参数和学术文献资料，设计一个高性能的叠层光电探测器。
+
+**重要要求**：
+1. 你必须参考提供的【学术文献】中的设计思路、材料选择和性能参数
+2. 设计方案应基于文献中的实验数据和理论分析
+3. 在 explanation 字段中明确说明你参考了哪些文献内容，以及如何应用这些知识
+4. 优化建议应结合文献中的最新研究成果
+
+设计时需要考虑：
+1. 材料的禁带宽度与目标波长的匹配（参考文献中的材料特性）
+2. 各层厚度对光吸收和载流子收集的影响（参考文献中的优化参数）
+3. 异质结界面的能带匹配（参考文献中的界面工程）
+4. 暗电流的抑制（参考文献中的抑制策略）
+5. 量子效率的优化（参考文献中的效率提升方法）
+
+请严格按照JSON格式输出设计结果，包含layers（层结构）、performance（性能参数）、optimization_suggestions（优化建议）和explanation（设计说明，必须引用文献）。
+"""
+
+
+DESIGN_INSTRUCTIONS = """请务必包含完整的层叠结构，必须明确包含以下功能层：
+1. 顶电极 (Top Electrode)
+2. 电子传输层 (Electron Transport Layer, ETL)
+3. 光吸收层 (Absorber Layer) - **特别要求**：光吸收层尽量少使用单一均质材料,或者使用层数少于2层的复合结构。
+4. 空穴传输层 (Hole Transport Layer, HTL)
+5. 底电极 (Bottom Electrode)
+以及其他必要的缓冲层或接触层。
+
+**重要提示**：
+- 请只返回实际的功能薄膜层（电极、传输层、吸收层等）。
+- **严禁**在 `layers` 列表中包含衬底（Substrate），如玻璃（Glass）、硅片（Silicon Wafer）、蓝宝石等。衬底应默认为支撑结构，不参与层叠结构的定义。
+
+请严格按照以下JSON格式返回设计结果（注意：thickness和bandgap必须是纯数字，不要带单位）：
+{
+    "layers": [
+        {
+            "name": "层名称",
+            "material": "材料名称",
+            "thickness": 100,
+            "bandgap": 1.5,
+            "function": "功能描述",
+            "fabrication_process": "制备工艺",
+            "alternative_materials": [
+                {"material": "备选材料1", "bandgap": 1.4, "pros": "优点描述", "cons": "缺点描述"},
+                {"material": "备选材料2", "bandgap": 1.6, "pros": "优点描述", "cons": "缺点描述"}
+            ]
+        }
+    ],
+    "performance": {
+        "wavelength_range": [400, 1000],
+        "responsivity_data": [[400, 0.5], [600, 0.8]],
+        "quantum_efficiency": 85,
+        "quantum_efficiency_type": "EQE",
+        "dark_current": 1e-9
+    },
+    "optimization_suggestions": ["建议1", "建议2"],
+    "explanation": "设计说明"
+}
+
+**关键要求**：
+1. 所有数值字段(thickness, bandgap等)必须是数字，不要加单位或文字说明
+2. alternative_materials数组中每个对象必须包含: material(字符串), bandgap(数字), pros(字符串), cons(字符串)
+3. 每层提供2-3个备选材料
+4. 不要在说明中包含参考文献标记"""
+
+# 设计请求的 system 消息：所有请求共享的固定前缀
+DESIGN_SYSTEM_PROMPT = SYSTEM_PROMPT + "\n" + DESIGN_INSTRUCTIONS
+DESIGN_SYSTEM_PROMPT_WITH_RAG = SYSTEM_PROMPT_WITH_RAG + "\n" + DESIGN_INSTRUCTIONS
+
+
+def build_design_prompt(params, candidates=None):
+    """
+    根据设计参数构建设计需求（可变部分，放在消息末尾；固定的要求与格式见 DESIGN_INSTRUCTIONS）
+
+    Args:
+        params: 设计参数（material_type、bandgap_min/max、thickness_min/max、target_application、additional_requirements）
+        candidates: design_space.rank_stacks 预筛的候选结构，作为种子附在设计需求之后
+
+    Returns:
+        str: 设计需求
+    """
+    material_type = params.get('material_type')
+    bandgap_min = params.get('bandgap_min')
+    bandgap_max = params.get('bandgap_max')
+    thickness_min = params.get('thickness_min')
+    thickness_max = params.get('thickness_max')
+    target_application = params.get('target_application')
+    additional_requirements = params.get('additional_requirements', '')
+
+    return f"""请设计一个叠层光电探测器，参数如下：
+材料类型: {material_type}
+禁带宽度范围: {bandgap_min}-{bandgap_max} eV
+厚度范围: {thickness_min}-{thickness_max} nm
+目标应用: {target_application}
+额外要求: {additional_requirements}""" + format_seed_candidates(candidates)
+
+
+def format_seed_candidates(candidates):
+    """将预筛的候选结构格式化为设计需求的附加段落，没有候选时返回空字符串"""
+    if not candidates:
+        return ""
+    lines = [
+        f"{i+1}. " + " / ".join(f"{layer['material']} {layer['thickness']:g} nm" for layer in candidate['layers'])
+        + f"（导带偏移 {candidate['etl_offset']:g} eV，价带偏移 {candidate['htl_offset']:g} eV）"
+        for i, candidate in enumerate(candidates)
+    ]
+    return "\n\n按能带对齐、禁带宽度窗口与厚度约束预筛的候选结构（顶电极 / ETL / 吸收层 / HTL / 底电极，可作为设计起点，不必照搬）：\n" + "\n".join(lines)
+
+
+def format_references(documents):
+    """将检索到的文献片段格式化为提示词中的【参考文献片段 n】列表"""
+    return "\n\n".join([
+        f"【参考文献片段 {i+1}】\n{doc.page_content}"
+        for i, doc in enumerate(documents)
+    ])
+
+
+def build_design_messages(prompt, academic_refs=""):
+    """
+    组装设计请求的消息列表：固定内容在前（system），有文献时使用 RAG 系统提示词；
+    文献和设计需求在后（user）
+
+    Args:
+        prompt: build_design_prompt 生成的设计提示词
+        academic_refs: 格式化后的文献片段，为空时使用标准设计模式
+
+    Returns:
+        list: [system, user] 消息
+    """
+    if academic_refs:
+        system_prompt = DESIGN_SYSTEM_PROMPT_WITH_RAG
+        enhanced_prompt = f"""【学术文献】
+{academic_refs}
+
+【设计需求】
+{prompt}
+
+请基于以上学术文献和设计需求，给出专业的探测器设计方案。在设计说明中请明确引用文献内容。"""
+    else:
+        system_prompt = DESIGN_SYSTEM_PROMPT
+        enhanced_prompt = prompt
+
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': enhanced_prompt}
+    ]
@@ -1,47 +1,224 @@
 # author:LiamWu
 # beginDate:2025/12/01
 # 功能：RAG 核心服务模块，用于设计增强
+# 检索模式（可按请求选择）：
+#   vector   向量检索（需要调用嵌入接口）
+#   lexical  BM25 词法检索，完全在本地完成，无网络请求
+#   hybrid   两者按倒数排名融合（RRF）；嵌入接口失败或超时时只使用词法结果
+# 向量检索失败时，只要 BM25 索引可用就退回词法检索
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import DashScopeEmbeddings
 from dotenv import load_dotenv
+from embedding_backend import create_embeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings, load_query_vectors, read_index_version
+from vector_store import MmapVectorStore, LegacyFaissStore, store_exists, META_FILE
+from lexical_index import load_lexical_index
 
 load_dotenv()
 
-# 配置 API Key
-DASHSCOPE_API_KEY = os.getenv('DASHSCOPE_API_KEY', 'sk-69122c7a6960491685c6edc87c028dfa')
-os.environ["DASHSCOPE_API_KEY"] = DASHSCOPE_API_KEY
+VECTOR_DB_PATH = "vector_db"
+# 检索结果缓存条数（按 索引版本 + 查询 + k 缓存），0 表示不缓存
+RAG_RESULT_CACHE_SIZE = int(os.getenv('RAG_RESULT_CACHE_SIZE', 256))
+# 每个查询返回的片段数、合并去重后最多保留的片段数
+RAG_PER_QUERY_K = int(os.getenv('RAG_PER_QUERY_K', 5))
+RAG_REFERENCE_LIMIT = int(os.getenv('RAG_REFERENCE_LIMIT', 5))
+# 默认检索模式：vector / lexical / hybrid
+RAG_RETRIEVAL_MODE = os.getenv('RAG_RETRIEVAL_MODE', 'hybrid')
+# 倒数排名融合的平滑常数，排名 r 的得分为 1 / (RAG_RRF_K + r)
+RAG_RRF_K = int(os.getenv('RAG_RRF_K', 60))
+# hybrid 模式等待向量检索（含嵌入接口）的秒数，超时只使用词法结果；0 表示一直等待
+RAG_VECTOR_TIMEOUT = float(os.getenv('RAG_VECTOR_TIMEOUT', 3))
 
-# 全局变量：向量数据库和检索器
-_db = None
-_retriever = None
+RETRIEVAL_MODES = ('vector', 'lexical', 'hybrid')
+
+# 全局变量：向量数据库（MmapVectorStore 或 LegacyFaissStore）、BM25 索引和查询嵌入模型
+_store = None
+_lexical = None
+_embeddings = None
+_index_version = None
+_embedding_cache = EmbeddingCache()
+_result_cache = OrderedDict()  # {(index_version, query, k): [(row, distance)]}
+_result_lock = threading.Lock()
+# hybrid 模式下向量检索在这里执行，超时后结果仍会写入缓存
+_vector_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='rag-vector')
 
 def initialize_rag():
     """初始化 RAG 系统，加载向量数据库"""
-    global _db, _retriever
+    global _store, _lexical, _embeddings, _index_version
     
-    if _db is not None:
+    if _store is not None:
         return True
     
     try:
         # 检查向量数据库是否存在
-        if not os.path.exists("vector_db"):
+        if not os.path.exists(VECTOR_DB_PATH):
             print("警告：向量数据库不存在，RAG 功能将不可用")
             return False
         
-        # 加载向量数据库
+        # 加载向量数据库，查询向量经过缓存；嵌入后端由 EMBEDDING_BACKEND 选择
         print("正在加载向量数据库...")
-        _db = FAISS.load_local(
-            "vector_db",
-            DashScopeEmbeddings(model="text-embedding-v4"),
-            allow_dangerous_deserialization=True
-        )
-        _retriever = _db.as_retriever(search_kwargs={"k": 5})
+        backend = create_embeddings()
+        _embeddings = CachedEmbeddings(backend, backend.model, _embedding_cache)
+        if store_exists(VECTOR_DB_PATH):
+            # 内存映射格式：向量 mmap 打开，文本片段按需读取，启动几乎不占内存
+            _store = MmapVectorStore(VECTOR_DB_PATH)
+            if _store.model not in (None, backend.model):
+                print(f"警告：向量库使用的嵌入模型 {_store.model} 与 {backend.model} 不一致")
+            _index_version = read_index_version(VECTOR_DB_PATH, META_FILE)
+            # 建库时生成的 BM25 索引，与向量共用行号
+            _lexical = load_lexical_index(VECTOR_DB_PATH, len(_store))
+        else:
+            # 旧的 LangChain 格式，整库反序列化到内存（运行 vector_store.py 可转换）
+            _store = LegacyFaissStore(FAISS.load_local(
+                VECTOR_DB_PATH,
+                _embeddings,
+                allow_dangerous_deserialization=True
+            ))
+            _index_version = read_index_version(VECTOR_DB_PATH)
+
+        # 建库时预计算的固定查询向量直接放入内存缓存
+        model, vectors = load_query_vectors(VECTOR_DB_PATH)
+        if model == backend.model:
+            _embeddings.preload_queries(vectors)
         print("✓ RAG 系统初始化成功")
         return True
     except Exception as e:
         print(f"✗ RAG 系统初始化失败: {e}")
         return False
 
+def is_available():
+    return _store is not None
+
+
+def _search_batch(queries, k):
+    """
+    批量检索：缺失的查询向量一次请求嵌入，再对堆叠后的查询矩阵做一次向量检索
+
+    结果按 索引版本 + 查询 + k 缓存，重建索引后自动失效
+
+    Returns:
+        list: 与 queries 对应的 [(行号, 距离)] 列表
+    """
+    results = [None] * len(queries)
+    missing = []
+    with _result_lock:
+        for i, query in enumerate(queries):
+            hits = _result_cache.get((_index_version, query, k))
+            if hits is not None:
+                _result_cache.move_to_end((_index_version, query, k))
+                results[i] = hits
+            else:
+                missing.append(i)
+    if not missing:
+        return results
+
+    vectors = _embeddings.embed_queries([queries[i] for i in missing])
+    distances, indices = _store.search(np.asarray(vectors, dtype=np.float32), k)
+
+    for row, i in enumerate(missing):
+        results[i] = [
+            (int(position), float(distance))
+            for position, distance in zip(indices[row], distances[row])
+            if position != -1
+        ]
+
+    if RAG_RESULT_CACHE_SIZE > 0:
+        with _result_lock:
+            for i in missing:
+                key = (_index_version, queries[i], k)
+                _result_cache[key] = results[i]
+                _result_cache.move_to_end(key)
+            while len(_result_cache) > RAG_RESULT_CACHE_SIZE:
+                _result_cache.popitem(last=False)
+    return results
+
+
+def resolve_mode(mode=None):
+    """规范化检索模式：未指定或无效时使用 RAG_RETRIEVAL_MODE，没有 BM25 索引时只能使用向量检索"""
+    mode = (mode or RAG_RETRIEVAL_MODE).lower()
+    if mode not in RETRIEVAL_MODES:
+        mode = RAG_RETRIEVAL_MODE if RAG_RETRIEVAL_MODE in RETRIEVAL_MODES else 'hybrid'
+    if _lexical is None:
+        return 'vector'
+    return mode
+
+
+def _search_lexical(queries, k):
+    return _lexical.search(queries, k, exclude=_store.deleted if _store.deleted_count else None)
+
+
+def _fuse(rankings, k):
+    """倒数排名融合：各路结果按排名累加 1 / (RAG_RRF_K + 排名)，取前 k 条"""
+    scores = {}
+    for hits in rankings:
+        for rank, (row, _) in enumerate(hits, start=1):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (RAG_RRF_K + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def _retrieve(queries, k, mode):
+    """
+    按检索模式返回每个查询的 [(行号, 分数)]
+
+    向量检索失败（或 hybrid 超时）且 BM25 索引可用时退回词法检索
+    """
+    if mode == 'lexical':
+        return _search_lexical(queries, k)
+    if mode == 'vector':
+        try:
+            return _search_batch(queries, k)
+        except Exception as e:
+            if _lexical is None:
+                raise
+            print(f"向量检索失败，改用词法检索: {e}")
+            return _search_lexical(queries, k)
+
+    # hybrid：先提交向量检索，等待期间完成词法检索
+    future = _vector_executor.submit(_search_batch, queries, k)
+    lexical = _search_lexical(queries, k)
+    try:
+        vector = future.result(timeout=RAG_VECTOR_TIMEOUT or None)
+    except FutureTimeoutError:
+        print(f"向量检索超过 {RAG_VECTOR_TIMEOUT}s，本次只使用词法检索结果")
+        return lexical
+    except Exception as e:
+        print(f"向量检索失败，改用词法检索: {e}")
+        return lexical
+    return [_fuse([v, l], k) for v, l in zip(vector, lexical)]
+
+
+def search_references(queries, k=RAG_PER_QUERY_K, limit=RAG_REFERENCE_LIMIT, mode=None):
+    """
+    批量检索多个查询，按文档 ID 合并去重后返回文档片段
+
+    Args:
+        queries: 查询文本列表，靠前的查询优先
+        k: 每个查询返回的片段数
+        limit: 合并后最多返回的片段数
+        mode: 检索模式 vector / lexical / hybrid，默认取 RAG_RETRIEVAL_MODE
+
+    Returns:
+        list: LangChain Document 列表，RAG 不可用时返回空列表
+    """
+    if _store is None or not queries:
+        return []
+
+    unique_rows = []
+    seen = set()
+    for hits in _retrieve(list(queries), k, resolve_mode(mode)):
+        for row, _ in hits:
+            if row not in seen:
+                seen.add(row)
+                unique_rows.append(row)
+
+    # 只读取最终保留的片段
+    unique_rows = unique_rows[:limit]
+    documents = _store.get_documents(unique_rows)
+    return [documents[row] for row in unique_rows if row in documents]
+
 # 应用启动时自动初始化
 initialize_rag()
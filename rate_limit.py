@@ -0,0 +1,51 @@
+# 功能：令牌桶限流器
+# 嵌入接口按每分钟请求数（RPM）和每分钟 token 数（TPM）限流，
+# 并发请求在发出前先从桶中取令牌，超出配额时阻塞等待而不是被服务端拒绝后重试
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    Args:
+        rate: 每秒补充的令牌数，<= 0 表示不限流
+        capacity: 桶容量（允许的突发量），默认为一秒的补充量
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, limit):
+        """按每分钟配额创建，桶容量为一分钟的配额"""
+        return cls(limit / 60.0, capacity=limit) if limit > 0 else cls(0)
+
+    def acquire(self, tokens=1):
+        """
+        取出 tokens 个令牌，不足时阻塞到补足为止
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        # 单次请求超过桶容量时按容量计算，否则永远取不到
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
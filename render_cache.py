@@ -0,0 +1,151 @@
+# 功能：图表渲染缓存（按内容哈希寻址）
+# 预设参数的重复请求和反复打开的结果页，图表输入（层结构 / 性能数据）往往完全相同，
+# 每次都重新构建 pyecharts 对象图并序列化是纯粹的浪费；这里以
+# "图表类型 + 模板版本 + 规范化输入" 的 sha256 作为名称保存渲染结果：
+#   - 进程内 LRU，按字节数限制总大小
+#   - 磁盘目录（多 worker 共享），每个结果一个 <哈希>.json 文件，超出容量时按最近访问时间淘汰
+# 同一名称的内容永远不变，结果页按 /charts/<哈希>.json 获取，响应带 immutable 缓存头，
+# 浏览器再次打开时不再请求
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RENDER_CACHE_MAX_BYTES = int(os.getenv('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# 磁盘缓存目录，留空则只使用内存缓存
+RENDER_CACHE_DIR = os.getenv('RENDER_CACHE_DIR', 'instance/render_cache')
+RENDER_CACHE_DISK_MAX_BYTES = int(os.getenv('RENDER_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024))
+
+_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_name(kind, version, inputs):
+    """渲染结果的名称：图表类型、模板版本与规范化输入的 sha256"""
+    canonical = json.dumps(inputs, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{kind}\n{version}\n{canonical}'.encode('utf-8')).hexdigest()
+
+
+def is_valid_name(name):
+    return bool(_NAME_RE.match(name or ''))
+
+
+class RenderCache:
+    """按内容哈希寻址的两级缓存：进程内 LRU（字节数上限）+ 可选的磁盘目录（容量上限）"""
+
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES, directory=RENDER_CACHE_DIR,
+                 disk_max_bytes=RENDER_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # {name: bytes}
+        self._memory_bytes = 0
+        self._disk_bytes = None  # 首次写入时统计
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.json')
+
+    def get(self, name):
+        """读取渲染结果，未命中返回 None"""
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                return data
+        if not self.directory or not is_valid_name(name):
+            return None
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # 记录访问时间，磁盘淘汰按 mtime 从旧到新
+        except OSError:
+            return None
+        self._put_memory(name, data)
+        return data
+
+    def put(self, name, data):
+        self._put_memory(name, data)
+        if not self.directory:
+            return
+        path = self._path(name)
+        if os.path.exists(path):
+            return
+        # 先写临时文件再改名，其他 worker 不会读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict_disk(len(data))
+
+    def get_or_render(self, name, render):
+        """
+        命中时直接返回，未命中时调用 render() 生成并写入缓存
+
+        Args:
+            name: content_name 生成的名称
+            render: 无参函数，返回可 JSON 序列化的渲染结果
+
+        Returns:
+            bytes: JSON 编码的渲染结果
+        """
+        data = self.get(name)
+        if data is None:
+            data = json.dumps(render(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self.put(name, data)
+        return data
+
+    def _put_memory(self, name, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(name, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[name] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _scan_disk(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self, added):
+        """磁盘总大小超出上限时按最近访问时间从旧到新删除"""
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes <= self.disk_max_bytes:
+                return
+            # 其他 worker 也在写入，淘汰前重新统计
+            entries = sorted(self._scan_disk())
+            self._disk_bytes = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._disk_bytes <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+
+
+render_cache = RenderCache()
@@ -0,0 +1,309 @@
+# 功能：设计结果存储，替代 app.py 中的进程内 design_results 字典
+# gunicorn 多 worker 时，/api/design 与 /result 可能落在不同进程上，
+# 因此默认使用 SQLite (WAL 模式) 作为所有 worker 共享的磁盘存储
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 存储配置（可通过环境变量覆盖）
+RESULT_STORE_BACKEND = os.getenv('RESULT_STORE_BACKEND', 'sqlite')  # sqlite / memory
+RESULT_STORE_PATH = os.getenv('RESULT_STORE_PATH', 'instance/design_results.db')
+RESULT_TTL_SECONDS = int(os.getenv('RESULT_TTL_SECONDS', 24 * 3600))  # 保留24小时
+RESULT_STORE_MAX_BYTES = int(os.getenv('RESULT_STORE_MAX_BYTES', 256 * 1024 * 1024))
+RESULT_CLEANUP_INTERVAL = int(os.getenv('RESULT_CLEANUP_INTERVAL', 600))
+
+
+def connect_sqlite(path):
+    """创建适合多进程并发读写的 SQLite 连接（WAL 模式，自动提交）"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+class ResultStore:
+    """
+    设计结果存储接口
+
+    所有实现都需要支持：
+    - put/get/delete 基本读写
+    - TTL 过期清理（只处理已过期条目，不扫描全部数据）
+    - 总大小上限，超出时按创建时间从旧到新淘汰
+    """
+
+    def __init__(self, ttl_seconds=RESULT_TTL_SECONDS, max_bytes=RESULT_STORE_MAX_BYTES,
+                 cleanup_interval=RESULT_CLEANUP_INTERVAL):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        self._cleanup_thread = None
+
+    def put(self, task_id, result_data):
+        raise NotImplementedError
+
+    def get(self, task_id):
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        raise NotImplementedError
+
+    def _evict(self, now):
+        """删除过期和超出容量的条目，返回删除的条目数"""
+        raise NotImplementedError
+
+    def __contains__(self, task_id):
+        return self.get(task_id) is not None
+
+    def cleanup(self, now=None):
+        """
+        执行一次清理：先按过期索引删除过期条目，再按大小上限淘汰
+
+        Returns:
+            int: 被删除的条目数量
+        """
+        now = now or time.time()
+        self._last_cleanup = now
+        return self._evict(now)
+
+    def maybe_cleanup(self):
+        """写入时顺带触发清理，保证即使没有后台线程也不会无限增长"""
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            try:
+                self.cleanup()
+            except Exception as e:
+                print(f"清理过期设计结果失败: {e}")
+
+    def start_cleanup_thread(self):
+        """
+        启动后台清理线程
+
+        preload_app = True 时应用在 fork 之前加载，此时启动的线程不会进入 worker，
+        因此需要在 gunicorn 的 post_fork 钩子（或单进程启动时）调用
+        """
+        if self._cleanup_thread is not None and self._cleanup_thread.is_alive():
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.cleanup_interval)
+                self.maybe_cleanup()
+
+        self._cleanup_thread = threading.Thread(target=loop, daemon=True)
+        self._cleanup_thread.start()
+
+
+class MemoryResultStore(ResultStore):
+    """
+    进程内存储（仅适用于单进程开发环境）
+
+    使用最小堆作为过期索引，清理代价为 O(过期条目数 * log n)
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        # {task_id: (result_data, size, expires_at)}，按插入顺序排列用于容量淘汰
+        self._items = OrderedDict()
+        self._expiry_heap = []
+        self._total_bytes = 0
+
+    def put(self, task_id, result_data):
+        size = len(json.dumps(result_data, ensure_ascii=False).encode('utf-8'))
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            if task_id in self._items:
+                old_data, old_size, _ = self._items.pop(task_id)
+                self._total_bytes -= old_size
+            self._items[task_id] = (result_data, size, expires_at)
+            self._total_bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, task_id))
+            self._evict_by_size()
+        self.maybe_cleanup()
+
+    def get(self, task_id):
+        with self._lock:
+            item = self._items.get(task_id)
+        if item is None or item[2] <= time.time():
+            return None
+        return item[0]
+
+    def delete(self, task_id):
+        with self._lock:
+            item = self._items.pop(task_id, None)
+            if item is not None:
+                self._total_bytes -= item[1]
+
+    def _evict_by_size(self):
+        removed = 0
+        while self._total_bytes > self.max_bytes and self._items:
+            _, (_, size, _) = self._items.popitem(last=False)
+            self._total_bytes -= size
+            removed += 1
+        return removed
+
+    def _evict(self, now):
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, task_id = heapq.heappop(self._expiry_heap)
+                item = self._items.get(task_id)
+                # 同一任务被重新写入后，堆中会残留旧的过期时间，需要跳过
+                if item is None or item[2] != expires_at:
+                    continue
+                del self._items[task_id]
+                self._total_bytes -= item[1]
+                removed += 1
+            removed += self._evict_by_size()
+        return removed
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    基于 SQLite (WAL 模式) 的跨进程共享存储
+
+    - expires_at 建立索引，过期清理只做一次范围扫描，代价为 O(过期条目数)
+    - 总大小由触发器维护在 store_stats 表中，淘汰时无需 SUM 全表
+    - 连接按进程和线程分别创建，避免 fork 后共享连接
+    """
+
+    EVICT_BATCH = 100
+
+    def __init__(self, path=RESULT_STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        conn = connect_sqlite(self.path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                task_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_expires ON results(expires_at);
+            CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at);
+
+            CREATE TABLE IF NOT EXISTS store_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO store_stats (id, total_bytes) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS trg_results_insert AFTER INSERT ON results
+            BEGIN
+                UPDATE store_stats SET total_bytes = total_bytes + NEW.size WHERE id = 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_results_delete AFTER DELETE ON results
+            BEGIN
+                UPDATE store_stats SET total_bytes = total_bytes - OLD.size WHERE id = 1;
+            END;
+        """)
+        # 旧版本的表带有 images 列（已不再生成图片文件），移除后才能按新的列插入
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(results)')]
+        if 'images' in columns:
+            try:
+                conn.execute('ALTER TABLE results DROP COLUMN images')
+            except sqlite3.OperationalError:
+                pass  # 其他 worker 已经移除
+
+    def put(self, task_id, result_data):
+        data = json.dumps(result_data, ensure_ascii=False)
+        size = len(data.encode('utf-8'))
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 先删除再插入，保证触发器正确维护总大小
+            conn.execute('DELETE FROM results WHERE task_id = ?', (task_id,))
+            conn.execute(
+                'INSERT INTO results (task_id, data, size, created_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (task_id, data, size, now, now + self.ttl_seconds)
+            )
+            self._evict_by_size(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self.maybe_cleanup()
+
+    def get(self, task_id):
+        row = self._connect().execute(
+            'SELECT data FROM results WHERE task_id = ? AND expires_at > ?',
+            (task_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, task_id):
+        self._connect().execute('DELETE FROM results WHERE task_id = ?', (task_id,))
+
+    def total_bytes(self):
+        return self._connect().execute('SELECT total_bytes FROM store_stats WHERE id = 1').fetchone()[0]
+
+    def _evict_by_size(self, conn):
+        """在当前事务内按创建时间从旧到新淘汰，直到总大小回到上限以内，返回删除的条目数"""
+        removed = 0
+        while True:
+            total = conn.execute('SELECT total_bytes FROM store_stats WHERE id = 1').fetchone()[0]
+            if total <= self.max_bytes:
+                break
+            rows = conn.execute(
+                'SELECT task_id, size FROM results ORDER BY created_at LIMIT ?',
+                (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            # 逐条累加，只删除足以回到上限的最旧条目
+            victims = []
+            for task_id, size in rows:
+                victims.append((task_id,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            conn.executemany('DELETE FROM results WHERE task_id = ?', victims)
+            removed += len(victims)
+        return removed
+
+    def _evict(self, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = conn.execute('DELETE FROM results WHERE expires_at <= ?', (now,)).rowcount
+            removed += self._evict_by_size(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return removed
+
+
+def create_result_store():
+    """根据环境变量创建结果存储实例"""
+    if RESULT_STORE_BACKEND == 'memory':
+        return MemoryResultStore()
+    return SQLiteResultStore()
@@ -19,8 +19,61 @@ function switchTab(tabName) {
     if (tabContent) {
         tabContent.classList.add('active');
     }
+
+    // 图表容器隐藏时宽度为 0，切换到可视化选项卡后再绘制
+    if (tabName === 'visualization') {
+        renderCharts();
+    }
+}
+
+// 图表：ECharts option 由 /api/charts/<task_id> 给出的地址获取（或直接内联在页面中），在浏览器端绘制
+let chartSpecs = null;
+
+function initCharts(source) {
+    // 在页面解析过程中调用：ECharts 以 defer 加载，DOMContentLoaded 时一定已可用
+    document.addEventListener('DOMContentLoaded', renderCharts);
+    if (typeof source !== 'string') {
+        chartSpecs = source;
+        return;
+    }
+    // 接口返回各图表按内容哈希命名的地址，图表内容不变，浏览器缓存后再次打开不再请求
+    const fetchJson = url => fetch(url).then(response => response.ok ? response.json() : Promise.reject(response.status));
+    fetchJson(source)
+        .then(urls => Promise.all(Object.entries(urls).map(([name, url]) => fetchJson(url).then(spec => [name, spec]))))
+        .then(entries => {
+            chartSpecs = Object.fromEntries(entries);
+            renderCharts();
+        })
+        .catch(error => console.error('加载图表失败:', error));
+}
+
+function renderCharts() {
+    const tab = document.getElementById('visualization-tab');
+    if (!chartSpecs || !tab || !tab.classList.contains('active') || typeof echarts === 'undefined') {
+        return;
+    }
+    ['structure', 'performance'].forEach(name => {
+        const container = document.getElementById(name + '-chart');
+        const spec = chartSpecs[name];
+        if (!container || !spec) return;
+        container.style.height = spec.height + 'px';
+        let chart = echarts.getInstanceByDom(container);
+        if (!chart) {
+            chart = echarts.init(container);
+            chart.setOption(spec.option);
+        }
+        chart.resize();
+    });
 }
 
+window.addEventListener('resize', () => {
+    if (typeof echarts === 'undefined') return;
+    document.querySelectorAll('.chart-container').forEach(container => {
+        const chart = echarts.getInstanceByDom(container);
+        if (chart) chart.resize();
+    });
+});
+
 // 3D模型控制
 let currentRotationX = -15;
 let currentRotationY = 0;
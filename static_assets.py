@@ -0,0 +1,201 @@
+# 功能：静态资源指纹与预压缩
+# 页面引用的 style.css、result.js 等文件原先由 Flask 原样发送，没有指纹也没有压缩，
+# 每次访问都重新下载；校园网带宽有限，这里：
+#   1. 构建：static/ 下的文件按内容哈希生成带指纹的副本（css/style.3f2a9c1d.css），
+#      文本类文件同时预压缩为 .gz / .br（brotli 可选），写入 static/dist/ 与 manifest.json
+#   2. 引用：模板中使用 asset_url('css/style.css')，得到 /assets/css/style.3f2a9c1d.css；
+#      不在清单中的文件退回普通的 /static/ 地址
+#   3. 发送：按 Accept-Encoding 选择 br / gzip / 原文件，带 Cache-Control: immutable
+#      （内容变化后文件名随之变化，浏览器可以永久缓存）
+#   4. 页面：模板渲染出的 HTML / JSON 响应在发送前按 Accept-Encoding 即时压缩（流式响应除外）
+#
+# 用法：python static_assets.py（部署前构建；STATIC_ASSETS_AUTO_BUILD=true 时应用启动时也会构建）
+import os
+import sys
+import gzip
+import json
+import hashlib
+import mimetypes
+from flask import request, send_file, url_for, abort
+from dotenv import load_dotenv
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+STATIC_DIR = 'static'
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_FILE = 'manifest.json'
+
+STATIC_ASSETS_AUTO_BUILD = os.getenv('STATIC_ASSETS_AUTO_BUILD', 'true').lower() == 'true'
+# 即时压缩 HTML 等动态响应
+COMPRESS_RESPONSES = os.getenv('COMPRESS_RESPONSES', 'true').lower() == 'true'
+# 小于该字节数的内容不压缩
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 512))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+# 即时压缩使用较低的 brotli 质量（预压缩使用最高质量 11）
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+
+# 预压缩与即时压缩的内容类型
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.html', '.txt', '.map')
+COMPRESSIBLE_MIMETYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+# 不进入构建的目录（构建输出本身）与文件（旧版本生成的图表 HTML）
+EXCLUDED_DIRS = ('dist',)
+EXCLUDED_PREFIX, EXCLUDED_SUFFIX = 'images/', '.html'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest = {}  # {逻辑路径: {'path': 指纹路径, 'encodings': [...]}}
+_served = {}  # {指纹路径: 可用的预压缩格式}
+
+
+def _fingerprinted(path, digest):
+    stem, ext = os.path.splitext(path)
+    return f'{stem}.{digest[:8]}{ext}'
+
+
+def _write_if_missing(path, data):
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _iter_sources(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [name for name in dirs if name not in EXCLUDED_DIRS]
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            logical = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            if logical.startswith(EXCLUDED_PREFIX) and logical.endswith(EXCLUDED_SUFFIX):
+                continue
+            yield logical, path
+
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """
+    生成带指纹的副本与预压缩文件；内容未变的文件不会重写
+
+    Returns:
+        dict: 清单 {逻辑路径: {'path': 指纹路径, 'encodings': [...]}}
+    """
+    manifest = {}
+    for logical, path in _iter_sources(static_dir):
+        with open(path, 'rb') as f:
+            data = f.read()
+        target = _fingerprinted(logical, hashlib.sha256(data).hexdigest())
+        target_path = os.path.join(dist_dir, target)
+        _write_if_missing(target_path, data)
+        encodings = []
+        if logical.endswith(COMPRESSIBLE_EXTENSIONS) and len(data) >= COMPRESS_MIN_BYTES:
+            if brotli is not None:
+                if not os.path.exists(target_path + '.br'):
+                    _write_if_missing(target_path + '.br', brotli.compress(data, quality=11))
+                encodings.append('br')
+            if not os.path.exists(target_path + '.gz'):
+                _write_if_missing(target_path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            encodings.append('gzip')
+        manifest[logical] = {'path': target, 'encodings': encodings}
+    os.makedirs(dist_dir, exist_ok=True)
+    tmp_path = os.path.join(dist_dir, f'{MANIFEST_FILE}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist_dir, MANIFEST_FILE))
+    return manifest
+
+
+def load_manifest(dist_dir=DIST_DIR):
+    path = os.path.join(dist_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def asset_url(filename):
+    """模板中引用静态资源：构建过的文件返回带指纹的 /assets/ 地址"""
+    entry = _manifest.get(filename)
+    if entry is None:
+        return url_for('static', filename=filename)
+    return url_for('static_asset', filename=entry['path'])
+
+
+def _accepted_encodings():
+    accepted = request.accept_encodings
+    return [encoding for encoding in ('br', 'gzip') if accepted[encoding] > 0 and (encoding != 'br' or brotli)]
+
+
+def _serve_asset(filename):
+    """发送带指纹的资源：按 Accept-Encoding 选择预压缩文件"""
+    if filename not in _served:
+        abort(404)
+    path = os.path.join(DIST_DIR, filename)
+    encodings = _served[filename]
+    encoding = next((name for name in _accepted_encodings() if name in encodings), None)
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+    response = send_file(os.path.abspath(path + suffix),
+                         mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                         conditional=True, etag=True, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response):
+    """即时压缩动态响应（模板渲染的 HTML、JSON），流式响应和已压缩的响应保持原样"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_MIMETYPES)):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encodings = _accepted_encodings()
+    if not encodings:
+        return response
+    if encodings[0] == 'br':
+        compressed = brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encodings[0]
+    # 压缩后的字节与原文不同，强 ETag 改为弱 ETag（条件请求按弱比较仍然命中）
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app, auto_build=STATIC_ASSETS_AUTO_BUILD, compress=COMPRESS_RESPONSES):
+    """注册 asset_url 模板函数、/assets/ 路由与响应压缩"""
+    global _manifest
+    _manifest = build_assets() if auto_build else load_manifest()
+    _served.clear()
+    _served.update({entry['path']: entry['encodings'] for entry in _manifest.values()})
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.add_url_rule('/assets/<path:filename>', 'static_asset', _serve_asset)
+    if compress:
+        app.after_request(compress_response)
+
+
+def main():
+    manifest = build_assets()
+    compressed = sum(1 for entry in manifest.values() if entry['encodings'])
+    print(f"✓ 已构建 {len(manifest)} 个静态资源（{compressed} 个预压缩，brotli {'可用' if brotli else '未安装'}）"
+          f"，输出到 {DIST_DIR}/")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# 功能：流式 JSON 增量解析器
+# 逐块接收模型输出的 delta.content，跟踪设计方案 JSON 的嵌套结构，
+# layers 中每一层闭合时立即产出，随后是 performance 等顶层字段，
+# 前端无需等待整个流结束即可开始绘制层叠结构
+import json
+from utils import extract_json_from_text
+
+
+class IncrementalDesignParser:
+    """
+    设计方案 JSON 的增量解析器
+
+    只做一遍扫描，记录字符串/转义状态和括号深度：
+    - 深度 1 为根对象，识别顶层键以及值的起止位置
+    - layers 数组内深度 3 的对象闭合时，解析出一层
+
+    用法：
+        parser = IncrementalDesignParser()
+        for chunk in stream:
+            for event in parser.feed(chunk):
+                ...  # ('layer', index, layer) 或 ('field', key, value)
+    """
+
+    def __init__(self):
+        self._text = []          # 根对象开始后的全部文本（按块存储）
+        self._length = 0         # 根对象开始后的字符数
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect_key = True  # 深度 1 时下一个字符串是键还是值
+        self._key = None
+        self._value_start = None
+        self._element_start = None
+        self.layer_count = 0
+        self.done = False
+
+    def _slice(self, start, end):
+        # 合并为单个字符串后缓存，多次切片不会重复拼接
+        if len(self._text) > 1:
+            self._text = [''.join(self._text)]
+        return self._text[0][start:end]
+
+    def _emit_value(self, end, events):
+        """顶层字段的值已完整，解析并生成事件"""
+        if self._key is None or self._value_start is None:
+            return
+        raw = self._slice(self._value_start, end).strip()
+        self._value_start = None
+        if self._key == 'layers':
+            return  # layers 已在逐层解析时产出
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return  # 存在格式缺陷时交给流结束后的整体解析处理
+        events.append(('field', self._key, value))
+
+    def _emit_layer(self, end, events):
+        raw = self._slice(self._element_start, end)
+        self._element_start = None
+        index = self.layer_count
+        # 无论能否解析都占用一个序号，后续层的 index 与最终结果中的位置保持一致
+        self.layer_count += 1
+        try:
+            layer = json.loads(raw)
+        except json.JSONDecodeError:
+            # 带单位的厚度、尾随逗号等缺陷与流结束后的整体解析使用同一套修复
+            layer = extract_json_from_text(raw)
+            if layer is None:
+                return
+        events.append(('layer', index, layer))
+
+    def feed(self, chunk):
+        """
+        输入一段新文本
+
+        Returns:
+            list: 本次新完成的事件列表
+        """
+        events = []
+        if self.done or not chunk:
+            return events
+
+        if not self._started:
+            index = chunk.find('{')
+            if index == -1:
+                return events
+            chunk = chunk[index:]
+            self._started = True
+
+        base = self._length
+        self._text.append(chunk)
+        self._length += len(chunk)
+
+        for offset, char in enumerate(chunk):
+            pos = base + offset
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._expect_key:
+                            try:
+                                self._key = json.loads(self._slice(self._string_start, pos + 1))
+                            except json.JSONDecodeError:
+                                self._key = None
+                        else:
+                            self._emit_value(pos + 1, events)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+                if self._depth == 1 and not self._expect_key and self._value_start is None:
+                    self._value_start = pos
+            elif char in '{[':
+                if self._depth == 1 and self._value_start is None:
+                    self._value_start = pos
+                self._depth += 1
+                if self._depth == 3 and self._key == 'layers' and char == '{':
+                    self._element_start = pos
+            elif char in '}]':
+                if self._depth == 3 and self._element_start is not None:
+                    self._emit_layer(pos + 1, events)
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit_value(pos + 1, events)
+                elif self._depth == 0:
+                    # 根对象结束：处理最后一个值为数字/布尔等裸值的情况
+                    if self._value_start is not None:
+                        self._emit_value(pos, events)
+                    self.done = True
+                    break
+            elif self._depth == 1:
+                if char == ':':
+                    self._expect_key = False
+                elif char == ',':
+                    if self._value_start is not None:
+                        self._emit_value(pos, events)
+                    self._expect_key = True
+                    self._key = None
+                elif not char.isspace() and not self._expect_key and self._value_start is None:
+                    self._value_start = pos  # 数字、true/false/null 等裸值
+        return events
@@ -0,0 +1,16 @@
+# 测试从仓库根目录导入模块；各模块在导入时读取环境变量，这里先把会写入磁盘的路径指向临时目录
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix='design-platform-tests-')
+os.environ.setdefault('EMBEDDING_BACKEND', 'local')
+os.environ.setdefault('RESULT_STORE_PATH', os.path.join(_TMP, 'results.db'))
+os.environ.setdefault('DESIGN_CACHE_DISK_PATH', '')
+os.environ.setdefault('PROMPT_CACHE_STATS_PATH', '')
+os.environ.setdefault('RENDER_CACHE_DIR', '')
+os.environ.setdefault('EMBEDDING_CACHE_DIR', '')
+os.environ.setdefault('STATIC_ASSETS_AUTO_BUILD', 'false')
@@ -0,0 +1,32 @@
+import gc
+import asyncio
+import deepseek_client
+
+
+def test_async_client_closed_with_its_event_loop(monkeypatch):
+    """每个事件循环各自一个客户端，asyncio.run 结束时关闭，不随事件循环数量累积"""
+    monkeypatch.setattr(deepseek_client, 'DEEPSEEK_API_KEY', 'sk-test')
+
+    async def fetch():
+        client = await deepseek_client.get_async_client()
+        assert await deepseek_client.get_async_client() is client
+        return client
+
+    clients = [asyncio.run(fetch()) for _ in range(3)]
+    gc.collect()
+
+    assert len(set(map(id, clients))) == 3
+    assert all(client.is_closed() for client in clients)
+    assert len(deepseek_client._async_clients) == 0
+
+
+def test_aclose_async_client(monkeypatch):
+    monkeypatch.setattr(deepseek_client, 'DEEPSEEK_API_KEY', 'sk-test')
+
+    async def run():
+        client = await deepseek_client.get_async_client()
+        await deepseek_client.aclose_async_client()
+        assert client.is_closed()
+        assert await deepseek_client.get_async_client() is not client
+
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import time
+import threading
+import design_batch
+from design_batch import run_batch
+
+
+def test_concurrency_cap_is_shared_across_batches():
+    """多个批量请求同时运行时，总并发不超过 DESIGN_BATCH_CONCURRENCY"""
+    lock = threading.Lock()
+    active = peak = 0
+
+    def run_one(params):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return {'ok': params['i']}
+
+    groups = [(str(i), {'i': i}, [i]) for i in range(8)]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(list(run_batch(groups, run_one, 4))))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert len(results) == 3
+    assert all(sorted(row[3]['ok'] for row in batch) == list(range(8)) for batch in results)
+    assert peak <= design_batch.DESIGN_BATCH_CONCURRENCY
+
+
+def test_closing_batch_skips_pending_groups():
+    started = []
+
+    def run_one(params):
+        started.append(params['i'])
+        time.sleep(0.02)
+        return {}
+
+    batch = run_batch([(str(i), {'i': i}, [i]) for i in range(10)], run_one, 2)
+    next(batch)
+    batch.close()
+    time.sleep(0.1)
+    assert len(started) <= 3
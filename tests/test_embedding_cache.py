@@ -0,0 +1,40 @@
+import os
+import numpy as np
+from embedding_cache import ArrayVectorCache
+
+
+def _vectors(start, count, dim=4):
+    return np.arange(start * dim, (start + count) * dim, dtype=np.float32).reshape(count, dim)
+
+
+def test_query_rows_are_capped_by_recent_use(tmp_path):
+    cache = ArrayVectorCache(str(tmp_path))
+    texts = [f'q{i}' for i in range(8)]
+    cache.put_many('m/query', 4, texts, _vectors(0, 8), max_rows=8)
+    # 最早写入的 q0 最近被读取过，压缩时应当保留
+    assert cache.get_many('m/query', 4, ['q0'], touch=True)[0] is not None
+
+    cache.put_many('m/query', 4, ['q8'], _vectors(8, 1), max_rows=8)
+
+    hits = cache.get_many('m/query', 4, texts + ['q8'])
+    kept = {text for text, vector in zip(texts + ['q8'], hits) if vector is not None}
+    assert len(kept) == 6
+    assert {'q0', 'q8'} <= kept
+    assert all(np.array_equal(vector, _vectors(int(text[1:]), 1)[0])
+               for text, vector in zip(texts + ['q8'], hits) if vector is not None)
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.f32')]) == 1
+
+
+def test_other_process_reads_after_compaction(tmp_path):
+    writer, reader = ArrayVectorCache(str(tmp_path)), ArrayVectorCache(str(tmp_path))
+    writer.put_many('m/query', 4, ['a', 'b'], _vectors(0, 2), max_rows=2)
+    assert reader.get_many('m/query', 4, ['a'])[0] is not None
+    writer.put_many('m/query', 4, ['c'], _vectors(2, 1), max_rows=2)
+    assert np.array_equal(reader.get_many('m/query', 4, ['c'])[0], _vectors(2, 1)[0])
+
+
+def test_document_rows_are_not_capped(tmp_path):
+    cache = ArrayVectorCache(str(tmp_path))
+    texts = [f'd{i}' for i in range(20)]
+    cache.put_many('m/document', 4, texts, _vectors(0, 20))
+    assert all(vector is not None for vector in cache.get_many('m/document', 4, texts))
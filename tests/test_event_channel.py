@@ -0,0 +1,87 @@
+import threading
+import time
+from event_channel import EventChannelRegistry, EventLog, format_sse
+
+
+def _registries(tmp_path, **kwargs):
+    """模拟两个 gunicorn worker：各自的进程内注册表，共享同一个事件日志数据库"""
+    path = str(tmp_path / 'events.db')
+    return (EventChannelRegistry(log=EventLog(path, poll_interval=0.01), **kwargs),
+            EventChannelRegistry(log=EventLog(path, poll_interval=0.01), **kwargs))
+
+
+def _collect(events):
+    return [item for item in events if item is not None]
+
+
+def test_format_sse_multiline():
+    assert format_sse('a\nb', event_id=3) == 'id: 3\ndata: a\ndata: b\n\n'
+
+
+def test_local_subscriber_replays_after_last_event_id():
+    registry = EventChannelRegistry()
+    channel, created = registry.get_or_create('t')
+    assert created
+    for i in range(5):
+        channel.publish(f'e{i}')
+    channel.close()
+    assert _collect(registry.subscribe('t', last_event_id=3)) == [(4, 'e3'), (5, 'e4')]
+
+
+def test_other_worker_receives_live_events(tmp_path):
+    owner, other = _registries(tmp_path)
+    channel, _ = owner.get_or_create('t')
+    channel.publish('queued')
+
+    def produce():
+        for i in range(5):
+            time.sleep(0.02)
+            channel.publish(f'step{i}')
+        channel.close()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    assert other.get('t') is None and other.has_stream('t')
+    received = _collect(other.subscribe('t', heartbeat=0.05))
+    producer.join()
+    assert [data for _, data in received] == ['queued'] + [f'step{i}' for i in range(5)]
+    assert [event_id for event_id, _ in received] == list(range(1, 7))
+
+
+def test_reconnect_on_other_worker_resumes_from_last_event_id(tmp_path):
+    owner, other = _registries(tmp_path)
+    channel, _ = owner.get_or_create('t')
+    for i in range(4):
+        channel.publish(f'e{i}')
+    channel.close()
+    assert _collect(other.subscribe('t', last_event_id=2)) == [(3, 'e2'), (4, 'e3')]
+
+
+def test_tail_stops_when_producer_is_gone(tmp_path):
+    owner, other = _registries(tmp_path)
+    channel, _ = owner.get_or_create('t')
+    channel.publish('e0')
+    # 生产者所在进程退出：事件流没有关闭，由 alive 判断结束
+    assert _collect(other.subscribe('t', heartbeat=0.05, alive=lambda: False)) == [(1, 'e0')]
+
+
+def test_evicted_events_are_replayed_from_log(tmp_path):
+    path = str(tmp_path / 'events.db')
+    registry = EventChannelRegistry(log=EventLog(path))
+    channel, _ = registry.get_or_create('t')
+    channel._events = type(channel._events)(maxlen=2)
+    for i in range(5):
+        channel.publish(f'e{i}')
+    channel.close()
+    assert [event_id for event_id, _ in _collect(registry.subscribe('t'))] == [1, 2, 3, 4, 5]
+
+
+def test_new_stream_clears_previous_events(tmp_path):
+    owner, other = _registries(tmp_path)
+    channel, _ = owner.get_or_create('t')
+    channel.publish('old')
+    channel.close()
+    channel, _ = other.get_or_create('t')
+    channel.publish('new')
+    channel.close()
+    assert _collect(owner.log.tail('t')) == [(1, 'new')]
@@ -0,0 +1,71 @@
+import json
+from utils import extract_json_from_text
+
+DESIGN = {
+    'structure_name': 'ITO/SnO2/MAPbI3/Spiro/Au',
+    'layers': [
+        {'name': 'ITO', 'thickness': 150},
+        {'name': 'MAPbI3', 'thickness': 500, 'bandgap': 1.55},
+    ],
+    'performance': {'responsivity': 0.45, 'eqe': 85},
+}
+
+
+def test_markdown_code_block():
+    text = '以下是设计方案：\n```json\n' + json.dumps(DESIGN, ensure_ascii=False, indent=2) + '\n```\n说明……'
+    assert extract_json_from_text(text) == DESIGN
+
+
+def test_trailing_commas_units_and_comments():
+    text = '''{
+        "layers": [
+            {"name": "ITO", "thickness": 150nm,},  // 透明电极
+            {"name": "MAPbI3", "thickness": 500 nm, "bandgap": 1.55 eV},
+        ],
+        /* 性能 */
+        "performance": {"responsivity": 0.45, "eqe": 85%,},
+    }'''
+    assert extract_json_from_text(text) == {
+        'layers': DESIGN['layers'],
+        'performance': DESIGN['performance'],
+    }
+
+
+def test_fullwidth_punctuation_outside_strings_only():
+    text = '｛"name"：“钙钛矿，吸收层”，"note"："保留：全角，标点"，"ok"：True，"x"：None｝'
+    assert extract_json_from_text(text) == {
+        'name': '钙钛矿，吸收层', 'note': '保留：全角，标点', 'ok': True, 'x': None,
+    }
+
+
+def test_escaped_quotes_and_braces_in_strings():
+    data = {'desc': 'a "quoted" {brace} \\ text', 'layers': []}
+    assert extract_json_from_text('结果：' + json.dumps(data)) == data
+
+
+def test_prose_braces_before_design_are_skipped():
+    text = '公式 {x} 中的 {y} 不是 JSON。\n' + json.dumps(DESIGN)
+    assert extract_json_from_text(text) == DESIGN
+
+
+def test_largest_object_wins():
+    text = '{"a": 1}\n' + json.dumps(DESIGN) + '\n{"b": 2}'
+    assert extract_json_from_text(text) == DESIGN
+
+
+def test_truncated_output():
+    text = json.dumps(DESIGN)
+    assert extract_json_from_text(text[:-10]) is None
+    assert extract_json_from_text('{"a": 1}\n' + text[:-10]) == {'a': 1}
+
+
+def test_unclosed_brace_before_object_is_skipped():
+    assert extract_json_from_text('set { open, then {"a": 1}') == {'a': 1}
+    text = '集合 {x | x > 0 的定义如下：\n```json\n' + json.dumps(DESIGN, ensure_ascii=False) + '\n```'
+    assert extract_json_from_text(text) == DESIGN
+
+
+def test_no_json():
+    assert extract_json_from_text('') is None
+    assert extract_json_from_text(None) is None
+    assert extract_json_from_text('没有设计方案') is None
@@ -0,0 +1,60 @@
+import threading
+import pytest
+import ingest_pipeline
+from embedding_backend import LocalHashEmbeddings
+
+PAGES_PER_FILE = 40
+
+
+def _fake_parse(path):
+    """子进程：不读取 PDF，直接产出大量页面，让有界队列被填满"""
+    for page in range(PAGES_PER_FILE):
+        text = f'{path} 第 {page} 页 钙钛矿光电探测器的能带对齐与界面钝化。'
+        ingest_pipeline._queue.put(('chunks', path, [(text, {'source': path, 'page': page})]))
+    ingest_pipeline._queue.put(('done', path, PAGES_PER_FILE))
+
+
+class _FailingWriter(ingest_pipeline.VectorStoreWriter):
+    def add(self, vectors, documents):
+        raise RuntimeError('写入失败')
+
+
+def _run_in_thread(target, timeout=30):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = target()
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'ingest 没有在限定时间内返回'
+    return outcome
+
+
+@pytest.fixture
+def fake_parse(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, '_parse_file', _fake_parse)
+
+
+def _ingest(tmp_path, **kwargs):
+    paths = [str(tmp_path / f'doc{i}.pdf') for i in range(4)]
+    return ingest_pipeline.ingest(paths, str(tmp_path / 'index'), LocalHashEmbeddings(dim=16), 'local',
+                                  parse_workers=2, queue_size=2, batch_size=4, rpm=0, tpm=0, **kwargs)
+
+
+def test_ingest_completes(tmp_path, fake_parse):
+    outcome = _run_in_thread(lambda: _ingest(tmp_path))
+    assert 'error' not in outcome
+    stats = outcome['result']
+    assert stats['files'] == 4
+    assert stats['embedded'] == 4 * PAGES_PER_FILE
+
+
+def test_consumer_failure_does_not_hang(tmp_path, fake_parse, monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, 'VectorStoreWriter', _FailingWriter)
+    outcome = _run_in_thread(lambda: _ingest(tmp_path))
+    assert isinstance(outcome.get('error'), RuntimeError)
@@ -0,0 +1,94 @@
+import json
+import time
+import uuid
+import threading
+import job_engine
+from job_engine import JobEngine, CANCELLED, DONE, RUNNING
+from event_channel import channels
+
+
+def _wait_state(engine, task_id, states, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = engine.status(task_id)
+        if status and status['state'] in states:
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f'任务状态未变为 {states}：{engine.status(task_id)}')
+
+
+def _events(task_id):
+    return [json.loads(data) for _, data in channels.get(task_id)._events]
+
+
+def _wait_until_closed(task_id, timeout=5):
+    deadline = time.time() + timeout
+    while not channels.get(task_id).closed:
+        assert time.time() < deadline, '事件流未结束'
+        time.sleep(0.01)
+
+
+def _engine(tmp_path, runner):
+    return JobEngine(runner, max_workers=2, queue_limit=2, db_path=str(tmp_path / 'jobs.db'))
+
+
+def test_job_completes(tmp_path):
+    def runner(task_id, params, cancelled):
+        yield json.dumps({'step': 1, 'progress': 10}) + '\n'
+        yield json.dumps({'step': 7, 'progress': 100, 'redirect': '/result'}) + '\n'
+
+    engine = _engine(tmp_path, runner)
+    task_id = str(uuid.uuid4())
+    engine.submit(task_id, {})
+    assert _wait_state(engine, task_id, (DONE,))['error'] is None
+    assert _events(task_id)[-1]['redirect'] == '/result'
+
+
+def test_cancel_interrupts_blocking_runner(tmp_path):
+    """等待首个 token 等阻塞期间没有进度行，取消仍然立即生效，之后的输出不再发布"""
+    started = threading.Event()
+
+    def runner(task_id, params, cancelled):
+        yield json.dumps({'step': 1, 'progress': 10}) + '\n'
+        started.set()
+        while not cancelled():
+            time.sleep(0.01)
+        yield json.dumps({'step': 4, 'progress': 50}) + '\n'
+
+    engine = _engine(tmp_path, runner)
+    task_id = str(uuid.uuid4())
+    engine.submit(task_id, {})
+    assert started.wait(5)
+    assert engine.cancel(task_id)
+    _wait_state(engine, task_id, (CANCELLED,), timeout=2)
+    _wait_until_closed(task_id)
+    events = _events(task_id)
+    assert events[-1] == {'step': -1, 'error': '设计任务已取消', 'progress': 0}
+    assert all(event.get('step') != 4 for event in events)
+
+
+def test_cancel_from_other_worker_reaches_blocked_runner(tmp_path, monkeypatch):
+    """其他 worker 只能写数据库，由监视线程在心跳时发现取消请求；阻塞期间心跳照常刷新"""
+    monkeypatch.setattr(job_engine, 'JOB_HEARTBEAT_SECONDS', 0.05)
+    started = threading.Event()
+
+    def runner(task_id, params, cancelled):
+        started.set()
+        while not cancelled():
+            time.sleep(0.01)
+        return
+        yield
+
+    engine = _engine(tmp_path, runner)
+    other = _engine(tmp_path, runner)
+    task_id = str(uuid.uuid4())
+    engine.submit(task_id, {})
+    assert started.wait(5)
+    status = _wait_state(engine, task_id, (RUNNING,))
+    time.sleep(0.2)
+    assert engine.status(task_id)['updated_at'] > status['updated_at']
+    assert other.cancel(task_id)
+    _wait_until_closed(task_id)
+    assert engine.status(task_id)['state'] == CANCELLED
+    assert _events(task_id)[-1]['error'] == '设计任务已取消'
+
@@ -0,0 +1,59 @@
+import json
+from stream_json import IncrementalDesignParser
+
+DESIGN = {
+    'structure_name': 'ITO/SnO2/MAPbI3 {"quoted"} \\ Au',
+    'layers': [
+        {'name': 'ITO', 'thickness': 150, 'notes': ['a', {'b': '}]'}]},
+        {'name': 'MAPbI3', 'thickness': 500, 'bandgap': 1.55},
+    ],
+    'performance': {'responsivity': 0.45, 'eqe': 85},
+    'layer_count': 2,
+}
+
+
+def _feed(text, size):
+    parser = IncrementalDesignParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+def test_events_independent_of_chunk_boundaries():
+    text = '```json\n' + json.dumps(DESIGN, ensure_ascii=False, indent=2) + '\n```'
+    expected = [('field', 'structure_name', DESIGN['structure_name']),
+                ('layer', 0, DESIGN['layers'][0]),
+                ('layer', 1, DESIGN['layers'][1]),
+                ('field', 'performance', DESIGN['performance']),
+                ('field', 'layer_count', 2)]
+    for size in (1, 2, 3, 7, len(text)):
+        parser, events = _feed(text, size)
+        assert events == expected, size
+        assert parser.done and parser.layer_count == 2
+
+
+def test_layer_emitted_before_stream_ends():
+    text = json.dumps(DESIGN)
+    cut = text.index('{"name": "MAPbI3"')
+    parser = IncrementalDesignParser()
+    events = parser.feed(text[:cut])
+    assert ('layer', 0, DESIGN['layers'][0]) in events
+    assert not parser.done
+
+
+def test_malformed_layers_keep_their_index():
+    text = ('{"layers": [{"name": "ITO", "thickness": 150nm,}, {"name": "?", "thickness": @}, '
+            '{"name": "Au", "thickness": 80}], "eqe": 85%, "ok": true}')
+    _, events = _feed(text, 4)
+    # 可修复的层与整体解析结果一致，无法修复的层跳过但仍占用序号；格式错误的顶层字段留给整体解析
+    assert events == [('layer', 0, {'name': 'ITO', 'thickness': 150}),
+                      ('layer', 2, {'name': 'Au', 'thickness': 80}),
+                      ('field', 'ok', True)]
+
+
+def test_text_after_root_is_ignored():
+    parser = IncrementalDesignParser()
+    assert parser.feed('思考中…') == []
+    assert parser.feed('{"a": 1}') == [('field', 'a', 1)]
+    assert parser.feed('{"b": 2}') == []
@@ -0,0 +1,31 @@
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from embedding_backend import LocalHashEmbeddings
+from vector_store import MmapVectorStore, export_langchain_store, store_exists
+
+TEXTS = ['钙钛矿光电探测器', '硅基 PIN 结构', '石墨烯透明电极', '量子效率优化']
+
+
+def test_export_langchain_store(tmp_path):
+    """旧的 LangChain 目录（index.faiss / index.pkl）转换为内存映射格式，检索结果与 FAISS 一致"""
+    embeddings = LocalHashEmbeddings(dim=32)
+    index_dir = str(tmp_path / 'vector_db')
+    FAISS.from_texts(TEXTS, embeddings, metadatas=[{'page': i} for i in range(len(TEXTS))]).save_local(index_dir)
+    (tmp_path / 'vector_db' / 'norms.f32').write_bytes(b'\0' * 16)  # 旧版本残留
+
+    db = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    export_langchain_store(db, index_dir, embeddings.model)
+
+    assert store_exists(index_dir)
+    assert not (tmp_path / 'vector_db' / 'norms.f32').exists()
+    store = MmapVectorStore(index_dir)
+    assert len(store) == len(TEXTS) and store.model == embeddings.model
+
+    query = np.asarray([embeddings.embed_query('钙钛矿探测器')], dtype=np.float32)
+    expected_scores, expected_rows = db.index.search(query, 2)
+    scores, rows = store.search(query, 2)
+    assert rows.tolist() == expected_rows.tolist()
+    assert np.allclose(scores, expected_scores, rtol=1e-5)
+    documents = store.get_documents(rows[0])
+    assert documents[int(rows[0][0])].page_content == TEXTS[int(expected_rows[0][0])]
+    assert documents[int(rows[0][0])].metadata == {'page': int(expected_rows[0][0])}
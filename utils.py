@@ -1,40 +1,121 @@
 import json
 import re
 
+# 全角标点到半角的映射（仅在字符串之外替换，字符串内容保持原样）
+_FULLWIDTH_PUNCTUATION = {
+    '，': ',', '：': ':', '｛': '{', '｝': '}', '［': '[', '］': ']',
+}
+
+# JSON 词法单元：字符串、注释、数字（可带单位）、字面量、标点，其余字符单独成为 other
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+  | (?P<cn_string>“[^”]*”)
+  | (?P<line_comment>//[^\n]*)
+  | (?P<block_comment>/\*.*?\*/)
+  | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?P<unit>[ \t]*[A-Za-zμµΩ%°][A-Za-zμµΩ%°/·^\-\d]*)?
+  | (?P<literal>\b(?:true|false|null|True|False|None)\b)
+  | (?P<punct>[{}\[\],:，：｛｝［］])
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+
+
+_DECODER = json.JSONDecoder(strict=False)
+# 对象起点：半角或全角左花括号
+_OBJECT_START = re.compile('[{｛]')
+# 紧跟在 { 之后的键（半角或全角引号），用于区分被截断的 JSON 对象与正文中落单的花括号
+_KEY_START = re.compile(r'\s*["“]')
+
+
+def _find_object(text, pos):
+    match = _OBJECT_START.search(text, pos)
+    return match.start() if match else -1
+
+
+def _repair_object(text, pos):
+    """
+    从 pos 处的 { 开始扫描到与之配对的 }（正确处理字符串和转义），并在扫描过程中修复常见缺陷：
+    - 尾随逗号（{"a": 1,} / [1, 2,]）
+    - 数值字段带单位（100nm、1.5 eV、85%）
+    - 字符串之外的全角标点（，：｛｝［］以及“”引号）
+    - // 与 /* */ 注释
+    - Python 风格的 True/False/None
+
+    Returns:
+        tuple: (修复后的文本, 对象结束位置)；文本结束时对象仍未闭合（输出被截断）返回 (None, None)
+    """
+    out = []
+    depth = 0
+    pending_comma = False
+    for match in _TOKEN_PATTERN.finditer(text, pos):
+        kind = match.lastgroup
+        if kind == 'unit':
+            kind = 'number'
+        if kind in ('space', 'line_comment', 'block_comment'):
+            continue
+
+        value = match.group(kind)
+        if kind == 'cn_string':
+            value = json.dumps(value[1:-1], ensure_ascii=False)
+        elif kind == 'literal':
+            value = _LITERALS.get(value, value)
+        elif kind == 'punct':
+            value = _FULLWIDTH_PUNCTUATION.get(value, value)
+
+        # 逗号延迟输出：紧跟 } 或 ] 时丢弃（尾随逗号）
+        if value == ',':
+            pending_comma = True
+            continue
+        if pending_comma:
+            if value not in ('}', ']'):
+                out.append(',')
+            pending_comma = False
+
+        out.append(value)
+        if value in ('{', '['):
+            depth += 1
+        elif value in ('}', ']'):
+            depth -= 1
+            if depth == 0:
+                return ''.join(out), match.end()
+    return None, None
+
+
 def extract_json_from_text(text):
     """
     从文本中提取并解析JSON数据，支持处理Markdown代码块
+
+    从每个 { （包括全角 ｛）开始直接用 C 实现的解码器读取一个完整对象，不做任何切片或复制；
+    只有解码失败的对象才交给 _repair_object 单独扫描修复，然后从对象末尾继续查找。
+    文本中存在多个对象时返回跨度最大的一个（设计方案通常是最大的对象）
     """
     if not text:
         return None
 
-    # 尝试直接解析
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-
-    # 1. 尝试去除 Markdown 代码块标记 (```json ... ```)
-    # 匹配 ```json 或 ``` 开头，以及 ``` 结尾的内容
-    markdown_pattern = r"```(?:json)?\s*(.*?)\s*```"
-    match = re.search(markdown_pattern, text, re.DOTALL)
-    
-    if match:
-        json_str = match.group(1)
+    best, best_span = None, 0
+    pos = _find_object(text, 0)
+    while pos != -1:
         try:
-            return json.loads(json_str)
+            obj, end = _DECODER.raw_decode(text, pos)
         except json.JSONDecodeError:
-            pass
-    
-    # 2. 如果上面的失败，尝试寻找最外层的 {}
-    start_idx = text.find('{')
-    end_idx = text.rfind('}')
-    
-    if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-        json_str = text[start_idx:end_idx+1]
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-            
-    return None
+            repaired, end = _repair_object(text, pos)
+            if repaired is None and _KEY_START.match(text, pos + 1):
+                # 以键开头却未闭合：输出被截断，其后的 { 都是它内部的子对象，不能当作设计方案
+                break
+            obj = None
+            if repaired is not None:
+                try:
+                    obj = json.loads(repaired, strict=False)
+                except json.JSONDecodeError:
+                    pass
+            if obj is None:
+                # 正文中落单的 { 或不是可修复的 JSON（例如 {x}），从下一个 { 继续
+                pos = _find_object(text, pos + 1)
+                continue
+        if end - pos > best_span:
+            best, best_span = obj, end - pos
+        pos = _find_object(text, end)
+
+    return best
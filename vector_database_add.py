@@ -1,114 +1,92 @@
 # author:LiamWu
 # beginDate:2025/12/01
-# 功能：向现有的向量数据库追加新的PDF文档
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import DashScopeEmbeddings
+# 功能：增量同步向量数据库
+# 按入库清单（vector_db/manifest.sqlite）对比文件内容哈希：只嵌入新增或变化的区块，
+# 续传上次失败的批次，删除已移除或被替换的 PDF 的向量；可以随时重复运行
 import os
+import sys
+from langchain_community.vectorstores import FAISS
+from embedding_backend import create_embeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings, save_index_metadata
+from vector_store import export_langchain_store, store_exists
+from vector_index import build_for_store
+from lexical_index import build_lexical_index, LEXICAL_META_FILE
+from ingest_pipeline import sync, list_pdfs
+
+INDEX_DIR = "vector_db"
+
+# 知识库的文件夹（不存在的会被忽略），可根据需要修改
+DATA_FOLDERS = ['./data', './data_new']
 
+# 另外手动指定单个或多个PDF文件
+PDF_FILES = [
+    # 在这里添加要追加的PDF文件路径
+    # 例如: './data/new_paper1.pdf',
+    #      './data/new_paper2.pdf',
+]
 
-# 检查向量数据库是否存在
-if not os.path.exists("vector_db"):
-    print("错误：向量数据库不存在！")
-    print("请先运行 vector_database_save.py 创建初始数据库")
-    exit(1)
 
-# 配置 Embedding 模型
-embeddings = DashScopeEmbeddings(
-    model = "text-embedding-v4",
-    dashscope_api_key =  "sk-69122c7a6960491685c6edc87c028dfa",
-)
+def main():
+    # 检查向量数据库是否存在
+    if not os.path.exists(INDEX_DIR):
+        print("错误：向量数据库不存在！")
+        print("请先运行 vector_database_save.py 创建初始数据库")
+        return 1
 
-# 加载现有的向量数据库
-print("正在加载现有向量数据库...")
-db = FAISS.load_local("vector_db", embeddings, allow_dangerous_deserialization=True)
-print(f"✓ 已加载现有数据库")
+    # 配置 Embedding 模型
+    # 嵌入后端由 EMBEDDING_BACKEND 选择（dashscope / local）
+    # 先查磁盘向量缓存（instance/embedding_cache/），只有未命中的区块才调用嵌入接口
+    backend = create_embeddings()
+    embeddings = CachedEmbeddings(backend, backend.model, EmbeddingCache())
 
-# 加载新的PDF文档（可以指定特定文件夹或文件）
-# 方式1：从指定文件夹加载所有PDF
-new_data_folder = './data_new'  # 新数据文件夹，可根据需要修改
+    # 旧的 LangChain 格式先转换为内存映射格式，之后直接追加
+    if not store_exists(INDEX_DIR):
+        print("正在将现有向量数据库转换为内存映射格式...")
+        db = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
+        export_langchain_store(db, INDEX_DIR, backend.model)
+        del db
+        print("✓ 转换完成")
 
-if os.path.exists(new_data_folder):
-    print(f"从 {new_data_folder} 文件夹加载新文档...")
-    loader = DirectoryLoader(
-        new_data_folder,
-        glob = "**/*.pdf",
-        loader_cls=PyPDFLoader,
-        show_progress=True
-    )
-    docs = loader.load()
-    print(f"已加载 {len(docs)} 个新文档区块")
-else:
-    # 方式2：手动指定单个或多个PDF文件
-    print("data_new 文件夹不存在，使用手动指定文件模式")
-    pdf_files = [
-        # 在这里添加要追加的PDF文件路径
-        # 例如: './data/new_paper1.pdf',
-        #      './data/new_paper2.pdf',
-    ]
-    
-    if not pdf_files:
-        print("错误：未指定要添加的PDF文件！")
-        print("请在代码中指定 pdf_files 列表，或创建 data_new 文件夹并放入PDF文件")
-        exit(1)
-    
-    docs = []
-    for pdf_file in pdf_files:
+    paths = []
+    for folder in DATA_FOLDERS:
+        if os.path.exists(folder):
+            print(f"扫描 {folder} 文件夹...")
+            paths.extend(list_pdfs(folder))
+    for pdf_file in PDF_FILES:
         if os.path.exists(pdf_file):
-            print(f"加载文件: {pdf_file}")
-            loader = PyPDFLoader(pdf_file)
-            docs.extend(loader.load())
+            paths.append(pdf_file)
         else:
             print(f"警告：文件不存在，跳过: {pdf_file}")
-    
-    print(f"已加载 {len(docs)} 个新文档区块")
 
-if len(docs) == 0:
-    print("没有新文档需要添加，退出")
-    exit(0)
+    if not paths:
+        print("错误：未找到任何PDF文件！")
+        print("请检查 DATA_FOLDERS 文件夹或在代码中指定 PDF_FILES 列表")
+        return 1
 
-# 文本切块
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size = 1000,
-    chunk_overlap = 200,
-    separators=['\n\n','\n','.',' ',""]
-)
-chunks = text_splitter.split_documents(docs)
-print(f"新文档已被划分成 {len(chunks)} 个可嵌入区块")
+    # 清单中存在但已不在上述范围内的文件视为已删除，其向量一并删除
+    stats = sync(paths, INDEX_DIR, embeddings, backend.model, prune=True)
 
-# 分批追加到现有数据库
-batch_size = 25  # 每批处理 25 个文档
-print(f"开始分批追加到向量数据库，每批 {batch_size} 个区块...")
+    if stats['embedded'] or stats['deleted']:
+        # 条数变化后重建 ANN 索引和 BM25 索引，并更新索引版本号（使已缓存的检索结果失效）
+        build_for_store(INDEX_DIR)
+        build_lexical_index(INDEX_DIR)
+        save_index_metadata(INDEX_DIR, embeddings, backend.model)
+    elif not os.path.exists(os.path.join(INDEX_DIR, LEXICAL_META_FILE)):
+        # 旧版本建的库没有 BM25 索引，内容没有变化时也补建
+        build_lexical_index(INDEX_DIR)
 
-success_count = 0
-fail_count = 0
+    print("=" * 60)
+    print(f"✓ 向量数据库已同步到 {INDEX_DIR}/（耗时 {stats['seconds']:.1f}s）")
+    print(f"  新增嵌入: {stats['embedded']} 个区块（{stats['files']} 个文件 / {stats['pages']} 页）")
+    print(f"  其中缓存命中: {stats['cached']} 个区块（未调用嵌入接口）")
+    print(f"  近似重复合并: {stats['duplicates']} 个区块（共用已有向量，记录出处）")
+    print(f"  已有跳过: {stats['skipped']} 个区块")
+    print(f"  删除向量: {stats['deleted']} 个区块")
+    if stats['failed_chunks'] or stats['failed_files']:
+        print(f"  本次失败: {stats['failed_chunks']} 个区块，{stats['failed_files']} 个文件（再次运行即可续传）")
+    print("=" * 60)
+    return 0
 
-for i in range(0, len(chunks), batch_size):
-    batch = chunks[i:i+batch_size]
-    batch_num = i//batch_size + 1
-    print(f"处理第 {batch_num} 批 ({i+1}-{min(i+batch_size, len(chunks))}/{len(chunks)})...")
-    
-    try:
-        # 为当前批次创建临时向量数据库
-        batch_db = FAISS.from_documents(batch, embeddings)
-        # 合并到主数据库
-        db.merge_from(batch_db)
-        print(f"  ✓ 第 {batch_num} 批追加成功")
-        success_count += len(batch)
-    except Exception as e:
-        print(f"  ✗ 第 {batch_num} 批追加失败: {e}")
-        print(f"  跳过此批次，继续处理...")
-        fail_count += len(batch)
-        continue
 
-# 保存更新后的数据库
-print("\n正在保存更新后的向量数据库...")
-db.save_local("vector_db")
-print("=" * 60)
-print(f"✓ 向量数据库已更新并保存到 vector_db/")
-print(f"  成功追加: {success_count} 个区块")
-if fail_count > 0:
-    print(f"  失败跳过: {fail_count} 个区块")
-print("=" * 60)
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,65 +1,70 @@
 # author:LiamWu
 # beginDate:2025/11/28
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import DashScopeEmbeddings
+import os
+import sys
+import shutil
+from embedding_backend import create_embeddings
+from embedding_cache import EmbeddingCache, CachedEmbeddings, save_index_metadata
+from vector_index import build_for_store
+from vector_store import store_exists, read_meta, read_tombstones
+from lexical_index import build_lexical_index
+from ingest_pipeline import sync, list_pdfs
 
 
 # 把论文pdf版本放在data文件夹下面,运行此文件,此文件会自动加载pdf文本,并创建向量数据库
-# 向量数据库会保存在
+# 向量数据库会保存在 vector_db/（先写入 vector_db.building/，完成后整体替换旧库）
 
-# 加载所有在data文件夹下面的论文
-loader = DirectoryLoader(
-    './data',
-    glob = "**/*.pdf",
-    loader_cls=PyPDFLoader,
-    show_progress=True
-)
-# 将所有pdf文本加载为langchain对象
-docs = loader.load()
-print(f"已被划分成{len(docs)}个区块")
+INDEX_DIR = "vector_db"
+BUILD_DIR = "vector_db.building"
 
-# 文本切块
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size = 1000,
-    chunk_overlap = 200,
-    separators=['\n\n','\n','.',' ',""]
-)
-chunks = text_splitter.split_documents(docs)
-print(f"已被划分成{len(chunks)}个可嵌入区块")
 
-embeddings = DashScopeEmbeddings(
-    model = "text-embedding-v4",
-    dashscope_api_key =  "sk-69122c7a6960491685c6edc87c028dfa",
-)
+def main():
+    # 嵌入后端由 EMBEDDING_BACKEND 选择（dashscope / local）
+    # 先查磁盘向量缓存（instance/embedding_cache/），只有未命中的区块才调用嵌入接口
+    backend = create_embeddings()
+    embeddings = CachedEmbeddings(backend, backend.model, EmbeddingCache())
 
-# 分批处理以避免 API 限制和兼容性问题
-batch_size = 25  # 每批处理 25 个文档
-print(f"开始分批生成向量数据库，每批 {batch_size} 个区块...")
+    # 加载所有在data文件夹下面的论文
+    paths = list_pdfs('./data')
+    print(f"共找到 {len(paths)} 个 PDF 文件，开始解析、嵌入并写入向量数据库...")
 
-db = None
-for i in range(0, len(chunks), batch_size):
-    batch = chunks[i:i+batch_size]
-    print(f"处理第 {i//batch_size + 1} 批 ({i+1}-{min(i+batch_size, len(chunks))}/{len(chunks)})...")
-    
-    try:
-        if db is None:
-            # 第一批：创建数据库
-            db = FAISS.from_documents(batch, embeddings)
-        else:
-            # 后续批次：添加到现有数据库
-            batch_db = FAISS.from_documents(batch, embeddings)
-            db.merge_from(batch_db)
-        print(f"  ✓ 第 {i//batch_size + 1} 批处理成功")
-    except Exception as e:
-        print(f"  ✗ 第 {i//batch_size + 1} 批处理失败: {e}")
-        print(f"  跳过此批次，继续处理...")
-        continue
+    # 上次重建中断时 vector_db.building/ 及其入库清单仍在，再次运行会从断点继续
+    # 全量重建同时生成新的入库清单，之后可用 vector_database_add.py 增量同步
+    stats = sync(paths, BUILD_DIR, embeddings, backend.model, prune=True)
+    print(f"已处理 {stats['files']} 个文件 / {stats['pages']} 页 / {stats['chunks']} 个区块，"
+          f"耗时 {stats['seconds']:.1f}s（{stats['cached']} 个区块命中向量缓存，"
+          f"{stats['duplicates']} 个近似重复区块已合并）")
+    if stats['failed_files'] or stats['failed_chunks']:
+        print(f"  失败：{stats['failed_files']} 个文件，{stats['failed_chunks']} 个区块")
 
-if db is not None:
-    db.save_local("vector_db")
-    print("向量数据库已保存到 vector_db/")
-else:
-    print("错误：未能创建向量数据库")
\ No newline at end of file
+    # 以构建目录中实际的行数判断是否成功：中断后重跑时区块已全部入库，本次 embedded 可能为 0
+    rows = 0
+    if store_exists(BUILD_DIR):
+        count = read_meta(BUILD_DIR)['count']
+        rows = count - int(read_tombstones(BUILD_DIR, count).sum())
+    if not rows:
+        print("错误：未能创建向量数据库")
+        return 1
+
+    # 按 VECTOR_INDEX_TYPE 构建 ANN 索引（默认 flat 精确检索）
+    build_for_store(BUILD_DIR)
+    # 为同一批片段构建 BM25 索引（词法检索 / 混合检索，无需调用嵌入接口）
+    build_lexical_index(BUILD_DIR)
+    # 预计算固定查询向量并更新索引版本号（使已缓存的检索结果失效）
+    save_index_metadata(BUILD_DIR, embeddings, backend.model)
+
+    # 替换旧库：运行中的服务仍持有旧文件的映射，重新加载后使用新库
+    old_dir = INDEX_DIR + ".old"
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    if os.path.exists(INDEX_DIR):
+        os.replace(INDEX_DIR, old_dir)
+    os.replace(BUILD_DIR, INDEX_DIR)
+    if os.path.exists(old_dir):
+        shutil.rmtree(old_dir)
+    print(f"向量数据库已保存到 {INDEX_DIR}/（{rows} 个区块）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,16 @@
 # file: simple_rag.py
 import os
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import DashScopeEmbeddings
 from openai import OpenAI
-os.environ["DASHSCOPE_API_KEY"] = "sk-69122c7a6960491685c6edc87c028dfa"
-API_KEY_Qwen3_MAX = "sk-69122c7a6960491685c6edc87c028dfa"
+from dotenv import load_dotenv
+import rag_service
+
+load_dotenv()
+API_KEY_Qwen3_MAX = os.getenv("DASHSCOPE_API_KEY")
 client = OpenAI(api_key=API_KEY_Qwen3_MAX,base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-# 加载向量库
-db = FAISS.load_local("vector_db",
-                      DashScopeEmbeddings(model="text-embedding-v4"),
-                      allow_dangerous_deserialization=True)
-retriever = db.as_retriever(search_kwargs={"k": 5})
+# 向量库由 rag_service 加载（内存映射格式或旧的 LangChain 格式），导入时自动初始化
+# 嵌入后端由 EMBEDDING_BACKEND 选择（dashscope / local），需与建库时一致
 def answer(query):
-    docs = retriever.invoke(query)
+    docs = rag_service.search_references([query], k=5, limit=5)
     context = "\n\n".join([d.page_content for d in docs])
 
 # 大模型
@@ -0,0 +1,173 @@
+# 功能：近似最近邻（ANN）索引
+# 默认的精确检索（Flat）耗时随片段数线性增长，且每个片段都要保存完整的 float32 向量；
+# 文献库增长到数千篇后可以在建库时为 vector_store 的向量矩阵额外构建 ANN 索引：
+#   flat   精确检索（不生成 ANN 文件）
+#   ivf    IVF-Flat：先聚类再只搜索最近的 nprobe 个簇
+#   hnsw   HNSW 图索引，检索时由 efSearch 控制精度
+#   ivfpq  IVF + 乘积量化，向量压缩为 m 个子码，内存最小
+#   opq    IVF-PQ 前加 OPQ 旋转，压缩后的召回率更高
+# ANN 索引保存为 vector_db/ann.faiss，与向量矩阵条数不一致时自动退回精确检索
+#
+# 用法：python vector_index.py [--type ivf] [--nlist 256] [--m 32] [--hnsw-m 32] [vector_db]
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import faiss
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANN_INDEX_FILE = 'ann.faiss'
+ANN_META_FILE = 'ann_meta.json'
+
+# 建库参数
+VECTOR_INDEX_TYPE = os.getenv('VECTOR_INDEX_TYPE', 'flat')   # flat / ivf / hnsw / ivfpq / opq
+VECTOR_INDEX_NLIST = int(os.getenv('VECTOR_INDEX_NLIST', 0))  # 0 表示按 4*sqrt(n) 自动选择
+VECTOR_INDEX_PQ_M = int(os.getenv('VECTOR_INDEX_PQ_M', 32))   # PQ 子空间数，需整除向量维度
+VECTOR_INDEX_PQ_BITS = int(os.getenv('VECTOR_INDEX_PQ_BITS', 8))
+VECTOR_INDEX_HNSW_M = int(os.getenv('VECTOR_INDEX_HNSW_M', 32))
+VECTOR_INDEX_TRAIN_SIZE = int(os.getenv('VECTOR_INDEX_TRAIN_SIZE', 100000))
+
+# 检索参数
+RAG_ANN_ENABLED = os.getenv('RAG_ANN_ENABLED', 'true').lower() == 'true'
+RAG_ANN_NPROBE = int(os.getenv('RAG_ANN_NPROBE', 16))
+RAG_ANN_EF_SEARCH = int(os.getenv('RAG_ANN_EF_SEARCH', 64))
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq', 'opq')
+
+
+def default_nlist(count):
+    """IVF 簇数的经验值 4*sqrt(n)，保证每个簇至少有约 39 个训练点"""
+    return max(1, min(int(4 * np.sqrt(count)), count // 39 or 1))
+
+
+def factory_string(index_type, dim, count, nlist=0, pq_m=VECTOR_INDEX_PQ_M,
+                   pq_bits=VECTOR_INDEX_PQ_BITS, hnsw_m=VECTOR_INDEX_HNSW_M):
+    """生成 faiss.index_factory 的描述字符串"""
+    nlist = nlist or default_nlist(count)
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'ivf':
+        return f'IVF{nlist},Flat'
+    if index_type == 'hnsw':
+        return f'HNSW{hnsw_m}'
+    if dim % pq_m:
+        raise ValueError(f'PQ 子空间数 {pq_m} 必须整除向量维度 {dim}')
+    if index_type == 'ivfpq':
+        return f'IVF{nlist},PQ{pq_m}x{pq_bits}'
+    if index_type == 'opq':
+        return f'OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_bits}'
+    raise ValueError(f'未知的索引类型：{index_type}，可选 {", ".join(INDEX_TYPES)}')
+
+
+def build_index(vectors, description, metric='l2', train_size=VECTOR_INDEX_TRAIN_SIZE, batch_size=65536):
+    """
+    训练并构建 faiss 索引
+
+    Args:
+        vectors: (n, dim) 向量矩阵，可以是 np.memmap，按批读取
+        description: factory_string 生成的描述字符串
+        metric: 'l2' 或 'ip'
+        train_size: 训练样本数上限，超过时随机抽样
+
+    Returns:
+        faiss.Index
+    """
+    count, dim = vectors.shape
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == 'ip' else faiss.METRIC_L2
+    index = faiss.index_factory(dim, description, faiss_metric)
+    if not index.is_trained:
+        if count > train_size:
+            sample = np.sort(np.random.default_rng(0).choice(count, train_size, replace=False))
+            train = np.ascontiguousarray(vectors[sample], dtype=np.float32)
+        else:
+            train = np.ascontiguousarray(vectors, dtype=np.float32)
+        index.train(train)
+    for start in range(0, count, batch_size):
+        index.add(np.ascontiguousarray(vectors[start:start + batch_size], dtype=np.float32))
+    return index
+
+
+def set_search_params(index, nprobe=RAG_ANN_NPROBE, ef_search=RAG_ANN_EF_SEARCH):
+    """设置检索参数，索引类型不支持的参数会被忽略"""
+    params = faiss.ParameterSpace()
+    for name, value in (('nprobe', nprobe), ('efSearch', ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+
+def save_ann_index(index_dir, index, index_type, description, count):
+    faiss.write_index(index, os.path.join(index_dir, ANN_INDEX_FILE))
+    with open(os.path.join(index_dir, ANN_META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'type': index_type, 'description': description, 'count': count}, f, ensure_ascii=False, indent=2)
+
+
+def remove_ann_index(index_dir):
+    for name in (ANN_INDEX_FILE, ANN_META_FILE):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_ann_index(index_dir, count):
+    """
+    加载 ANN 索引（mmap 只读打开），不存在、已禁用或与向量条数不一致时返回 None
+    """
+    path = os.path.join(index_dir, ANN_INDEX_FILE)
+    meta_path = os.path.join(index_dir, ANN_META_FILE)
+    if not RAG_ANN_ENABLED or not os.path.exists(path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('count') != count:
+        print(f"警告：ANN 索引条数 {meta.get('count')} 与向量库 {count} 不一致，使用精确检索"
+              f"（运行 python vector_index.py 重建）")
+        return None
+    try:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)
+    set_search_params(index)
+    return index
+
+
+def build_for_store(index_dir, index_type=VECTOR_INDEX_TYPE, nlist=VECTOR_INDEX_NLIST, **kwargs):
+    """
+    为 vector_store 格式的向量库构建 ANN 索引；index_type 为 flat 时删除已有的 ANN 索引
+
+    Returns:
+        str: 使用的 faiss 描述字符串
+    """
+    from vector_store import MmapVectorStore
+
+    store = MmapVectorStore(index_dir)
+    if index_type == 'flat' or not len(store):
+        remove_ann_index(index_dir)
+        return 'Flat'
+    description = factory_string(index_type, store.dim, len(store), nlist=nlist, **kwargs)
+    index = build_index(store.vectors, description, metric=store.metric)
+    save_ann_index(index_dir, index, index_type, description, len(store))
+    return description
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为向量库构建 ANN 索引')
+    parser.add_argument('index_dir', nargs='?', default='vector_db')
+    parser.add_argument('--type', default=VECTOR_INDEX_TYPE, choices=INDEX_TYPES)
+    parser.add_argument('--nlist', type=int, default=VECTOR_INDEX_NLIST, help='IVF 簇数，0 为自动')
+    parser.add_argument('--m', type=int, default=VECTOR_INDEX_PQ_M, help='PQ 子空间数')
+    parser.add_argument('--bits', type=int, default=VECTOR_INDEX_PQ_BITS, help='PQ 每个子码的位数')
+    parser.add_argument('--hnsw-m', type=int, default=VECTOR_INDEX_HNSW_M, help='HNSW 每个节点的邻居数')
+    args = parser.parse_args()
+
+    description = build_for_store(args.index_dir, args.type, nlist=args.nlist,
+                                  pq_m=args.m, pq_bits=args.bits, hnsw_m=args.hnsw_m)
+    print(f'✓ 索引已构建：{description}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+# 功能：内存映射向量库
+# FAISS.load_local 会在每个 gunicorn worker 中反序列化完整的索引和 InMemoryDocstore，
+# 这里改为：
+#   vectors.f32     原始 float32 向量矩阵（行优先），检索时 mmap 打开，多个 worker 共享系统页缓存
+#   store_meta.json 维度、条数、嵌入模型、距离度量
+#   docstore.sqlite 文本片段和元数据，只按 top-k 命中的行号读取
+#   tombstones.i64  已删除的行号（int64），检索时过滤；重建向量库时真正清除
+#   ann.faiss       可选的 ANN 索引（见 vector_index.py），存在时代替精确检索
+# 旧的 LangChain 格式（index.faiss / index.pkl）通过 LegacyFaissStore 继续支持
+#
+# 用法：python vector_store.py [vector_db]   将已有的 LangChain 向量库转换为本格式
+import os
+import sys
+import json
+import sqlite3
+import threading
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from vector_index import load_ann_index
+
+VECTORS_FILE = 'vectors.f32'
+META_FILE = 'store_meta.json'
+DOCSTORE_FILE = 'docstore.sqlite'
+TOMBSTONES_FILE = 'tombstones.i64'
+
+
+def store_exists(index_dir):
+    return os.path.exists(os.path.join(index_dir, META_FILE))
+
+
+def read_meta(index_dir):
+    with open(os.path.join(index_dir, META_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(index_dir, meta):
+    """先写临时文件再替换，读取方不会看到写了一半的元数据"""
+    path = os.path.join(index_dir, META_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_tombstones(index_dir, count):
+    """读取已删除的行号，返回长度为 count 的布尔掩码"""
+    deleted = np.zeros(count, dtype=bool)
+    path = os.path.join(index_dir, TOMBSTONES_FILE)
+    if os.path.exists(path):
+        rows = np.fromfile(path, dtype=np.int64)
+        deleted[rows[(rows >= 0) & (rows < count)]] = True
+    return deleted
+
+
+class MmapVectorStore:
+    """
+    只读的内存映射向量库
+
+    search 用 faiss.knn 直接在 mmap 的向量矩阵上精确检索（存在 ANN 索引时改用 ANN），
+    get_documents 只读取命中的行
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        meta = read_meta(index_dir)
+        self.dim = meta['dim']
+        self.count = meta['count']
+        self.model = meta.get('model')
+        self.metric = meta.get('metric', 'l2')
+        self.normalize_L2 = meta.get('normalize_L2', False)
+        self._local = threading.local()
+        if self.count:
+            # 只映射元数据记录的行数，写入中途追加的数据对读取方不可见
+            self.vectors = np.memmap(os.path.join(index_dir, VECTORS_FILE), dtype=np.float32,
+                                     mode='r', shape=(self.count, self.dim))
+        else:
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+        self.deleted = read_tombstones(index_dir, self.count)
+        self.deleted_count = int(self.deleted.sum())
+        self.ann = load_ann_index(index_dir, self.count) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and getattr(self._local, 'pid', None) == os.getpid():
+            return conn
+        path = os.path.abspath(os.path.join(self.index_dir, DOCSTORE_FILE))
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def search(self, queries, k):
+        """
+        向量检索
+
+        Args:
+            queries: (m, dim) float32 查询矩阵
+            k: 每个查询返回的条数
+
+        Returns:
+            tuple: (距离或相似度 (m, k), 行号 (m, k))，与 faiss index.search 的返回值一致；
+                   L2 为平方距离（越小越近），ip 为内积（越大越近）
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.normalize_L2:
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if not self.count:
+            return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+
+        # 索引中仍包含已删除的行，多取 deleted_count 条再过滤
+        fetch = min(self.count, k + self.deleted_count)
+        if self.ann is not None:
+            scores, rows = self.ann.search(queries, fetch)
+        else:
+            # faiss.knn 对 mmap 矩阵分块做 BLAS 计算并维护堆，不生成 (m, n) 的完整距离矩阵；
+            # 与 IndexFlat 相同的内核，省去把整库复制进索引的内存
+            metric = faiss.METRIC_INNER_PRODUCT if self.metric == 'ip' else faiss.METRIC_L2
+            scores, rows = faiss.knn(queries, self.vectors, fetch, metric=metric)
+        return self._drop_deleted(scores, rows, k)
+
+    def _drop_deleted(self, scores, rows, k):
+        """过滤已删除的行，每个查询保留前 k 条，不足时行号为 -1"""
+        if not self.deleted_count:
+            return scores, rows
+        result_scores = np.full((len(scores), k), np.nan, dtype=np.float32)
+        result_rows = np.full((len(scores), k), -1, dtype=np.int64)
+        for i in range(len(scores)):
+            keep = (rows[i] != -1) & ~self.deleted[np.maximum(rows[i], 0)]
+            kept_rows, kept_scores = rows[i][keep][:k], scores[i][keep][:k]
+            result_rows[i, :len(kept_rows)] = kept_rows
+            result_scores[i, :len(kept_scores)] = kept_scores
+        return result_scores, result_rows
+
+    def get_documents(self, rows):
+        """按行号读取文本片段，返回 {行号: Document}"""
+        rows = [int(row) for row in rows]
+        if not rows:
+            return {}
+        placeholders = ','.join('?' * len(rows))
+        cursor = self._connect().execute(
+            f'SELECT id, doc_id, page_content, metadata FROM chunks WHERE id IN ({placeholders})', rows
+        )
+        return {
+            row_id: Document(page_content=content, metadata=json.loads(metadata), id=doc_id)
+            for row_id, doc_id, content, metadata in cursor
+        }
+
+
+class LegacyFaissStore:
+    """将 LangChain FAISS 向量库包装成与 MmapVectorStore 相同的接口"""
+
+    def __init__(self, db):
+        self.db = db
+        self.count = db.index.ntotal
+        self.normalize_L2 = db._normalize_L2
+
+    def __len__(self):
+        return self.count
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.normalize_L2:
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        return self.db.index.search(queries, k)
+
+    def get_documents(self, rows):
+        documents = {}
+        for row in rows:
+            doc = self.db.docstore.search(self.db.index_to_docstore_id[int(row)])
+            if isinstance(doc, Document):
+                documents[int(row)] = doc
+        return documents
+
+
+class VectorStoreWriter:
+    """
+    向量库写入器，新建或向已有的库追加
+
+    元数据在 close 时最后写入，中途失败时读取方仍看到旧的条数；
+    再次打开时会截掉超出元数据条数的残留数据
+
+    用法：
+        with VectorStoreWriter('vector_db', dim=1024, model='text-embedding-v4') as writer:
+            writer.add(vectors, documents)
+    """
+
+    def __init__(self, index_dir, dim=None, model=None, metric='l2', normalize_L2=False):
+        self.index_dir = index_dir
+        os.makedirs(index_dir, exist_ok=True)
+        if store_exists(index_dir):
+            self.meta = read_meta(index_dir)
+            if dim is not None and dim != self.meta['dim']:
+                raise ValueError(f"向量维度不一致：已有 {self.meta['dim']}，新增 {dim}")
+            if model is not None and self.meta.get('model') not in (None, model):
+                raise ValueError(f"嵌入模型不一致：已有 {self.meta['model']}，新增 {model}")
+        else:
+            if dim is None:
+                raise ValueError('新建向量库时必须指定维度 dim')
+            self.meta = {'dim': dim, 'count': 0, 'model': model, 'metric': metric, 'normalize_L2': normalize_L2}
+
+        self.conn = sqlite3.connect(os.path.join(index_dir, DOCSTORE_FILE))
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL UNIQUE,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+        """)
+        self._truncate(self.meta['count'])
+        self._vectors_file = open(os.path.join(index_dir, VECTORS_FILE), 'ab')
+        self._tombstones_file = open(os.path.join(index_dir, TOMBSTONES_FILE), 'ab')
+
+    def _truncate(self, count):
+        """丢弃上次写入中断后超出元数据条数的数据"""
+        path = os.path.join(self.index_dir, VECTORS_FILE)
+        row_bytes = self.meta['dim'] * 4
+        if os.path.exists(path) and os.path.getsize(path) > count * row_bytes:
+            with open(path, 'r+b') as f:
+                f.truncate(count * row_bytes)
+        self.conn.execute('DELETE FROM chunks WHERE id >= ?', (count,))
+        self.conn.commit()
+
+    @property
+    def count(self):
+        return self.meta['count']
+
+    def add(self, vectors, documents, ids=None):
+        """
+        追加一批向量及对应的文本片段
+
+        Args:
+            vectors: (n, dim) 向量
+            documents: n 个 LangChain Document
+            ids: 文档 ID 列表，默认使用 Document.id 或行号
+
+        Returns:
+            list: 新增数据的行号
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.meta['dim'])
+        if len(vectors) != len(documents):
+            raise ValueError('向量与文档数量不一致')
+        if self.meta.get('normalize_L2'):
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        start = self.meta['count']
+        rows = list(range(start, start + len(vectors)))
+        if ids is None:
+            ids = [doc.id or str(row) for doc, row in zip(documents, rows)]
+        self.conn.executemany(
+            'INSERT INTO chunks (id, doc_id, page_content, metadata) VALUES (?, ?, ?, ?)',
+            [(row, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+             for row, doc_id, doc in zip(rows, ids, documents)]
+        )
+        self._vectors_file.write(vectors.tobytes())
+        self.meta['count'] += len(vectors)
+        return rows
+
+    def delete(self, rows):
+        """删除若干行：记录墓碑并删除对应的文本片段，向量数据保留到下次重建"""
+        rows = [int(row) for row in rows if 0 <= int(row) < self.meta['count']]
+        if not rows:
+            return
+        self._tombstones_file.write(np.asarray(rows, dtype=np.int64).tobytes())
+        self.conn.executemany('DELETE FROM chunks WHERE id = ?', [(row,) for row in rows])
+        self.meta['deleted'] = self.meta.get('deleted', 0) + len(rows)
+
+    def add_duplicates(self, row, entries):
+        """
+        为第 row 行追加被合并的近似重复片段的出处（元数据 duplicates 列表，见 near_dup.py）
+
+        Args:
+            row: 保留的行号
+            entries: [{'source': ..., 'page': ...}]
+        """
+        record = self.conn.execute('SELECT metadata FROM chunks WHERE id = ?', (int(row),)).fetchone()
+        if record is None or not entries:
+            return
+        metadata = json.loads(record[0])
+        duplicates = metadata.setdefault('duplicates', [])
+        duplicates.extend(entry for entry in entries if entry not in duplicates)
+        self.conn.execute('UPDATE chunks SET metadata = ? WHERE id = ?',
+                          (json.dumps(metadata, ensure_ascii=False), int(row)))
+
+    def flush(self):
+        """
+        检查点：落盘并写入元数据，已写入的数据立即对读取方可见
+
+        流水线在记录入库清单之前调用，保证清单中的行号一定已经持久化
+        """
+        for f in (self._vectors_file, self._tombstones_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self.conn.commit()
+        _write_meta(self.index_dir, self.meta)
+
+    def close(self):
+        """落盘并写入元数据，之后读取方才能看到新增的数据"""
+        self.flush()
+        self._vectors_file.close()
+        self._tombstones_file.close()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_langchain_store(db, index_dir, model):
+    """
+    将 LangChain FAISS 向量库导出为内存映射格式（覆盖 index_dir 中已有的同名文件）
+
+    建库脚本在 save_local 之后调用，两种格式并存，rag_service 优先使用内存映射格式
+    """
+    # norms.f32 为旧版本写入的平方范数文件，现已不再使用，一并清除
+    for name in (VECTORS_FILE, META_FILE, DOCSTORE_FILE, TOMBSTONES_FILE, 'norms.f32'):
+        path = os.path.join(index_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    metric = 'ip' if db.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT else 'l2'
+    with VectorStoreWriter(index_dir, dim=db.index.d, model=model, metric=metric,
+                           normalize_L2=db._normalize_L2) as writer:
+        batch_size = 4096
+        for start in range(0, db.index.ntotal, batch_size):
+            end = min(start + batch_size, db.index.ntotal)
+            doc_ids = [db.index_to_docstore_id[i] for i in range(start, end)]
+            documents = [db.docstore.search(doc_id) for doc_id in doc_ids]
+            writer.add(db.index.reconstruct_n(start, end - start), documents, ids=doc_ids)
+
+
+if __name__ == '__main__':
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.embeddings import DashScopeEmbeddings
+
+    index_dir = sys.argv[1] if len(sys.argv) > 1 else 'vector_db'
+    db = FAISS.load_local(index_dir, DashScopeEmbeddings(model='text-embedding-v4'),
+                          allow_dangerous_deserialization=True)
+    export_langchain_store(db, index_dir, 'text-embedding-v4')
+    print(f'✓ 已导出 {db.index.ntotal} 条向量到 {index_dir}/{VECTORS_FILE}')
@@ -1,59 +1,105 @@
-import os
+import json
 from pyecharts import options as opts
 from pyecharts.charts import Bar, Line
 from pyecharts.globals import ThemeType
-from pyecharts.commons.utils import JsCode
+from render_cache import render_cache, content_name
 
+# 图表模板版本：修改 structure_chart / performance_chart 的样式时递增，使已缓存的渲染结果失效
+CHART_TEMPLATE_VERSION = 1
 
-def generate_visualizations(design_data, task_id=None):
+# 影响性能曲线图渲染结果的字段
+PERFORMANCE_CHART_FIELDS = ('responsivity_data', 'quantum_efficiency', 'quantum_efficiency_type',
+                            'dark_current', 'wavelength_range')
+
+
+def _chart_inputs(design_data):
     """
-    根据设计数据生成可视化图像
-    
+    结果页的图表：图表类型 -> (影响渲染结果的规范化输入, 构建函数)
+
+    层结构只取名称、材料和厚度，layout_layers 写入的视觉属性不影响缓存键
+    """
+    charts = {}
+    layers = design_data.get('layers')
+    if layers:
+        inputs = [{field: layer.get(field) for field in ('name', 'material', 'thickness')} for layer in layers]
+        charts['structure'] = (inputs, lambda: _chart_spec(structure_chart(layers)))
+    performance = design_data.get('performance') or {}
+    # 与 result.html 的判断一致：没有响应度数据时不显示性能曲线（不使用示例数据）
+    if performance.get('responsivity_data'):
+        inputs = {field: performance.get(field) for field in PERFORMANCE_CHART_FIELDS}
+        charts['performance'] = (inputs, lambda: _chart_spec(performance_chart(performance)))
+    return charts
+
+def render_charts(design_data, cache=render_cache):
+    """
+    构建（或从渲染缓存中取出）结果页图表的 ECharts option，不写 static/ 文件
+
     Args:
         design_data: 包含layers和performance的设计数据字典
-        task_id: 任务ID，用于生成唯一的文件名
-        
+        cache: RenderCache，按内容哈希保存渲染结果
+
     Returns:
-        dict: 包含图像路径的字典
+        dict: {图表类型: (内容哈希, JSON 字节)}，缺少数据的图表不返回
     """
-    image_paths = {}
-    
-    # 确保输出目录存在
-    os.makedirs('static/images', exist_ok=True)
-    
-    # 文件名前缀
-    prefix = f"{task_id}_" if task_id else ""
-    
-    # 生成层叠结构图
-    if 'layers' in design_data and design_data['layers']:
-        structure_path = generate_structure_plot(design_data['layers'], prefix)
-        image_paths['structure'] = structure_path
-    
-    # 生成性能曲线图
-    if 'performance' in design_data and 'responsivity_data' in design_data['performance']:
-        performance_path = generate_performance_plot(design_data['performance'], prefix)
-        image_paths['performance'] = performance_path
-    
-    return image_paths
+    charts = {}
+    for kind, (inputs, build) in _chart_inputs(design_data).items():
+        name = content_name(kind, CHART_TEMPLATE_VERSION, inputs)
+        charts[kind] = (name, cache.get_or_render(name, build))
+    return charts
 
-def generate_structure_plot(layers, prefix=""):
+def chart_options(design_data, cache=render_cache):
     """
-    使用 pyecharts 生成水平层叠结构图（从底到顶）
+    结果页图表的 ECharts option
+
+    Returns:
+        dict: {'structure': {'option': ..., 'height': 像素}, 'performance': {...}}，缺少数据的图表不返回
+    """
+    return {kind: json.loads(data) for kind, (_, data) in render_charts(design_data, cache).items()}
+
+def _chart_spec(chart):
+    """pyecharts 图表 -> 可直接传给 echarts setOption 的 JSON 与容器高度"""
+    return {
+        'option': json.loads(chart.dump_options()),
+        'height': int(str(chart.height).rstrip('px')),
+    }
+
+def layout_layers(layers, canvas_height=400, gap=10, normal_height=40, absorber_height=20):
+    """
+    为结果页的 3D 层叠视图计算每一层的视觉高度和 Y 坐标（原地写入 visual_height / y_position）
+
+    吸收层较薄，其余层统一高度，层间留间距，整体在画布中垂直居中
+    """
+    total_visual_height = 0
+    for layer in layers:
+        name = layer.get('name', '')
+        is_absorber = '吸收' in name or 'Absorber' in name
+        layer['visual_height'] = absorber_height if is_absorber else normal_height
+        total_visual_height += layer['visual_height']
+
+    if layers:
+        total_visual_height += (len(layers) - 1) * gap
+
+    current_y = (canvas_height - total_visual_height) / 2
+    for layer in layers:
+        layer['y_position'] = current_y
+        current_y += layer['visual_height'] + gap
+    return layers
+
+
+def structure_chart(layers):
+    """
+    构建水平层叠结构图（从底到顶）的 pyecharts 图表对象
     
     Args:
         layers: 层结构列表
-        prefix: 文件名前缀
         
     Returns:
-        str: 图像相对路径
+        Bar: 图表对象
     """
-    from pyecharts.charts import Bar
-    
     # 提取数据（反转顺序，从底层到顶层）
     layers_reversed = list(reversed(layers))
     layer_labels = []
     thicknesses = []
-    colors_list = []
     
     # 定义专业配色方案
     color_palette = [
@@ -76,8 +122,8 @@ def generate_structure_plot(layers, prefix=""):
             label = f"{material}\n{thickness}nm"
         
         layer_labels.append(label)
-        thicknesses.append(thickness)
-        colors_list.append(color_palette[i % len(color_palette)])
+        # 每个数据项单独指定颜色（纯 JSON，浏览器端可以直接使用，不需要 JS 颜色函数）
+        thicknesses.append({'value': thickness, 'itemStyle': {'color': color_palette[i % len(color_palette)]}})
     
     # 创建水平条形图
     bar = (
@@ -100,12 +146,6 @@ def generate_structure_plot(layers, prefix=""):
                 color="#333"
             ),
             itemstyle_opts=opts.ItemStyleOpts(
-                color=JsCode("""
-                    function(params) {{
-                        var colorList = {colors};
-                        return colorList[params.dataIndex];
-                    }}
-                """.format(colors=colors_list)),
                 border_color="#fff",
                 border_width=2
             ),
@@ -150,21 +190,17 @@ def generate_structure_plot(layers, prefix=""):
         )
     )
     
-    output_path = f'static/images/{prefix}structure.html'
-    bar.render(output_path)
-    
-    return output_path
+    return bar
 
-def generate_performance_plot(performance, prefix=""):
+def performance_chart(performance):
     """
-    使用 pyecharts 生成性能曲线图（响应度 vs 波长）
+    构建性能曲线图（响应度 vs 波长）的 pyecharts 图表对象
     
     Args:
         performance: 性能数据字典
-        prefix: 文件名前缀
         
     Returns:
-        str: 图像相对路径
+        Line: 图表对象
     """
     # 提取响应度数据
     responsivity_data = performance.get('responsivity_data', [])
@@ -279,7 +315,4 @@ def generate_performance_plot(performance, prefix=""):
         )
     )
     
-    output_path = f'static/images/{prefix}performance.html'
-    line.render(output_path)
-    
-    return output_path
+    return line